@@ -0,0 +1,125 @@
+"""Compare the artifact codecs by compression ratio and CPU cost.
+
+Every codec and level compresses and decompresses the given files, or synthetic
+CSV and GeoJSON artifacts when none are given, and reports the bytes saved and
+the CPU time spent per MB of input:
+
+    python benchmarks/codecs.py --size-mb 64
+    python benchmarks/codecs.py data/*.csv --codecs gzip:1 gzip:6 zstd:3 zstd:9
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from dramax.services.codecs import get_codec
+
+MB = 1024 * 1024
+
+
+def synthetic_csv(path: Path, size: int) -> None:
+    rng = random.Random(0)
+    with path.open("w") as f:
+        f.write("id,timestamp,sensor,temperature,humidity,status\n")
+        i = 0
+        while f.tell() < size:
+            f.write(
+                f"{i},2024-01-01T00:{i % 60:02d}:{i % 3600 // 60:02d},"
+                f"sensor-{rng.randrange(50)},{rng.gauss(20, 5):.2f},"
+                f"{rng.uniform(0, 100):.1f},{rng.choice(['ok', 'ok', 'warn'])}\n",
+            )
+            i += 1
+
+
+def synthetic_geojson(path: Path, size: int) -> None:
+    rng = random.Random(0)
+    with path.open("w") as f:
+        f.write('{"type": "FeatureCollection", "features": [\n')
+        i = 0
+        while f.tell() < size:
+            feature = {
+                "type": "Feature",
+                "properties": {"id": i, "name": f"parcel-{i}"},
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [rng.uniform(-7, -2), rng.uniform(36, 38)],
+                },
+            }
+            f.write(("," if i else "") + json.dumps(feature) + "\n")
+            i += 1
+        f.write("]}\n")
+
+
+def measure(codec_spec: str, source: Path, workdir: Path) -> dict:
+    name, _, level = codec_spec.partition(":")
+    codec = get_codec(name, int(level) if level else None)
+    compressed, restored = workdir / "compressed", workdir / "restored"
+
+    started, cpu = time.perf_counter(), time.process_time()
+    codec.compress_file(str(source), str(compressed))
+    compress_wall = time.perf_counter() - started
+    compress_cpu = time.process_time() - cpu
+
+    started, cpu = time.perf_counter(), time.process_time()
+    codec.decompress_file(str(compressed), str(restored))
+    decompress_wall = time.perf_counter() - started
+    decompress_cpu = time.process_time() - cpu
+
+    size = source.stat().st_size
+    stored = compressed.stat().st_size
+    return {
+        "file": source.name,
+        "codec": codec_spec,
+        "ratio": size / stored,
+        "saved_mb": (size - stored) / MB,
+        "compress_mb_s": size / MB / compress_wall,
+        "decompress_mb_s": size / MB / decompress_wall,
+        "cpu_ms_per_mb": (compress_cpu + decompress_cpu) * 1000 / (size / MB),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", type=Path)
+    parser.add_argument("--size-mb", type=int, default=32)
+    parser.add_argument(
+        "--codecs",
+        nargs="+",
+        default=["gzip:1", "gzip:6", "zstd:1", "zstd:3", "zstd:9"],
+        help="NAME[:LEVEL]",
+    )
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        files = args.files
+        if not files:
+            files = [workdir / "table.csv", workdir / "parcels.geojson"]
+            synthetic_csv(files[0], args.size_mb * MB)
+            synthetic_geojson(files[1], args.size_mb * MB)
+
+        print(
+            f"{'file':<16} {'codec':<8} {'ratio':>6} {'saved':>9} "
+            f"{'comp':>10} {'decomp':>10} {'cpu/MB':>9}",
+        )
+        for source in files:
+            for spec in args.codecs:
+                try:
+                    r = measure(spec, source, workdir)
+                except ImportError as e:
+                    print(f"{source.name:<16} {spec:<8} skipped: {e}")
+                    continue
+                print(
+                    f"{r['file'][:16]:<16} {r['codec']:<8} {r['ratio']:>6.2f} "
+                    f"{r['saved_mb']:>7.1f}MB {r['compress_mb_s']:>6.0f}MB/s "
+                    f"{r['decompress_mb_s']:>6.0f}MB/s {r['cpu_ms_per_mb']:>7.1f}ms",
+                )
+
+
+if __name__ == "__main__":
+    main()
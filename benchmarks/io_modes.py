@@ -0,0 +1,174 @@
+"""Compare the throughput of API tasks in the threaded and gevent worker modes.
+
+A local HTTP server answers every request after `--delay` seconds, emulating a
+slow remote service. Each mode runs in its own interpreter (gevent must patch
+the standard library before anything else is imported) and executes
+`--requests` API tasks through `api_execute` with `--concurrency` workers:
+
+    python benchmarks/io_modes.py --requests 2000 --concurrency 1000 --delay 0.5
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+PAYLOAD = b"x" * 1024
+
+
+async def handle(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    delay: float,
+) -> None:
+    await reader.readuntil(b"\r\n\r\n")
+    await asyncio.sleep(delay)
+    writer.write(
+        b"HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\n"
+        b"Connection: close\r\nContent-Length: %d\r\n\r\n%s" % (len(PAYLOAD), PAYLOAD),
+    )
+    await writer.drain()
+    writer.close()
+
+
+async def serve(port: int, delay: float) -> None:
+    server = await asyncio.start_server(
+        lambda r, w: handle(r, w, delay),
+        "127.0.0.1",
+        port,
+        backlog=4096,
+    )
+    print("ready", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def client(mode: str, url: str, requests: int, concurrency: int) -> dict:
+    if mode == "gevent":
+        from gevent import monkey
+
+        monkey.patch_all()
+
+    import logging
+    import resource
+    from concurrent.futures import ThreadPoolExecutor
+
+    import structlog
+
+    from dramax.models.dramatiq.task import File, Task
+    from dramax.models.executor.api import api_execute
+
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING),
+    )
+
+    parameters = [
+        {"name": "method", "value": "GET"},
+        {"name": "headers", "value": "Accept: */*"},
+        {"name": "auth", "value": "user:password"},
+        {"name": "timeout", "value": "60"},
+    ]
+    tasks = [
+        Task(
+            id=f"task-{i}",
+            name=f"task-{i}",
+            url=url,
+            parameters=parameters,
+            outputs=[File(path="/response.bin")],
+        )
+        for i in range(requests)
+    ]
+
+    latencies = []
+
+    with TemporaryDirectory() as workdir:
+
+        def run(task: Task) -> None:
+            started = time.perf_counter()
+            api_execute(task, f"{workdir}/{task.id}")
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(run, tasks))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "throughput": requests / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--delay", type=float, default=0.5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--modes", nargs="+", default=["threads", "gevent"])
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--client", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(serve(args.port, args.delay))
+        return
+    url = f"http://127.0.0.1:{args.port}/"
+    if args.client:
+        result = client(args.client, url, args.requests, args.concurrency)
+        print(json.dumps(result))
+        return
+
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            __file__,
+            "--serve",
+            f"--port={args.port}",
+            f"--delay={args.delay}",
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        server.stdout.readline()
+        print(
+            f"{'mode':<8} {'elapsed':>9} {'req/s':>9} {'p50':>8} {'p99':>8} {'rss':>8}"
+        )
+        for mode in args.modes:
+            completed = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    f"--client={mode}",
+                    f"--requests={args.requests}",
+                    f"--concurrency={args.concurrency}",
+                    f"--port={args.port}",
+                ],
+                stdout=subprocess.PIPE,
+                text=True,
+                check=True,
+            )
+            r = json.loads(completed.stdout.splitlines()[-1])
+            print(
+                f"{r['mode']:<8} {r['elapsed']:>8.2f}s {r['throughput']:>9.1f} "
+                f"{r['p50']:>7.3f}s {r['p99']:>7.3f}s {r['max_rss_mb']:>6.0f}MB",
+            )
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
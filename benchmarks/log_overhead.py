@@ -0,0 +1,104 @@
+"""Measure the CPU cost of logging per task under each logging profile.
+
+Every profile replays the log events the worker emits for one task, with a
+realistic task spec, `--tasks` times, writing to /dev/null, and reports the
+time per task. "eager" replays the former hot path, which rendered the whole
+task spec at info level on the coloured console:
+
+    python benchmarks/log_overhead.py --tasks 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+# Only the logging settings matter here.
+for variable in (
+    "DOCKER_USERNAME",
+    "DOCKER_PASSWORD",
+    "MINIO_ACCESS_KEY",
+    "MINIO_SECRET_KEY",
+):
+    os.environ.setdefault(variable, "benchmark")
+
+import structlog  # noqa: E402
+
+from dramax.common.configure_logger import Lazy, configure_logger  # noqa: E402
+from dramax.common.settings import settings  # noqa: E402
+from dramax.models.dramatiq.task import Task  # noqa: E402
+
+PROFILES = {
+    "eager": {"log_format": "console"},
+    "console": {"log_format": "console"},
+    "json": {"log_format": "json"},
+    "json-async": {"log_format": "json", "log_async": True},
+    "json-sampled": {"log_format": "json", "log_sampling": {"dramax": 0.01}},
+    "warning": {"log_format": "json", "log_level": "WARNING"},
+}
+
+
+def sample_task() -> Task:
+    return Task(
+        id="task-1",
+        name="train",
+        image="registry.example.org/trainer:1.4",
+        parameters=[{"name": f"param-{i}", "value": "x" * 32} for i in range(20)],
+        environment={f"VAR_{i}": "y" * 32 for i in range(20)},
+        inputs=[{"name": f"in-{i}", "path": f"/data/in-{i}.csv"} for i in range(5)],
+        outputs=[{"name": "model", "path": "/data/model.bin"}],
+        metadata={"author": "alice"},
+        depends_on=["task-0"],
+    )
+
+
+def replay(task: Task, eager: bool) -> None:
+    log = structlog.get_logger("dramax.worker").bind(
+        message_id="1f0c", task_id=task.id, workflow_id="workflow-1234abcd"
+    )
+    if eager:
+        log.info("Running task", task=task)
+        log.info("Work directory", workdir="/tmp/alice/workflow-1234abcd/task-1")
+    else:
+        log.info("Running task", task_name=task.name, workdir="/tmp/alice/w/task-1")
+        log.debug("Task spec", task=Lazy(task.dict))
+    log.debug("Checking upstream tasks", depends_on=task.depends_on)
+    for artifact in task.inputs:
+        log.debug("Downloading input", object_name=artifact.path)
+    log.info("Executing task")
+    log.debug("Docker task")
+    log.info("Task finished successfully")
+
+
+def measure(name: str, task: Task, tasks: int) -> float:
+    defaults = {"log_level": "INFO", "log_async": False, "log_sampling": {}}
+    for key, value in {**defaults, **PROFILES[name]}.items():
+        setattr(settings, key, value)
+    with open(os.devnull, "w") as devnull:  # noqa: PTH123
+        configure_logger(force=True, stream=devnull)
+        start = time.perf_counter()
+        for _ in range(tasks):
+            replay(task, eager=name == "eager")
+        elapsed = time.perf_counter() - start
+        # Written by the background thread, not counted.
+        configure_logger(force=True, stream=devnull)
+    return elapsed / tasks * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=5000)
+    parser.add_argument(
+        "--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES)
+    )
+    args = parser.parse_args()
+
+    task = sample_task()
+    print(f"{'profile':<14} {'us/task':>9}")
+    for name in args.profiles:
+        print(f"{name:<14} {measure(name, task, args.tasks):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,6 @@
 import argparse
-
-from dramatiq.cli import main as dramatiq_cli
-from dramatiq.cli import make_argument_parser
-
-from dramax.api.app import run_server
+import os
+import sys
 
 
 def get_parser() -> argparse.ArgumentParser:
@@ -11,24 +8,254 @@ def get_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(prog="dramax")
     subparsers = parser.add_subparsers(dest="command", help="dramaX sub-commands")
     subparsers.required = True
-    subparsers.add_parser(
+    worker_parser = subparsers.add_parser(
         "worker",
         help="Spawn multiple concurrent workers to process tasks",
     )
+    worker_parser.add_argument(
+        "--io-mode",
+        choices=["threads", "gevent"],
+        default="threads",
+        help=(
+            "Concurrency model of worker processes. `gevent` runs tasks as "
+            "greenlets, suited for many concurrent API tasks (default: threads)"
+        ),
+    )
+    # Also parsed by dramatiq, declared here to know whether they were given.
+    worker_parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        default=None,
+        help=(
+            "Worker threads per process (default: dramatiq's, or "
+            "GEVENT_WORKER_THREADS with --io-mode gevent)"
+        ),
+    )
+    worker_parser.add_argument(
+        "-Q",
+        "--queues",
+        nargs="*",
+        default=None,
+        help="Queues to consume (default: all of them)",
+    )
+    worker_parser.add_argument(
+        "--pool",
+        action="append",
+        default=[],
+        metavar="QUEUES:PROCESSES:THREADS[:IO_MODE]",
+        help=(
+            "Start a worker pool bound to comma-separated queues, may be repeated "
+            "(default: WORKER_POOLS setting, ignored when --queues is given)"
+        ),
+    )
     subparsers.add_parser("server", help="Deploy server to serve API requests")
+    reaper_parser = subparsers.add_parser(
+        "reaper",
+        help="Fail or requeue running tasks whose worker stopped heartbeating",
+    )
+    reaper_parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Reap expired tasks once and exit",
+    )
+    reaper_parser.add_argument(
+        "--policy",
+        choices=["fail", "requeue"],
+        default=None,
+        help="What to do with expired tasks (default: REAPER_POLICY setting)",
+    )
+    dispatch_parser = subparsers.add_parser(
+        "dispatch",
+        help="Release parked tasks to workers, sharing capacity fairly across authors",
+    )
+    dispatch_parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Release the tasks that fit in the free slots once and exit",
+    )
+    archive_parser = subparsers.add_parser(
+        "archive",
+        help="Move finished workflows out of MongoDB into the archive",
+    )
+    archive_parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Archive one batch of expired workflows and exit",
+    )
+    archive_parser.add_argument(
+        "--older-than",
+        type=float,
+        default=None,
+        metavar="DAYS",
+        help="Archive workflows finished DAYS ago (default: ARCHIVE_AFTER_DAYS)",
+    )
+    loadtest_parser = subparsers.add_parser(
+        "loadtest",
+        help="Measure the throughput and latencies of an in-process API server",
+    )
+    loadtest_parser.add_argument(
+        "--run-rate",
+        type=float,
+        default=10,
+        help="Workflow submissions per second (default: 10)",
+    )
+    loadtest_parser.add_argument(
+        "--status-rate",
+        type=float,
+        default=100,
+        help="Status polls per second (default: 100)",
+    )
+    loadtest_parser.add_argument(
+        "--duration",
+        type=float,
+        default=10,
+        help="Seconds of load (default: 10)",
+    )
+    loadtest_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=64,
+        help="Requests in flight at most (default: 64)",
+    )
+    loadtest_parser.add_argument(
+        "--tasks",
+        type=int,
+        default=5,
+        help="Tasks per submitted workflow (default: 5)",
+    )
+    run_parser = subparsers.add_parser("run", help="Run a workflow from a JSON file")
+    run_parser.add_argument("workflow", help="Path to the workflow JSON file")
+    run_parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Execute in this process, without broker, MongoDB or MinIO",
+    )
+    run_parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of concurrent tasks when running locally (default: 4)",
+    )
+    run_parser.add_argument(
+        "--storage-dir",
+        default=None,
+        help="Directory used as artifact storage when running locally",
+    )
     return parser
 
 
+def run_workflow(args: argparse.Namespace) -> None:
+    """Run a workflow file either locally or by submitting it to the cluster."""
+    from dramax.models.dramatiq.workflow import Workflow
+
+    workflow = Workflow.parse_file(args.workflow)
+
+    if not args.local:
+        from dramax.worker.scheduler import Scheduler
+
+        Scheduler().run(workflow)
+        print(f"Submitted workflow {workflow.id}")  # noqa: T201
+        return
+
+    from dramax.services.local import LocalRunner
+
+    report = LocalRunner(
+        workflow,
+        max_workers=args.workers,
+        storage_dir=args.storage_dir,
+    ).run()
+
+    summary = f"Workflow {report.workflow_id}: {report.status}"
+    print(f"{summary} in {report.elapsed * 1000:.1f} ms")  # noqa: T201
+    for task in report.tasks:
+        line = f"  {task.id:<30} {task.status:<8} {task.elapsed * 1000:>10.1f} ms"
+        if task.message:
+            line += f"  {task.message}"
+        print(line)  # noqa: T201
+
+
+def run_loadtest(args: argparse.Namespace) -> None:
+    from dramax.api.loadtest import LoadTest
+
+    report = LoadTest(
+        run_rate=args.run_rate,
+        status_rate=args.status_rate,
+        duration=args.duration,
+        concurrency=args.concurrency,
+        tasks=args.tasks,
+    ).run()
+
+    print(f"{report.duration:.1f} s of load")  # noqa: T201
+    header = f"  {'endpoint':<10} {'requests':>9} {'errors':>7} {'req/s':>9}"
+    print(f"{header} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9} (ms)")  # noqa: T201
+    for e in report.endpoints:
+        line = f"  {e.endpoint:<10} {e.requests:>9} {e.errors:>7} {e.throughput:>9.1f}"
+        print(f"{line} {e.p50:>9.1f} {e.p90:>9.1f} {e.p99:>9.1f} {e.max:>9.1f}")  # noqa: T201
+
+
 def cli() -> None:
     """Main CLI entrypoint, parses arguments and calls the appropriate sub-command."""
     args, _ = get_parser().parse_known_args()
+    # Heavy modules are imported per sub-command to keep start-up fast.
     if args.command == "worker":
+        from dramax.common.settings import settings
+
+        pools = args.pool or ([] if args.queues is not None else settings.worker_pools)
+        if pools:
+            from dramax.worker.pools import WorkerPool, run_pools
+
+            sys.exit(run_pools([WorkerPool.parse(spec) for spec in pools]))
+
+        if args.io_mode == "gevent":
+            # Must happen before sockets, threads or the broker are imported.
+            from gevent import monkey
+
+            monkey.patch_all()
+
+        from dramatiq.cli import main as dramatiq_cli
+        from dramatiq.cli import make_argument_parser
+
         dramatiq_ns, _ = make_argument_parser().parse_known_args()
         dramatiq_ns.broker = "dramax.worker.scheduler"
+        # Worker processes are spawned, so they read it from the environment.
+        os.environ.setdefault("WORKER_PROCESSES", str(dramatiq_ns.processes))
+        if args.io_mode == "gevent" and args.threads is None:
+            dramatiq_ns.threads = settings.gevent_worker_threads
 
         dramatiq_cli(dramatiq_ns)
     elif args.command == "server":
+        from dramax.api.app import run_server
+
         run_server()
+    elif args.command == "run":
+        run_workflow(args)
+    elif args.command == "loadtest":
+        run_loadtest(args)
+    elif args.command == "reaper":
+        from dramax.worker.reaper import Reaper
+
+        reaper = Reaper(policy=args.policy)
+        if args.once:
+            print(f"Reaped {reaper.reap()} tasks")  # noqa: T201
+        else:
+            reaper.run_forever()
+    elif args.command == "dispatch":
+        from dramax.worker.dispatcher import Dispatcher
+
+        dispatcher = Dispatcher()
+        if args.once:
+            print(f"Released {dispatcher.dispatch()} tasks")  # noqa: T201
+        else:
+            dispatcher.run_forever()
+    elif args.command == "archive":
+        from dramax.worker.archive import Archiver
+
+        archiver = Archiver(after_days=args.older_than)
+        if args.once:
+            print(f"Archived {archiver.archive()} workflows")  # noqa: T201
+        else:
+            archiver.run_forever()
 
 
 if __name__ == "__main__":
@@ -12,7 +12,9 @@ from structlog import get_logger
 
 from dramax import __version__
 from dramax.api.dependencies import get_api_key
+from dramax.api.profiling import ProfileRequests
 from dramax.api.routes.workflow import router
+from dramax.api.tracing import TraceRequests
 from dramax.common.settings import settings
 from dramax.services.mongo import MongoService
 
@@ -23,6 +25,7 @@ log = get_logger("dramax.api")
 async def lifespan(_: FastAPI):  # noqa: ANN201
     """Context manager to initialize and close resources for the application."""
     MongoService.connect()
+    MongoService.create_indexes()
     yield
     MongoService.disconnect()
 
@@ -45,6 +48,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfileRequests)
+app.add_middleware(TraceRequests)
 
 main_router = APIRouter()
 
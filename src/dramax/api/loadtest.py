@@ -0,0 +1,214 @@
+"""HTTP load generator for the API server, see `dramax loadtest`.
+
+The app is served by uvicorn in a thread of this process, with the in-memory
+MongoDB stand-in and the stub broker, so the figures measure the API alone.
+Requests are sent open-loop: each endpoint gets a request every `1 / rate`
+seconds whether or not earlier ones have been answered, and latencies are
+counted from the time a request was due. A saturated server thus shows up as
+growing latencies instead of silently lowering the offered load.
+"""
+
+from __future__ import annotations
+
+import http.client
+import json
+import math
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+from pydantic import BaseModel
+from structlog import get_logger
+
+from dramax.common.settings import settings
+
+log = get_logger("dramax.loadtest")
+
+ENDPOINTS = ("run", "status")
+
+
+class EndpointReport(BaseModel):
+    endpoint: str
+    requests: int
+    errors: int
+    throughput: float  # Responses per second.
+    # Latencies in milliseconds.
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+
+class LoadTestReport(BaseModel):
+    duration: float
+    endpoints: list[EndpointReport]
+
+
+def percentile(latencies: list[float], q: float) -> float:
+    """Nearest-rank percentile `q` (0-100) of sorted `latencies`."""
+    if not latencies:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(latencies)))
+    return latencies[rank - 1]
+
+
+def sample_workflow(tasks: int) -> dict:
+    """A chain of `tasks` API tasks, as submitted to `/run`."""
+    return {
+        "label": "loadtest",
+        "metadata": {"author": f"loadtest-{random.randrange(8)}"},  # noqa: S311
+        "tasks": [
+            {
+                "id": f"task-{i}",
+                "name": f"task-{i}",
+                "url": "http://localhost/loadtest",
+                "depends_on": [f"task-{i - 1}"] if i else [],
+            }
+            for i in range(tasks)
+        ],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LoadTest:
+    def __init__(
+        self,
+        run_rate: float = 10,
+        status_rate: float = 100,
+        duration: float = 10,
+        concurrency: int = 64,
+        tasks: int = 5,
+        seed_workflows: int = 50,
+    ) -> None:
+        self.rates = {"run": run_rate, "status": status_rate}
+        self.duration = duration
+        self.concurrency = concurrency
+        self.tasks = tasks
+        self.seed_workflows = seed_workflows
+        self.port = free_port()
+        self.workflow_ids: list[str] = []
+        self._latencies: dict[str, list[float]] = {e: [] for e in ENDPOINTS}
+        self._errors: dict[str, int] = dict.fromkeys(ENDPOINTS, 0)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        # One keep-alive connection per client thread.
+        if not hasattr(self._local, "connection"):
+            self._local.connection = http.client.HTTPConnection(
+                "127.0.0.1", self.port, timeout=60
+            )
+        return self._local.connection
+
+    def _request(self, endpoint: str) -> bool:
+        prefix = f"{settings.base_path}/api/v2/workflow"
+        if endpoint == "run":
+            method, path = "POST", f"{prefix}/run"
+            body = json.dumps(sample_workflow(self.tasks))
+        else:
+            workflow_id = random.choice(self.workflow_ids)  # noqa: S311
+            method, path, body = "GET", f"{prefix}/status?id={workflow_id}", None
+        connection = self._connection()
+        try:
+            connection.request(
+                method, path, body=body, headers={"Content-Type": "application/json"}
+            )
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            return False
+        if response.status >= 400:  # noqa: PLR2004
+            return False
+        if endpoint == "run":
+            self.workflow_ids.append(json.loads(data)["id"])
+        return True
+
+    def _send(self, endpoint: str, due: float) -> None:
+        ok = self._request(endpoint)
+        latency = time.perf_counter() - due
+        with self._lock:
+            self._latencies[endpoint].append(latency)
+            if not ok:
+                self._errors[endpoint] += 1
+
+    def _drive(self, endpoint: str, pool: ThreadPoolExecutor, start: float) -> None:
+        interval = 1 / self.rates[endpoint]
+        for n in range(math.ceil(self.duration * self.rates[endpoint])):
+            due = start + n * interval
+            time.sleep(max(0.0, due - time.perf_counter()))
+            pool.submit(self._send, endpoint, due)
+
+    def _serve(self) -> tuple[uvicorn.Server, threading.Thread]:
+        # The broker is created when the worker modules are first imported.
+        settings.broker_backend = "stub"
+        from dramax.api.app import app
+        from dramax.services.memory import InMemoryClient
+        from dramax.services.mongo import MongoService
+
+        MongoService.set_client(InMemoryClient())
+        server = uvicorn.Server(
+            uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="critical")
+        )
+        thread = threading.Thread(target=server.run, name="dramax-loadtest-server")
+        thread.start()
+        while not server.started:
+            if not thread.is_alive():
+                msg = "API server failed to start"
+                raise RuntimeError(msg)
+            time.sleep(0.05)
+        return server, thread
+
+    def run(self) -> LoadTestReport:
+        server, thread = self._serve()
+        try:
+            for _ in range(self.seed_workflows):
+                self._request("run")
+            if not self.workflow_ids and self.rates["status"]:
+                msg = "No workflow could be submitted to poll the status of"
+                raise RuntimeError(msg)
+            log.info("Load test started", rates=self.rates, duration=self.duration)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(self.concurrency) as pool:
+                drivers = [
+                    threading.Thread(target=self._drive, args=(e, pool, start))
+                    for e in ENDPOINTS
+                    if self.rates[e] > 0
+                ]
+                for driver in drivers:
+                    driver.start()
+                for driver in drivers:
+                    driver.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            server.should_exit = True
+            thread.join()
+
+        return LoadTestReport(
+            duration=elapsed,
+            endpoints=[
+                self._report(e, elapsed) for e in ENDPOINTS if self.rates[e] > 0
+            ],
+        )
+
+    def _report(self, endpoint: str, elapsed: float) -> EndpointReport:
+        latencies = sorted(self._latencies[endpoint])
+        return EndpointReport(
+            endpoint=endpoint,
+            requests=len(latencies),
+            errors=self._errors[endpoint],
+            throughput=(len(latencies) - self._errors[endpoint]) / elapsed,
+            p50=percentile(latencies, 50) * 1000,
+            p90=percentile(latencies, 90) * 1000,
+            p99=percentile(latencies, 99) * 1000,
+            max=(latencies[-1] if latencies else 0.0) * 1000,
+        )
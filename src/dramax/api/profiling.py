@@ -0,0 +1,61 @@
+"""Profiling of API requests, see `dramax.common.profiling`.
+
+Requests taking at least `settings.profile_api_min_duration` seconds are stored
+as `profiles/api/<date>/<time>-<method>-<path>.prof` in the artifact storage,
+and their summary is logged. A profile also covers whatever else the event loop
+ran during the request.
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import datetime
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+from structlog import get_logger
+
+from dramax.common.profiling import Profiler
+from dramax.common.settings import settings
+
+log = get_logger("dramax.api.profiling")
+
+
+def profile_object_name(method: str, path: str) -> str:
+    now = datetime.now(tz=settings.timezone)
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-") or "root"
+    return f"profiles/api/{now:%Y-%m-%d}/{now:%H%M%S-%f}-{method}-{slug}.prof"
+
+
+class ProfileRequests:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.profile_api_requests:
+            await self.app(scope, receive, send)
+            return
+        profiler = Profiler.start()
+        if profiler is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+        if profiler.total < settings.profile_api_min_duration:
+            return
+        object_name = profile_object_name(scope["method"], scope["path"])
+        try:
+            summary = await run_in_threadpool(profiler.save, object_name)
+        except Exception as e:  # noqa: BLE001
+            log.warning("Failed to store request profile", error=str(e))
+            return
+        log.info(
+            "Request profiled",
+            method=scope["method"],
+            path=scope["path"],
+            total=round(summary.total, 4),
+            object_name=object_name,
+            top=[entry.function for entry in summary.top[:5]],
+        )
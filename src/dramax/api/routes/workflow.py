@@ -1,12 +1,27 @@
+from datetime import datetime
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pymongo.database import Database
+from starlette.status import HTTP_202_ACCEPTED, HTTP_429_TOO_MANY_REQUESTS
 from structlog import get_logger
 
 from dramax.api.dependencies import fastapi_get_database
+from dramax.common.exceptions import WorkflowNotResumableError
+from dramax.common.settings import settings
 from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
-from dramax.models.dramatiq.workflow import ExecutionId, Workflow, WorkflowInDatabase
+from dramax.models.dramatiq.workflow import (
+    BulkStatus,
+    BulkStatusRequest,
+    ExecutionId,
+    ResumedWorkflow,
+    Workflow,
+    WorkflowInDatabase,
+    WorkflowPage,
+    WorkflowStatus,
+)
+from dramax.worker.admission import AdmissionControl
+from dramax.worker.archive import Archiver
 from dramax.worker.scheduler import Scheduler
 
 log = get_logger("dramax.api.routes.workflow")
@@ -21,18 +36,56 @@ router = APIRouter()
     response_model=ExecutionId,
     response_model_exclude_unset=True,
 )
-async def run(workflow_request: Workflow) -> ExecutionId:
-    """Execute a collection of tasks."""
+async def run(workflow_request: Workflow, response: Response) -> ExecutionId:
+    """Execute a collection of tasks.
+
+    Over capacity, workflows are rejected with 429 and a Retry-After header, or
+    accepted with 202 and parked until there is capacity for them, depending on
+    the admission policy.
+    """
     log.debug("Getting workflow request", workflow_request=workflow_request)
+    admission_control = AdmissionControl()
+    admission = admission_control.check(workflow_request)
+    if not admission.admitted and admission_control.policy == "reject":
+        raise HTTPException(
+            status_code=HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Cluster at capacity ({admission.reason}), retry later",
+            headers={"Retry-After": str(admission.retry_after)},
+        )
     try:
         scheduler = Scheduler()
-        scheduler.run(workflow_request)
+        scheduler.run(workflow_request, park=not admission.admitted)
     except Exception as e:
         log.error("Error executing workflow", error=e)
         raise HTTPException(status_code=500, detail="Error executing workflow") from e
+    if not admission.admitted:
+        response.status_code = HTTP_202_ACCEPTED
     return ExecutionId(id=workflow_request.id)
 
 
+@router.post(
+    "/resume",
+    name="Resume failed workflow",
+    tags=["workflow"],
+    response_model=ResumedWorkflow,
+)
+async def resume(
+    id: str,
+    db: Annotated[Database, Depends(fastapi_get_database)],
+) -> ResumedWorkflow:
+    """Run again the failed tasks of a workflow and the tasks depending on them.
+
+    Successful tasks, and their outputs, are kept.
+    """
+    if not WorkflowManager(db).find_one(id=id):
+        raise HTTPException(status_code=404, detail=f"Workflow {id} not found")
+    try:
+        tasks = Scheduler(db).resume(id)
+    except WorkflowNotResumableError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    return ResumedWorkflow(id=id, tasks=tasks)
+
+
 @router.get(
     "/status",
     name="Get workflow execution status",
@@ -55,6 +108,10 @@ async def status(
         ) from e
 
     if not workflow_in_db:
+        # Finished workflows may have been moved to the archive.
+        archived = Archiver(db).load(id)
+        if archived:
+            return archived
         raise HTTPException(status_code=404, detail=f"Workflow {id} not found")
 
     workflow_in_db.tasks = TaskManager(db).find(parent=id)
@@ -62,6 +119,66 @@ async def status(
     return workflow_in_db
 
 
+@router.get(
+    "/list",
+    name="List workflows",
+    tags=["workflow"],
+    response_model=WorkflowPage,
+)
+async def list_workflows(
+    db: Annotated[Database, Depends(fastapi_get_database)],
+    author: str | None = None,
+    status: Annotated[list[WorkflowStatus] | None, Query()] = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=settings.workflow_list_max_limit)] = 100,
+) -> WorkflowPage:
+    """List workflow summaries, newest first.
+
+    Pass the `next_cursor` of a page as `cursor` to get the next one. Archived
+    workflows are not listed.
+    """
+    try:
+        return WorkflowManager(db).find_page(
+            author=author,
+            statuses=[s.value for s in status] if status else None,
+            created_after=created_after,
+            created_before=created_before,
+            cursor=cursor,
+            limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@router.post(
+    "/status/bulk",
+    name="Get the status of many workflows",
+    tags=["workflow"],
+    response_model=BulkStatus,
+)
+async def bulk_status(
+    request: BulkStatusRequest,
+    db: Annotated[Database, Depends(fastapi_get_database)],
+) -> BulkStatus:
+    """Return the summaries of many workflows, archived or not, at once.
+
+    Unknown ids are returned in `missing`.
+    """
+    ids = list(dict.fromkeys(request.ids))
+    items = WorkflowManager(db).find_summaries(ids)
+    found = {item.id for item in items}
+    if len(found) < len(ids):
+        items += Archiver(db).find_summaries([i for i in ids if i not in found])
+        found = {item.id for item in items}
+    order = {workflow_id: i for i, workflow_id in enumerate(ids)}
+    return BulkStatus(
+        items=sorted(items, key=lambda item: order[item.id]),
+        missing=[i for i in ids if i not in found],
+    )
+
+
 @router.post(
     "/revoke",
     name="Cancel workflow execution",
@@ -73,13 +190,25 @@ async def cancel_or_revoke(
     id: str,
     db=Depends(fastapi_get_database),
 ) -> WorkflowInDatabase:
-    """Revokes the execution of a workflow, i.e., cancel the execution of pending tasks."""  # noqa: E501
-    # TODO: Doesn't work yet.
+    """Revokes the execution of a workflow.
+
+    Pending tasks are dropped by workers as soon as they are received, and running
+    tasks are interrupted: containers are stopped and transfers aborted.
+    """
     workflow = WorkflowManager(db).find_one(id=id)
     if not workflow:
         raise HTTPException(status_code=404, detail=f"Workflow {id} not found")
 
     if not workflow.is_revoked:
-        WorkflowManager(db).create_or_update_from_id(workflow.id, is_revoked=True)
+        now = datetime.now(tz=settings.timezone)
+        WorkflowManager(db).create_or_update_from_id(
+            id,
+            is_revoked=True,
+            revoked_at=now,
+            updated_at=now,
+            status=WorkflowStatus.STATUS_REVOKED,
+        )
+        TaskManager(db).revoke_pending(id, updated_at=now)
+        workflow = WorkflowManager(db).find_one(id=id)
 
     return workflow
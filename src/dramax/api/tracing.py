@@ -0,0 +1,44 @@
+"""Tracing of API requests, see `dramax.common.tracing`.
+
+Each request is a server span, continuing the trace of an incoming
+`traceparent` header if any.
+"""
+
+from __future__ import annotations
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from dramax.common.tracing import TRACEPARENT, Tracer, extract
+
+
+class TraceRequests:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        tracer = Tracer.get_instance()
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        traceparent = headers.get(TRACEPARENT.encode(), b"").decode("latin-1")
+        span, token = tracer.start_span(
+            f"{scope['method']} {scope['path']}",
+            "server",
+            parent=extract(traceparent),
+            attributes={"http.method": scope["method"], "http.target": scope["path"]},
+        )
+
+        async def send_with_status(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:  # noqa: PLR2004
+                    span.status = "error"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException as e:
+            tracer.end_span(span, token, e)
+            raise
+        tracer.end_span(span, token)
@@ -0,0 +1,56 @@
+import threading
+from collections.abc import Callable
+
+from structlog import get_logger
+
+from dramax.common.exceptions import TaskRevokedError
+
+log = get_logger("dramax.cancellation")
+
+
+class CancellationToken:
+    """Signals that the work of a task must stop, e.g. because of a revocation.
+
+    Long-running operations either poll `raise_if_cancelled()` between chunks of
+    work or register a callback with `on_cancel()` that interrupts them.
+    """
+
+    def __init__(self, task_id: str = "", workflow_id: str = "") -> None:
+        self.task_id = task_id
+        self.workflow_id = workflow_id
+        self._event = threading.Event()
+        self._callbacks: list[Callable[[], object]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:  # noqa: BLE001
+                log.warning("Cancellation callback failed", error=str(e))
+
+    def on_cancel(self, callback: Callable[[], object]) -> None:
+        """Call `callback` on cancellation, right away if already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], object]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise TaskRevokedError(self.task_id, self.workflow_id)
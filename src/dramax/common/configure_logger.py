@@ -1,26 +1,224 @@
+"""Logging setup of dramax processes, from the `log_*` settings.
+
+Events are filtered by level and sampled before anything else is done with
+them, so that dropped events cost little more than the call itself, and values
+wrapped in `Lazy` are only computed for the events that are kept. Events are
+rendered as coloured lines ("console") or as JSON objects, one per line
+("json"), with `orjson` when installed. With `log_async`, rendered lines are
+written by a background thread, so tasks never block on the log output.
+"""
+
+from __future__ import annotations
+
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from collections.abc import Callable
+from typing import Any, TextIO
 
 import structlog
+from structlog.typing import EventDict, WrappedLogger
 
+LOG_FORMATS = ("console", "json")
+
+_configured = False
+_handler: logging.Handler | None = None
+
+
+class Lazy:
+    """A log value computed only if the event is emitted.
+
+    >>> log.debug("Task spec", task=Lazy(task.dict))
+    """
+
+    __slots__ = ("args", "function")
+
+    def __init__(self, function: Callable[..., Any], *args: Any) -> None:
+        self.function = function
+        self.args = args
+
+    def __call__(self) -> Any:
+        return self.function(*self.args)
+
+
+def _by_prefix(values: dict[str, Any]) -> Callable[[str], Any]:
+    """Value of the longest dotted prefix of a logger name in `values`."""
+    cache: dict[str, Any] = {}
+
+    def lookup(name: str) -> Any:
+        if name not in cache:
+            parts = name.split(".")
+            cache[name] = next(
+                (
+                    values[prefix]
+                    for i in range(len(parts), 0, -1)
+                    if (prefix := ".".join(parts[:i])) in values
+                ),
+                None,
+            )
+        return cache[name]
+
+    return lookup
+
+
+class Sampler:
+    """Keep a share of the events below warning of the loggers in `rates`."""
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        self._rate = _by_prefix(rates)
+
+    def __call__(
+        self, logger: WrappedLogger, method_name: str, event_dict: EventDict
+    ) -> EventDict:
+        if method_name in ("debug", "info"):
+            rate = self._rate(getattr(logger, "name", ""))
+            if rate is not None and random.random() >= rate:  # noqa: S311
+                raise structlog.DropEvent
+        return event_dict
 
-def configure_logger() -> None:
-    logging.getLogger("dramax.request").setLevel(logging.WARNING)
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(message)s",  # Evita que duplique output con structlog
+def resolve_lazy(
+    logger: WrappedLogger, method_name: str, event_dict: EventDict
+) -> EventDict:
+    for key, value in event_dict.items():
+        if isinstance(value, Lazy):
+            event_dict[key] = value()
+    return event_dict
+
+
+def add_trace_context(
+    logger: WrappedLogger, method_name: str, event_dict: EventDict
+) -> EventDict:
+    """Add the ids of the current span, see `dramax.common.tracing`."""
+    from dramax.common.tracing import current_span
+
+    span = current_span()
+    if span is not None:
+        event_dict["trace_id"] = span.context.trace_id
+        event_dict["span_id"] = span.context.span_id
+    return event_dict
+
+
+def json_renderer() -> structlog.processors.JSONRenderer:
+    try:
+        import orjson
+
+        def dumps(obj: Any, **_: Any) -> str:
+            return orjson.dumps(obj, default=str).decode()
+
+        return structlog.processors.JSONRenderer(serializer=dumps)
+    except ImportError:
+        return structlog.processors.JSONRenderer(serializer=json.dumps, default=str)
+
+
+class QueueingHandler(logging.handlers.QueueHandler):
+    """Hand records to a thread that writes them with `handler`.
+
+    The thread is started by the first record of each process. Threads do not
+    survive a fork, so a forked worker process starts its own thread instead of
+    queueing records that nothing would ever write.
+    """
+
+    def __init__(self, handler: logging.Handler) -> None:
+        super().__init__(queue.SimpleQueue())
+        self.handler = handler
+        self._listener: logging.handlers.QueueListener | None = None
+        self._pid: int | None = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Called with the handler lock held, which is reset in forked processes.
+        if self._pid != os.getpid():
+            # Records queued before a fork are written by the parent.
+            self.queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(self.queue, self.handler)
+            self._listener.start()
+            self._pid = os.getpid()
+        super().emit(record)
+
+    def close(self) -> None:
+        """Write the queued records and stop the thread, e.g. at exit."""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+        self._listener = None
+        super().close()
+
+
+def _make_handler(stream: TextIO, log_async: bool) -> logging.Handler:
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    return QueueingHandler(handler) if log_async else handler
+
+
+def configure_logger(force: bool = False, stream: TextIO | None = None) -> None:
+    """Configure structlog and the standard logging once, unless `force`."""
+    global _configured, _handler  # noqa: PLW0603
+    if _configured and not force:
+        return
+    try:
+        from dramax.common.settings import settings
+    except Exception:  # noqa: BLE001
+        # Settings are incomplete, e.g. for `dramax -h`: defaults until they load.
+        settings = None
+    else:
+        _configured = True
+    log_format = settings.log_format if settings else "console"
+    if log_format not in LOG_FORMATS:
+        msg = f"log_format must be one of {', '.join(LOG_FORMATS)}"
+        raise ValueError(msg)
+    level = logging.getLevelName(settings.log_level.upper() if settings else "INFO")
+    levels = {
+        name: logging.getLevelName(value.upper())
+        for name, value in (settings.log_levels if settings else {}).items()
+    }
+
+    root = logging.getLogger()
+    if _handler is not None:
+        root.removeHandler(_handler)
+        _handler.close()
+    _handler = _make_handler(
+        stream or sys.stderr, bool(settings and settings.log_async)
     )
+    root.addHandler(_handler)
+    root.setLevel(level)
+    logging.getLogger("dramax.request").setLevel(logging.WARNING)
+    for name, value in levels.items():
+        logging.getLogger(name).setLevel(value)
 
+    if log_format == "json":
+        renderer = [
+            structlog.processors.TimeStamper(fmt="iso", utc=True),
+            structlog.stdlib.add_log_level,
+            structlog.stdlib.add_logger_name,
+            add_trace_context,
+            structlog.processors.format_exc_info,
+            json_renderer(),
+        ]
+    else:
+        renderer = [
+            structlog.processors.TimeStamper(fmt="%H:%M:%S"),
+            structlog.stdlib.add_log_level,
+            structlog.stdlib.add_logger_name,
+            add_trace_context,
+            structlog.dev.ConsoleRenderer(colors=True),
+        ]
+    sampling = settings.log_sampling if settings else {}
+    sampler = [Sampler(sampling)] if sampling else []
     structlog.configure(
         processors=[
-            structlog.processors.TimeStamper(fmt="%H:%M:%S"),  # Hora compacta
-            structlog.stdlib.add_log_level,  # Añade nivel (INFO, ERR, etc.)
-            structlog.stdlib.add_logger_name,  # Añade 'logger name'
-            structlog.dev.ConsoleRenderer(colors=True),  # Salida con colores y legible
+            # Cheap checks first: dropped events are never rendered.
+            structlog.stdlib.filter_by_level,
+            *sampler,
+            resolve_lazy,
+            *renderer,
         ],
+        # Events below every configured level are dropped before any processor.
         wrapper_class=structlog.make_filtering_bound_logger(
-            logging.INFO
-        ),  # Define nivel desde aquí
+            min([level, *levels.values()])
+        ),
         context_class=dict,
         logger_factory=structlog.stdlib.LoggerFactory(),
         cache_logger_on_first_use=True,
@@ -153,3 +153,34 @@ class UploadError(MinioError):
             f"Failed to upload file '{file_path}' to object storage path '{object_name}':"  # noqa: E501
             f"{original_exception}",
         )
+
+
+class TaskRevokedError(TaskError):
+    """Raised when a task stops because its workflow has been revoked."""
+
+    def __init__(self, task_id: str, workflow_id: str) -> None:
+        self.task_id = task_id
+        self.workflow_id = workflow_id
+        super().__init__(f"Task '{task_id}' of workflow '{workflow_id}' was revoked.")
+
+
+class TaskSpecNotFoundError(TaskError):
+    """Raised when a compact message references a task spec missing from MongoDB."""
+
+    def __init__(self, task_id: str, workflow_id: str, spec_version: int) -> None:
+        self.task_id = task_id
+        self.workflow_id = workflow_id
+        self.spec_version = spec_version
+        super().__init__(
+            f"Spec version {spec_version} of task '{task_id}' of workflow "
+            f"'{workflow_id}' not found.",
+        )
+
+
+class WorkflowNotResumableError(TaskError):
+    """Raised when a workflow cannot be resumed, e.g. because it is still running."""
+
+    def __init__(self, workflow_id: str, reason: str) -> None:
+        self.workflow_id = workflow_id
+        self.reason = reason
+        super().__init__(f"Workflow '{workflow_id}' cannot be resumed: {reason}.")
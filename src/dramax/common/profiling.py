@@ -0,0 +1,132 @@
+"""Opt-in cProfile profiling of worker tasks and API requests.
+
+A `Profiler` records a cProfile profile along with the wall time spent in named
+stages, e.g. downloading inputs or running the executor. Profiles are stored in
+the artifact storage in the pstats format, readable with `python -m pstats` or
+snakeviz, and summarised by their stage timings and hottest functions.
+
+Only one profile is recorded at a time per process: as of Python 3.12 profilers
+are process-wide, so concurrent tasks or requests are not profiled meanwhile.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar, Token
+
+from pydantic import BaseModel
+from structlog import get_logger
+
+from dramax.common.settings import settings
+from dramax.services.storage import get_storage
+
+log = get_logger("dramax.profiling")
+
+_active = threading.Lock()
+_current: ContextVar[Profiler | None] = ContextVar("dramax_profiler", default=None)
+
+
+class ProfileEntry(BaseModel):
+    function: str
+    calls: int
+    tottime: float  # Seconds in the function itself.
+    cumtime: float  # Seconds in the function and the functions it called.
+
+
+class ProfileSummary(BaseModel):
+    object_name: str | None = None  # Of the full profile in the artifact storage.
+    total: float = 0.0
+    stages: dict[str, float] = {}  # Wall seconds per stage.
+    top: list[ProfileEntry] = []  # Functions with the highest `tottime`.
+    # Worker threads of the process, for task profiles. With more than one, `top`
+    # includes the functions of tasks run by the other threads meanwhile.
+    threads: int | None = None
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self._profile = cProfile.Profile()
+        self._token: Token | None = None
+        self._started = 0.0
+        self.total = 0.0
+        self.stages: dict[str, float] = defaultdict(float)
+
+    @classmethod
+    def start(cls) -> Profiler | None:
+        """Start profiling, unless another profile is being recorded."""
+        if not _active.acquire(blocking=False):
+            log.debug("Another profile is being recorded, not profiling")
+            return None
+        profiler = cls()
+        profiler._token = _current.set(profiler)
+        profiler._started = time.perf_counter()
+        try:
+            profiler._profile.enable()
+        except ValueError:
+            # Another profiler, not started through this module, is active.
+            profiler._token = _current.reset(profiler._token)
+            _active.release()
+            log.debug("Another profiler is active, not profiling")
+            return None
+        return profiler
+
+    def stop(self) -> None:
+        try:
+            self._profile.disable()
+            self.total = time.perf_counter() - self._started
+            if self._token is not None:
+                _current.reset(self._token)
+                self._token = None
+        finally:
+            _active.release()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+
+    def summary(
+        self,
+        object_name: str | None = None,
+        top: int | None = None,
+    ) -> ProfileSummary:
+        top = settings.profile_top_functions if top is None else top
+        stats = pstats.Stats(self._profile, stream=io.StringIO())
+        hottest = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:top]
+        return ProfileSummary(
+            object_name=object_name,
+            total=self.total,
+            stages=dict(self.stages),
+            top=[
+                ProfileEntry(
+                    function=pstats.func_std_string(function),
+                    calls=calls,
+                    tottime=tottime,
+                    cumtime=cumtime,
+                )
+                for function, (_, calls, tottime, cumtime, _) in hottest
+            ],
+        )
+
+    def save(self, object_name: str) -> ProfileSummary:
+        """Store the profile as `object_name`, in the format of `pstats.dump_stats`."""
+        stats = pstats.Stats(self._profile, stream=io.StringIO())
+        get_storage().put_stream(io.BytesIO(marshal.dumps(stats.stats)), object_name)
+        return self.summary(object_name)
+
+
+def stage(name: str) -> AbstractContextManager:
+    """Time a stage of the profile being recorded in this context, if any."""
+    profiler = _current.get()
+    return profiler.stage(name) if profiler is not None else nullcontext()
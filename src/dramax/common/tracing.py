@@ -0,0 +1,352 @@
+"""Minimal OpenTelemetry-style tracing across the API, broker and workers.
+
+Spans form traces through a context variable within a process, and through W3C
+`traceparent` values across processes: in the headers of API requests and of
+HTTP calls of API tasks, and in the options of broker messages. Finished spans
+are exported, when `settings.tracing_exporter` is set, as JSON lines to a file
+or to a bounded in-memory buffer, so traces are available without a collector.
+
+Whether a trace is recorded is decided once at its root span, with probability
+`settings.tracing_sample_ratio`, and propagated along with its context.
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import json
+import os
+import random
+import re
+import secrets
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from pathlib import Path
+from typing import Any, NamedTuple, TypeVar
+
+from pymongo import monitoring
+from structlog import get_logger
+
+from dramax.common.settings import settings
+
+log = get_logger("dramax.tracing")
+
+TRACING_EXPORTERS = ("memory", "file")
+TRACEPARENT = "traceparent"
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+F = TypeVar("F", bound=Callable[..., Any])
+CommandEvent = (
+    monitoring.CommandStartedEvent
+    | monitoring.CommandSucceededEvent
+    | monitoring.CommandFailedEvent
+)
+
+HOST = socket.gethostname()
+
+_current: ContextVar[Span | None] = ContextVar("dramax_span", default=None)
+
+
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        context: SpanContext,
+        parent_id: str | None = None,
+        kind: str = "internal",
+        attributes: dict[str, Any] | None = None,
+    ) -> None:
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.start_time = time.time_ns()
+        self.end_time: int | None = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, exception: BaseException) -> None:
+        self.status = "error"
+        self.attributes["exception.type"] = type(exception).__name__
+        self.attributes["exception.message"] = str(exception)
+
+    def to_dict(self) -> dict[str, Any]:
+        end_time = self.end_time or time.time_ns()
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time": self.start_time,
+            "end_time": end_time,
+            "duration_ms": (end_time - self.start_time) / 1e6,
+            "status": self.status,
+            "service": settings.tracing_service_name,
+            "host": HOST,
+            "pid": os.getpid(),
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter(ABC):
+    @abstractmethod
+    def export(self, span: Span) -> None:
+        """Record the finished `span`."""
+
+
+class InMemoryExporter(SpanExporter):
+    """Keep the last `max_spans` finished spans of the process."""
+
+    def __init__(self, max_spans: int | None = None) -> None:
+        self._spans: deque[dict] = deque(
+            maxlen=max_spans or settings.tracing_memory_spans
+        )
+
+    def export(self, span: Span) -> None:
+        self._spans.append(span.to_dict())
+
+    def spans(self, trace_id: str | None = None) -> list[dict]:
+        return [s for s in list(self._spans) if trace_id in (None, s["trace_id"])]
+
+    def clear(self) -> None:
+        self._spans.clear()
+
+
+class FileExporter(SpanExporter):
+    """Append finished spans as JSON lines to `path`, shareable by processes."""
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = (
+            path
+            or settings.tracing_file
+            or str(Path(settings.data_dir, "dramax-traces.jsonl"))
+        )
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock, Path(self.path).open("a") as f:
+            f.write(line)
+
+
+def make_exporter() -> SpanExporter | None:
+    """Span exporter selected by `settings.tracing_exporter`, if any."""
+    name = settings.tracing_exporter
+    if name is None:
+        return None
+    if name not in TRACING_EXPORTERS:
+        msg = f"tracing_exporter must be one of {', '.join(TRACING_EXPORTERS)}"
+        raise ValueError(msg)
+    return InMemoryExporter() if name == "memory" else FileExporter()
+
+
+class Tracer:
+    _instance: Tracer | None = None
+
+    def __init__(
+        self,
+        exporter: SpanExporter | None = None,
+        sample_ratio: float | None = None,
+    ) -> None:
+        self.exporter = exporter
+        self.sample_ratio = (
+            settings.tracing_sample_ratio if sample_ratio is None else sample_ratio
+        )
+
+    @classmethod
+    def get_instance(cls) -> Tracer:
+        if cls._instance is None:
+            cls._instance = cls(make_exporter())
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_span(
+        self,
+        name: str,
+        kind: str = "internal",
+        parent: SpanContext | None = None,
+        attributes: dict[str, Any] | None = None,
+    ) -> tuple[Span, Token]:
+        """Start a span and make it current. End it with `end_span`.
+
+        The parent is `parent`, e.g. extracted from another process, or else the
+        current span. Without either, the span starts a new trace.
+        """
+        if parent is None and (current := _current.get()) is not None:
+            parent = current.context
+        if parent is None:
+            context = SpanContext(
+                secrets.token_hex(16),
+                secrets.token_hex(8),
+                random.random() < self.sample_ratio,  # noqa: S311
+            )
+        else:
+            context = SpanContext(parent.trace_id, secrets.token_hex(8), parent.sampled)
+        span = Span(
+            name,
+            context,
+            parent.span_id if parent else None,
+            kind,
+            attributes,
+        )
+        return span, _current.set(span)
+
+    def end_span(
+        self,
+        span: Span,
+        token: Token | None = None,
+        exception: BaseException | None = None,
+    ) -> None:
+        span.end_time = time.time_ns()
+        if exception is not None:
+            span.record_exception(exception)
+        if token is not None:
+            _current.reset(token)
+        if span.context.sampled and self.exporter is not None:
+            try:
+                self.exporter.export(span)
+            except Exception as e:  # noqa: BLE001
+                log.warning("Failed to export span", span=span.name, error=str(e))
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        kind: str = "internal",
+        parent: SpanContext | None = None,
+        **attributes: Any,
+    ) -> Iterator[Span | None]:
+        """Record the enclosed block as a span. Yields `None` when disabled."""
+        if not self.enabled:
+            yield None
+            return
+        span, token = self.start_span(name, kind, parent, attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, token, e)
+            raise
+        self.end_span(span, token)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def inject() -> str | None:
+    """`traceparent` of the current span, to pass to another process."""
+    span = _current.get()
+    return span.context.traceparent if span is not None else None
+
+
+def extract(traceparent: str | None) -> SpanContext | None:
+    """Span context of a `traceparent` value, if valid."""
+    match = _TRACEPARENT_RE.match(traceparent or "")
+    if match is None:
+        return None
+    trace_id, span_id, flags = match.groups()
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+def traced(name: str, kind: str = "internal", **arguments: str) -> Callable[[F], F]:
+    """Record calls of the decorated function as spans.
+
+    Keyword arguments map span attributes to arguments of the function, or to
+    their attributes, e.g. `image="task.image"`.
+    """
+
+    def decorator(function: F) -> F:
+        signature = inspect.signature(function)
+
+        def attributes(args: tuple, kwargs: dict) -> dict[str, Any]:
+            bound = signature.bind_partial(*args, **kwargs).arguments
+            values = {}
+            for attribute, path in arguments.items():
+                argument, *fields = path.split(".")
+                value = bound.get(argument)
+                for field in fields:
+                    value = getattr(value, field, None)
+                values[attribute] = value
+            return values
+
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            tracer = Tracer.get_instance()
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.span(name, kind, **attributes(args, kwargs)):
+                return function(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """Record the MongoDB commands issued within a trace as client spans."""
+
+    def __init__(self) -> None:
+        self._spans: dict[tuple, Span] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(event: CommandEvent) -> tuple:
+        return (event.request_id, event.connection_id, event.operation_id)
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        tracer = Tracer.get_instance()
+        if not tracer.enabled or _current.get() is None:
+            return
+        collection = event.command.get(event.command_name)
+        span, token = tracer.start_span(
+            f"mongodb.{event.command_name}",
+            "client",
+            attributes={
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.collection": collection if isinstance(collection, str) else None,
+            },
+        )
+        # Commands do not enclose other spans.
+        _current.reset(token)
+        with self._lock:
+            self._spans[self._key(event)] = span
+
+    def _end(self, event: CommandEvent, error: str | None) -> None:
+        with self._lock:
+            span = self._spans.pop(self._key(event), None)
+        if span is None:
+            return
+        if error is not None:
+            span.status = "error"
+            span.set_attribute("exception.message", error)
+        Tracer.get_instance().end_span(span)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._end(event, None)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._end(event, str(event.failure))
@@ -1,18 +1,78 @@
+import base64
+import json
+from collections import defaultdict
+from datetime import datetime
 from typing import Any
 
 import dramatiq
 import structlog
 from dramatiq.brokers.rabbitmq import RabbitmqBroker
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
 from pymongo.database import Database
 
 from dramax.common.configure_logger import configure_logger
-from dramax.common.exceptions import TaskDeferredError, TaskFailedError
+from dramax.common.exceptions import (
+    TaskDeferredError,
+    TaskFailedError,
+    TaskRevokedError,
+)
 from dramax.models.dramatiq.task import Status, Task
-from dramax.models.dramatiq.workflow import TaskInDatabase, WorkflowInDatabase
+from dramax.models.dramatiq.workflow import (
+    TaskInDatabase,
+    TaskRef,
+    WorkflowInDatabase,
+    WorkflowPage,
+    WorkflowStatus,
+    WorkflowSummary,
+)
 from dramax.services.mongo import MongoService
 
 configure_logger()
 
+# The dispatcher polls every parked and in-flight task, so it loads no specs.
+DISPATCH_FIELDS = {"id": 1, "parent": 1, "depends_on": 1, "metadata.author": 1}
+
+SUMMARY_FIELDS = {
+    "id": 1,
+    "metadata.author": 1,
+    "status": 1,
+    "created_at": 1,
+    "updated_at": 1,
+}
+
+# Fields of `TaskInDatabase` written while a task runs, cleared when its spec is
+# stored again. `splits` is kept, as it versions the specs of the shards.
+RUN_STATE_FIELDS = (
+    "updated_at",
+    "result",
+    "heartbeat_at",
+    "worker_id",
+    "requeues",
+    "shards",
+    "next_shard",
+    "done_shards",
+    "profile",
+)
+
+
+def encode_cursor(workflow: dict) -> str:
+    """Position of a listed workflow, in the `(created_at, id)` listing order."""
+    created_at = workflow.get("created_at")
+    position = [created_at.isoformat() if created_at else None, workflow["id"]]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime | None, str]:
+    try:
+        created_at, workflow_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return (
+            datetime.fromisoformat(created_at) if created_at else None,
+            str(workflow_id),
+        )
+    except (ValueError, TypeError) as e:
+        msg = f"Invalid cursor '{cursor}'"
+        raise ValueError(msg) from e
+
 
 class BaseManager:
     def __init__(self, db: Database | None = None) -> None:
@@ -41,6 +101,31 @@ class TaskManager(BaseManager):
             },
         )
 
+    def find_run_state(self, task_id: str, workflow_id: str) -> dict | None:
+        """`status` and `requeues` of a task, without its spec."""
+        return self.db.task.find_one(
+            {"id": task_id, "parent": workflow_id},
+            {"status": 1, "requeues": 1},
+        )
+
+    def store_spec(self, task_id: str, workflow_id: str, **fields) -> int:
+        """Create or replace a task, and return its new `spec_version`.
+
+        Versions only grow, so that workers never serve a replaced spec from
+        their caches, which are keyed by version. The state of a previous run
+        is discarded, see `RUN_STATE_FIELDS`.
+        """
+        update = {"$set": fields, "$inc": {"spec_version": 1}}
+        if unset := {key: "" for key in RUN_STATE_FIELDS if key not in fields}:
+            update["$unset"] = unset
+        task = self.db.task.find_one_and_update(
+            {"id": task_id, "parent": workflow_id},
+            update,
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return task["spec_version"]
+
     def create_or_update_from_id(
         self,
         task_id: str,
@@ -53,6 +138,203 @@ class TaskManager(BaseManager):
             upsert=True,
         )
 
+    def bulk_update(self, updates: dict[tuple[str, str], dict]) -> None:
+        """Set fields on many tasks, keyed by `(task_id, workflow_id)`, at once."""
+        self.db.task.bulk_write(
+            [
+                UpdateOne(
+                    {"id": task_id, "parent": workflow_id},
+                    {"$set": fields},
+                    upsert=True,
+                )
+                for (task_id, workflow_id), fields in updates.items()
+            ],
+            ordered=False,
+        )
+
+    def find_statuses(self, workflow_id: str) -> set[str]:
+        """Distinct statuses of the tasks of a workflow."""
+        return set(self.db.task.distinct("status", {"parent": workflow_id}))
+
+    def count_statuses(self, workflow_ids: list[str]) -> dict[str, dict[str, int]]:
+        """Number of tasks by status of each of the given workflows, in one query."""
+        groups = self.db.task.aggregate(
+            [
+                {"$match": {"parent": {"$in": workflow_ids}}},
+                {
+                    "$group": {
+                        "_id": {"parent": "$parent", "status": "$status"},
+                        "count": {"$sum": 1},
+                    },
+                },
+            ],
+        )
+        counts: dict[str, dict[str, int]] = defaultdict(dict)
+        for group in groups:
+            status = group["_id"]["status"]
+            # Enum members hash by name, so statuses are keyed by value.
+            status = Status(status).value if status else "unknown"
+            counts[group["_id"]["parent"]][status] = group["count"]
+        return counts
+
+    def find_stale(self, heartbeat_before: datetime) -> list:
+        """Get running tasks whose last heartbeat (or update) is older than given.
+
+        Fan-out tasks are left out once split: no worker runs them while their
+        shards do, and the shards have heartbeats of their own.
+        """
+        return self.find(
+            status=Status.STATUS_RUNNING,
+            shards=None,
+            **{
+                "$or": [
+                    {"heartbeat_at": {"$lt": heartbeat_before}},
+                    {
+                        # Null, e.g. after `reset`, or missing.
+                        "heartbeat_at": None,
+                        "updated_at": {"$lt": heartbeat_before},
+                    },
+                ],
+            },
+        )
+
+    def update_if_unchanged(self, task: TaskInDatabase, **extra_fields) -> bool:
+        """Update `task` only if it is still running with the same heartbeat.
+
+        Returns whether the update was applied, so concurrent reapers never
+        handle the same task twice.
+        """
+        result = self.db.task.update_one(
+            {
+                "id": task.id,
+                "parent": task.parent,
+                "status": Status.STATUS_RUNNING,
+                "heartbeat_at": task.heartbeat_at,
+            },
+            {"$set": extra_fields},
+        )
+        return result.modified_count == 1
+
+    def claim_next_shard(
+        self, task_id: str, workflow_id: str, shards: int
+    ) -> int | None:
+        """Atomically take the index of the next shard of a fan-out task to run.
+
+        Returns `None` once every shard has been dispatched.
+        """
+        task = self.db.task.find_one_and_update(
+            {"id": task_id, "parent": workflow_id, "next_shard": {"$lt": shards}},
+            {"$inc": {"next_shard": 1}},
+        )
+        return task["next_shard"] if task else None
+
+    def count_split(self, task_id: str, workflow_id: str) -> int:
+        """Count a split of a fan-out task. Returns the splits so far.
+
+        Shards are deleted and split again when a workflow is resumed, so the
+        count is the spec version of the new shards.
+        """
+        task = self.db.task.find_one_and_update(
+            {"id": task_id, "parent": workflow_id},
+            {"$inc": {"splits": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return task["splits"]
+
+    def complete_shard(self, task_id: str, workflow_id: str, shard: int) -> int | None:
+        """Record a finished shard of a fan-out task.
+
+        Returns the number of shards done so far, or `None` if the shard was
+        already recorded, e.g. when its message was redelivered.
+        """
+        task = self.db.task.find_one_and_update(
+            {"id": task_id, "parent": workflow_id},
+            {"$addToSet": {"done_shards": shard}},
+            return_document=ReturnDocument.BEFORE,
+        )
+        done = task.get("done_shards") or []
+        if shard in done:
+            return None
+        return len(done) + 1
+
+    def reset(self, task_id: str, workflow_id: str, **extra_fields) -> None:
+        """Put a finished task back to pending, discarding its previous run."""
+        self.create_or_update_from_id(
+            task_id,
+            workflow_id,
+            status=Status.STATUS_PENDING,
+            result=None,
+            heartbeat_at=None,
+            worker_id=None,
+            requeues=0,
+            shards=None,
+            next_shard=0,
+            done_shards=[],
+            **extra_fields,
+        )
+
+    def delete_shards(self, task_ids: list[str], workflow_id: str) -> None:
+        """Delete the shards of the given fan-out tasks, to be split again."""
+        self.db.task.delete_many(
+            {"parent": workflow_id, "metadata.shard_of": {"$in": task_ids}},
+        )
+
+    def find_parked(self) -> list[TaskRef]:
+        """Tasks waiting to be released by the dispatcher, oldest first."""
+        tasks = self.db.task.find(
+            {"status": Status.STATUS_PENDING, "parked": True},
+            DISPATCH_FIELDS,
+        ).sort("created_at", ASCENDING)
+        return [TaskRef(**task) for task in tasks]
+
+    def find_in_flight(self) -> list[TaskRef]:
+        """Tasks sent to the broker that have not finished yet."""
+        tasks = self.db.task.find(
+            {
+                "status": {"$in": [Status.STATUS_PENDING, Status.STATUS_RUNNING]},
+                "parked": {"$ne": True},
+            },
+            {"id": 1, "parent": 1},
+        )
+        return [TaskRef(**task) for task in tasks]
+
+    def count_unfinished(self) -> int:
+        """Tasks pending, parked or not, or running, across all workflows."""
+        return self.db.task.count_documents(
+            {"status": {"$in": [Status.STATUS_PENDING, Status.STATUS_RUNNING]}},
+        )
+
+    def count_finished_since(self, since: datetime) -> int:
+        return self.db.task.count_documents(
+            {
+                "status": {"$in": [Status.STATUS_DONE, Status.STATUS_FAILED]},
+                "updated_at": {"$gte": since},
+            },
+        )
+
+    def release(self, task_id: str, workflow_id: str, **extra_fields) -> bool:
+        """Take a parked task out of the dispatcher's backlog.
+
+        Returns whether it was still parked, so that a task is only released once.
+        """
+        result = self.db.task.update_one(
+            {
+                "id": task_id,
+                "parent": workflow_id,
+                "status": Status.STATUS_PENDING,
+                "parked": True,
+            },
+            {"$set": {"parked": False, **extra_fields}},
+        )
+        return result.modified_count == 1
+
+    def revoke_pending(self, workflow_id: str, **extra_fields) -> None:
+        """Mark the tasks of a workflow that have not started yet as revoked."""
+        self.db.task.update_many(
+            {"parent": workflow_id, "status": Status.STATUS_PENDING},
+            {"$set": {"status": Status.STATUS_REVOKED, **extra_fields}},
+        )
+
     def check_upstream(
         self,
         task: Task,
@@ -61,27 +343,27 @@ class TaskManager(BaseManager):
         broker: RabbitmqBroker,
     ) -> None:
         depends_on = task.depends_on
-        self.log.info("Checking upstream tasks")
         if depends_on:
-            self.log.info("Checking upstream tasks")
+            self.log.debug("Checking upstream tasks", depends_on=depends_on)
             tasks_in_db = self.find(parent=workflow_id)
             for task_in_db in tasks_in_db:
                 if task_in_db.id in depends_on:
                     if task_in_db.status == Status.STATUS_FAILED:
                         raise TaskFailedError(task.id, task_in_db.id)
+                    if task_in_db.status == Status.STATUS_REVOKED:
+                        raise TaskRevokedError(task.id, workflow_id)
                     if task_in_db.status in (
                         Status.STATUS_PENDING,
                         Status.STATUS_RUNNING,
                     ):
                         # Abruptly stop the current task execution and enqueue it again.
-                        msg = (
-                            "Re-enqueueing task because upstream task "
-                            "is not done yet %s"
+                        self.log.info(
+                            "Re-enqueueing task, upstream task not done yet",
+                            upstream_task_id=task_in_db.id,
                         )
-                        self.log.info(msg, depends_on)
                         broker.enqueue(message)
                         raise TaskDeferredError(task_in_db.id, depends_on)
-                    self.log.info(
+                    self.log.debug(
                         "Upstream task is done",
                         upstream_task_id=task_in_db.id,
                     )
@@ -94,9 +376,163 @@ class WorkflowManager(BaseManager):
             return WorkflowInDatabase(**workflow_in_db)
         return None
 
+    def find_page(
+        self,
+        author: str | None = None,
+        statuses: list[str] | None = None,
+        created_after: datetime | None = None,
+        created_before: datetime | None = None,
+        cursor: str | None = None,
+        limit: int = 100,
+    ) -> WorkflowPage:
+        """Summaries of workflows, newest first, `limit` per page.
+
+        Pages are delimited by the `(created_at, id)` of their last workflow rather
+        than skipped over, so each page is an index range scan however deep it is.
+        """
+        query: dict[str, Any] = {}
+        if author is not None:
+            query["metadata.author"] = author
+        if statuses:
+            query["status"] = {"$in": statuses}
+        created_at: dict[str, datetime] = {}
+        if created_after is not None:
+            created_at["$gte"] = created_after
+        if created_before is not None:
+            created_at["$lt"] = created_before
+        if created_at:
+            query["created_at"] = created_at
+        if cursor is not None:
+            last_created_at, last_id = decode_cursor(cursor)
+            query["$or"] = [
+                {"created_at": {"$lt": last_created_at}},
+                {"created_at": last_created_at, "id": {"$lt": last_id}},
+            ]
+
+        # One more workflow than asked tells whether there is a next page.
+        workflows = list(
+            self.db.workflow.find(query, SUMMARY_FIELDS)
+            .sort([("created_at", DESCENDING), ("id", DESCENDING)])
+            .limit(limit + 1),
+        )
+        next_cursor = (
+            encode_cursor(workflows[limit - 1]) if len(workflows) > limit else None
+        )
+        return WorkflowPage(
+            items=self._summaries(workflows[:limit]),
+            next_cursor=next_cursor,
+        )
+
+    def find_summaries(self, workflow_ids: list[str]) -> list[WorkflowSummary]:
+        """Summaries of the given workflows, for those in the `workflow` collection."""
+        workflows = self.db.workflow.find(
+            {"id": {"$in": workflow_ids}},
+            SUMMARY_FIELDS,
+        )
+        return self._summaries(list(workflows))
+
+    def _summaries(self, workflows: list[dict]) -> list[WorkflowSummary]:
+        counts = TaskManager(self.db).count_statuses([w["id"] for w in workflows])
+        return [
+            WorkflowSummary(
+                id=w["id"],
+                author=w.get("metadata", {}).get("author", "anonymous"),
+                status=w.get("status", WorkflowStatus.STATUS_PENDING),
+                created_at=w.get("created_at"),
+                updated_at=w.get("updated_at"),
+                tasks=counts.get(w["id"], {}),
+            )
+            for w in workflows
+        ]
+
+    def find_revoked_ids(self, since: datetime) -> set[str]:
+        """Get the ids of workflows revoked after `since`."""
+        workflows = self.db.workflow.find(
+            {"is_revoked": True, "revoked_at": {"$gte": since}},
+            {"id": 1},
+        )
+        return {workflow["id"] for workflow in workflows}
+
+    def find_revocation_flags(self, workflow_ids: set[str]) -> dict[str, bool]:
+        """Whether each of the given workflows is revoked, for those that exist."""
+        workflows = self.db.workflow.find(
+            {"id": {"$in": list(workflow_ids)}},
+            {"id": 1, "is_revoked": 1},
+        )
+        return {w["id"]: w.get("is_revoked", False) for w in workflows}
+
+    def find_finished_before(self, before: datetime, limit: int) -> list[str]:
+        """Ids of up to `limit` workflows that finished before `before`.
+
+        Workflows that still have pending or running tasks, e.g. failed ones
+        whose other branches are executing, are left out.
+        """
+        workflows = self.db.workflow.find(
+            {
+                "status": {
+                    "$in": [
+                        WorkflowStatus.STATUS_DONE,
+                        WorkflowStatus.STATUS_FAILED,
+                        WorkflowStatus.STATUS_REVOKED,
+                    ],
+                },
+                "updated_at": {"$lt": before},
+            },
+            {"id": 1},
+        ).limit(limit)
+        workflow_ids = [workflow["id"] for workflow in workflows]
+        busy = set(
+            self.db.task.distinct(
+                "parent",
+                {
+                    "parent": {"$in": workflow_ids},
+                    "status": {"$in": [Status.STATUS_PENDING, Status.STATUS_RUNNING]},
+                },
+            )
+        )
+        return [workflow_id for workflow_id in workflow_ids if workflow_id not in busy]
+
+    def find_max_parallelism(self, workflow_ids: set[str]) -> dict[str, int]:
+        """`max_parallelism` of the given workflows, for those that set it."""
+        workflows = self.db.workflow.find(
+            {"id": {"$in": list(workflow_ids)}},
+            {"id": 1, "max_parallelism": 1},
+        )
+        return {
+            w["id"]: w["max_parallelism"]
+            for w in workflows
+            if w.get("max_parallelism") is not None
+        }
+
+    def claim_resume(self, workflow_id: str, **extra_fields) -> bool:
+        """Move a failed workflow back to pending and count the resume.
+
+        Atomic, so of concurrent resumes only the one that gets `True` goes on.
+        """
+        workflow = self.db.workflow.find_one_and_update(
+            {"id": workflow_id, "status": WorkflowStatus.STATUS_FAILED},
+            {
+                "$set": {"status": WorkflowStatus.STATUS_PENDING, **extra_fields},
+                "$inc": {"resumes": 1},
+            },
+        )
+        return workflow is not None
+
     def create_or_update_from_id(self, workflow_id: str, **extra_fields) -> None:
         self.db.workflow.update_one(
             {"id": workflow_id},
             {"$set": extra_fields},
             upsert=True,
         )
+
+    def bulk_update(self, updates: dict[str, dict]) -> None:
+        """Set fields on many workflows, keyed by id, at once."""
+        if not updates:
+            return
+        self.db.workflow.bulk_write(
+            [
+                UpdateOne({"id": workflow_id}, {"$set": fields})
+                for workflow_id, fields in updates.items()
+            ],
+            ordered=False,
+        )
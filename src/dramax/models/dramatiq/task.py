@@ -1,19 +1,43 @@
+import re
 import shutil
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
 from typing import Any
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, root_validator, validator
 from structlog import get_logger
 
+from dramax.common.cancellation import CancellationToken
 from dramax.common.exceptions import (
     FileNotFoundForUploadError,
     InputDownloadError,
+    TaskRevokedError,
     UploadError,
 )
+from dramax.common.profiling import ProfileSummary
 from dramax.common.settings import settings
-from dramax.services.minio import MinioService
+from dramax.services.artifacts import (
+    download_collection,
+    is_collection,
+    split_glob,
+    upload_collection,
+)
+from dramax.services.storage import get_storage
+
+MEMORY_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+def parse_memory(value: int | str | None) -> int | None:
+    """Convert Docker-style memory sizes (e.g. `512m`, `2g`) to bytes."""
+    if value is None or isinstance(value, int):
+        return value
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?", str(value).strip().lower())
+    if not match:
+        msg = f"Invalid memory size: {value!r}"
+        raise ValueError(msg)
+    number, unit = match.groups()
+    return int(float(number) * MEMORY_UNITS[unit])
 
 
 class Status(str, Enum):
@@ -21,6 +45,7 @@ class Status(str, Enum):
     STATUS_RUNNING: str = "running"
     STATUS_FAILED: str = "failure"
     STATUS_DONE: str = "success"
+    STATUS_REVOKED: str = "revoked"
 
 
 class Result(BaseModel):
@@ -32,7 +57,54 @@ class Options(BaseModel):
     on_fail_force_interruption: bool = True
     on_fail_remove_local_dir: bool = True
     on_finish_remove_local_dir: bool = False  # TODO Check production True
-    queue_name: str | None = None
+    queue_name: str | None = None  # Overrides the routing rules, see `route`.
+    labels: list[str] = []
+    warm_container: bool = False  # Run in a pooled container, see `ContainerPool`.
+    # Resources reserved for Docker tasks, enforced as container limits and used by
+    # workers to admit tasks against their local budget.
+    cpus: float | None = None
+    memory: int | None = None  # Bytes, Docker-style strings such as "2g" are accepted.
+    profile: bool = False  # Profile the task, see `dramax.common.profiling`.
+
+    @validator("memory", pre=True)
+    def memory_to_bytes(cls, memory: int | str | None) -> int | None:
+        return parse_memory(memory)
+
+
+SPLIT_MODES = ("files", "lines", "bytes")
+
+
+class FanOut(BaseModel):
+    """Run a task once per shard of one of its inputs, see `dramax.worker.fanout`.
+
+    Inputs of downstream tasks coming from a fan-out task are expanded into one
+    file per shard, so a single reduce task can depend on all of them.
+    """
+
+    input: str  # Name (or path) of the input to split.
+    # "files" splits the objects under the input prefix, "lines" and "bytes" split
+    # the input file itself.
+    split_by: str = "files"
+    shards: int | None = None  # Number of shards...
+    shard_size: int | None = None  # ...or files, lines or bytes per shard.
+    max_concurrency: int | None = None  # Shards running at the same time.
+
+    @validator("split_by")
+    def split_by_is_known(cls, split_by: str) -> str:
+        if split_by not in SPLIT_MODES:
+            msg = f"split_by must be one of {', '.join(SPLIT_MODES)}"
+            raise ValueError(msg)
+        return split_by
+
+    @root_validator(skip_on_failure=True)
+    def shards_or_shard_size(cls, values: dict) -> dict:
+        if (values["shards"] is None) == (values["shard_size"] is None):
+            msg = "exactly one of shards and shard_size must be set"
+            raise ValueError(msg)
+        if (values["shards"] or values["shard_size"]) < 1:
+            msg = "shards and shard_size must be positive"
+            raise ValueError(msg)
+        return values
 
 
 class Parameter(BaseModel):
@@ -53,6 +125,28 @@ class File(BaseModel):
     source: str | None = None
     sourcePath: str | None = None  # noqa: N815 - Already defined in previous versions
     path: str
+    # Directories (trailing "/") and globs are stored as a single tar archive
+    # instead of one object per file, see `dramax.services.artifacts`.
+    archive: bool = False
+
+    @property
+    def is_collection(self) -> bool:
+        """Whether the artifact is a directory or a glob rather than a file."""
+        return any(is_collection(p) for p in (self.path, self.sourcePath) if p)
+
+    def split_collection(self) -> tuple["File", str | None]:
+        """Base directory of a collection, as a `File`, and its glob pattern."""
+        local_base, pattern = split_glob(self.path)
+        source_path = None
+        if self.source and self.sourcePath:
+            source_path, pattern = split_glob(self.sourcePath)
+        base = File(
+            name=self.name,
+            path=local_base,
+            source=self.source,
+            sourcePath=source_path,
+        )
+        return base, pattern
 
     @staticmethod
     def _ensure_relative(p: str) -> Path:
@@ -95,6 +189,22 @@ class Task(BaseModel):
     options: Options = Options()
     metadata: dict = {}
     depends_on: list[str] = []
+    fan_out: FanOut | None = None
+
+    @validator("fan_out")
+    def fan_out_input_exists(
+        cls, fan_out: FanOut | None, values: dict
+    ) -> FanOut | None:
+        if fan_out and fan_out.input not in {
+            name for f in values.get("inputs", []) for name in (f.name, f.path)
+        }:
+            msg = f"fan_out input '{fan_out.input}' is not an input of the task"
+            raise ValueError(msg)
+        return fan_out
+
+    def get_input(self, name: str) -> File:
+        """Return the input artifact with the given name or path."""
+        return next(f for f in self.inputs if name in (f.name, f.path))
 
     @validator("name")
     def name_validations(cls, name: str) -> str:
@@ -106,23 +216,36 @@ class Task(BaseModel):
             raise ValueError(msg)
         return name
 
-    def download_inputs(self, workdir: str) -> None:
+    def download_inputs(
+        self,
+        workdir: str,
+        token: CancellationToken | None = None,
+    ) -> None:
         log = get_logger()
         for artifact in self.inputs:
             object_name = artifact.get_object_name(workdir)
             file_path = artifact.get_full_path(workdir)
-            log.info("Object_name", object_name=object_name)
-            log.info("file_path", file_path=file_path)
+            log.debug("Downloading input", object_name=object_name, file_path=file_path)
 
             try:
-                MinioService.get_instance().get_object(
+                if artifact.is_collection:
+                    download_collection(artifact, workdir, token)
+                    continue
+                get_storage().get_object(
                     object_name=object_name,
                     file_path=file_path,
+                    token=token,
                 )
+            except TaskRevokedError:
+                raise
             except Exception as e:
                 raise InputDownloadError(object_name, file_path, e) from e
 
-    def upload_outputs(self, workdir: str) -> None:
+    def upload_outputs(
+        self,
+        workdir: str,
+        token: CancellationToken | None = None,
+    ) -> None:
         for artifact in self.outputs:
             object_name = artifact.get_object_name(workdir)
             file_path = artifact.get_full_path(workdir)
@@ -130,10 +253,16 @@ class Task(BaseModel):
                 raise FileNotFoundForUploadError(file_path)
 
             try:
-                MinioService.get_instance().upload_object(
+                if artifact.is_collection:
+                    upload_collection(artifact, workdir, token)
+                    continue
+                get_storage().upload_object(
                     object_path=object_name,
                     file_path=file_path,
+                    token=token,
                 )
+            except TaskRevokedError:
+                raise
             except Exception as e:
                 raise UploadError(object_name, workdir, e) from e
 
@@ -155,7 +284,7 @@ class Task(BaseModel):
             raise
 
         try:
-            MinioService.get_instance().upload_object(
+            get_storage().upload_object(
                 object_path=str(log_file_path),  # nombre del objeto remoto en MinIO
                 file_path=str(log_file_path),  # ruta local del archivo
             )
@@ -176,6 +305,20 @@ class TaskInDatabase(Task):
     updated_at: datetime | None = None
     result: Result | None = None
     status: Status = Status.STATUS_PENDING
+    heartbeat_at: datetime | None = None
+    worker_id: str | None = None
+    requeues: int = 0
+    # Bumped whenever the task is stored again, see `TaskManager.store_spec`.
+    # Shards are at the split count of their fan-out task instead.
+    spec_version: int = 1
+    parked: bool = False  # Waiting for `dramax dispatch` to release it.
+    # Fan-out bookkeeping, see `dramax.worker.fanout`. Shards of the task have
+    # `shard_of` and `shard` in their metadata.
+    shards: int | None = None
+    next_shard: int = 0
+    done_shards: list[int] = []  # Indexes, so that redeliveries count once.
+    splits: int = 0
+    profile: ProfileSummary | None = None  # Of the last profiled run.
 
     class Config:
         use_enum_values = True
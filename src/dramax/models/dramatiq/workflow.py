@@ -5,17 +5,36 @@ from enum import Enum
 from pydantic import BaseModel, validator
 from pydantic.fields import Field
 
-from dramax.models.dramatiq.task import Task, TaskInDatabase
+from dramax.common.settings import settings
+from dramax.models.dramatiq.task import Status, Task, TaskInDatabase
 
 
 class WorkflowStatus(str, Enum):
     STATUS_REVOKED: str = "revoked"
     STATUS_PENDING: str = "pending"
+    STATUS_PARKED: str = "parked"  # Accepted over capacity, waiting for admission.
     STATUS_RUNNING: str = "running"
     STATUS_FAILED: str = "failure"
     STATUS_DONE: str = "success"
 
 
+def workflow_status(task_statuses: set[str], is_revoked: bool) -> WorkflowStatus:
+    """Status of a workflow given the distinct statuses of its tasks."""
+    # Enum members hash by name, so statuses are compared by value.
+    task_statuses = {Status(status).value for status in task_statuses}
+    if is_revoked:
+        return WorkflowStatus.STATUS_REVOKED
+    if task_statuses <= {Status.STATUS_DONE.value}:
+        return WorkflowStatus.STATUS_DONE
+    if Status.STATUS_FAILED.value in task_statuses:
+        return WorkflowStatus.STATUS_FAILED
+    if Status.STATUS_RUNNING.value in task_statuses and (
+        Status.STATUS_PENDING.value not in task_statuses
+    ):
+        return WorkflowStatus.STATUS_RUNNING
+    return WorkflowStatus.STATUS_PENDING
+
+
 class WorkflowMetadata(BaseModel):
     author: str = "anonymous"
 
@@ -28,6 +47,20 @@ class Workflow(BaseModel):
     label: str = ""
     tasks: list[Task] = []
     metadata: WorkflowMetadata = WorkflowMetadata()
+    # Tasks of the workflow released to workers at once, see `dramax dispatch`.
+    max_parallelism: int | None = None
+
+    @validator("max_parallelism")
+    def max_parallelism_positive(cls, max_parallelism: int | None) -> int | None:
+        if max_parallelism is not None and max_parallelism < 1:
+            msg = "max_parallelism must be at least 1"
+            raise ValueError(msg)
+        return max_parallelism
+
+    @property
+    def parks_tasks(self) -> bool:
+        """Whether tasks wait in MongoDB for `dramax dispatch` to release them."""
+        return settings.fair_share or self.max_parallelism is not None
 
     @validator("tasks")
     def task_ids_not_duplicated(cls, tasks: list[Task]) -> list[Task]:
@@ -44,6 +77,11 @@ class WorkflowInDatabase(BaseModel):
     updated_at: datetime | None = None
     status: WorkflowStatus = WorkflowStatus.STATUS_PENDING
     is_revoked: bool = False
+    revoked_at: datetime | None = None
+    resumed_at: datetime | None = None
+    resumes: int = 0
+    max_parallelism: int | None = None
+    archived_at: datetime | None = None
 
     class Config:
         use_enum_values = True
@@ -51,3 +89,52 @@ class WorkflowInDatabase(BaseModel):
 
 class ExecutionId(BaseModel):
     id: str
+
+
+class ResumedWorkflow(BaseModel):
+    id: str
+    tasks: list[str]  # Ids of the tasks run again, in dispatch order.
+
+
+class TaskRef(BaseModel):
+    """A task as scheduled by the dispatcher, without its spec."""
+
+    id: str
+    parent: str  # workflow id
+    depends_on: list[str] = []
+    metadata: dict = {}  # Only `author`.
+
+
+class WorkflowSummary(BaseModel):
+    id: str
+    author: str = "anonymous"
+    status: WorkflowStatus = WorkflowStatus.STATUS_PENDING
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    archived_at: datetime | None = None
+    tasks: dict[str, int] = {}  # Number of tasks by status.
+
+    class Config:
+        use_enum_values = True
+
+
+class WorkflowPage(BaseModel):
+    items: list[WorkflowSummary]
+    # Opaque position after the last item, to pass as `cursor` for the next page.
+    next_cursor: str | None = None
+
+
+class BulkStatusRequest(BaseModel):
+    ids: list[str]
+
+    @validator("ids")
+    def ids_within_limit(cls, ids: list[str]) -> list[str]:
+        if len(ids) > settings.bulk_status_max_ids:
+            msg = f"At most {settings.bulk_status_max_ids} ids are resolved at once"
+            raise ValueError(msg)
+        return ids
+
+
+class BulkStatus(BaseModel):
+    items: list[WorkflowSummary]
+    missing: list[str] = []
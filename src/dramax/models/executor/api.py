@@ -6,8 +6,12 @@ from zipfile import ZipFile
 import requests
 from structlog import get_logger
 
+from dramax.common.cancellation import CancellationToken
+from dramax.common.tracing import TRACEPARENT, inject, traced
 from dramax.models.dramatiq.task import Task, UnpackedParams
 
+CHUNK_SIZE = 1024 * 1024
+
 
 def unpack_parameters(param: dict) -> UnpackedParams:
     headers_key, headers_value = param.get("headers").split(": ")
@@ -26,20 +30,55 @@ def unpack_parameters(param: dict) -> UnpackedParams:
     )
 
 
-def api_execute(task: Task, workdir: str) -> str:
+def read_content(
+    response: requests.Response,
+    token: CancellationToken | None = None,
+) -> bytes:
+    """Read a streamed response body, aborting the transfer when `token` is cancelled."""
+    if token is None:
+        return response.content
+    token.on_cancel(response.close)
+    try:
+        chunks = []
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            token.raise_if_cancelled()
+            chunks.append(chunk)
+    except requests.RequestException:
+        token.raise_if_cancelled()
+        raise
+    finally:
+        token.remove_callback(response.close)
+    token.raise_if_cancelled()
+    return b"".join(chunks)
+
+
+@traced("http.request", "client", url="task.url", task_id="task.id")
+def api_execute(
+    task: Task,
+    workdir: str,
+    token: CancellationToken | None = None,
+) -> str:
     raw_params = {p["name"]: p["value"] for p in task.parameters}
     unpacked_params = unpack_parameters(raw_params)
     method = unpacked_params.method
+    # Lets the called service continue the trace of the task.
+    if traceparent := inject():
+        unpacked_params.headers[TRACEPARENT] = traceparent
 
     if method == "GET":
-        result = get(task, unpacked_params, workdir)
+        result = get(task, unpacked_params, workdir, token)
     elif method == "POST":
-        result = post(task, unpacked_params, workdir)
+        result = post(task, unpacked_params, workdir, token)
 
     return result
 
 
-def get(task: Task, unpacked_params: UnpackedParams, workdir: str) -> str:
+def get(
+    task: Task,
+    unpacked_params: UnpackedParams,
+    workdir: str,
+    token: CancellationToken | None = None,
+) -> str:
     log = get_logger("dramax.api_executor.get")
     log.bind(url=task.url, method="GET")
     try:
@@ -49,8 +88,10 @@ def get(task: Task, unpacked_params: UnpackedParams, workdir: str) -> str:
                 headers=unpacked_params.headers,
                 timeout=unpacked_params.timeout,
                 auth=unpacked_params.auth,
+                stream=True,
             )
             response.raise_for_status()
+            content = read_content(response, token)
 
             if not task.outputs:
                 message = (
@@ -65,7 +106,7 @@ def get(task: Task, unpacked_params: UnpackedParams, workdir: str) -> str:
                 Path(file_path).parent.mkdir(parents=True, exist_ok=True)
 
                 with Path.open(file_path, "wb") as f:
-                    f.write(response.content)
+                    f.write(content)
 
                 msg = (
                     f"[SUCCESS] File downloaded with status {response.status_code} "
@@ -86,7 +127,12 @@ def get(task: Task, unpacked_params: UnpackedParams, workdir: str) -> str:
         raise
 
 
-def post(task: Task, unpacked_params: UnpackedParams, workdir: str) -> str:
+def post(
+    task: Task,
+    unpacked_params: UnpackedParams,
+    workdir: str,
+    token: CancellationToken | None = None,
+) -> str:
     log = get_logger("dramax.api_executor.post")
     log = log.bind(url=task.url, method="POST")
     headers = unpacked_params.headers
@@ -148,6 +194,7 @@ def post(task: Task, unpacked_params: UnpackedParams, workdir: str) -> str:
                 data=data,
                 auth=unpacked_params.auth,
                 timeout=unpacked_params.timeout,
+                stream=True,
             )
 
         else:
@@ -157,9 +204,11 @@ def post(task: Task, unpacked_params: UnpackedParams, workdir: str) -> str:
                 auth=unpacked_params.auth,
                 json=unpacked_params.body,
                 timeout=unpacked_params.timeout,
+                stream=True,
             )
 
         response.raise_for_status()
+        content = read_content(response, token)
 
         # PARTE ACTUALIZADA DEL CÓDIGO SIN COMPROBAR
         if task.outputs and len(task.outputs) > 1:
@@ -167,7 +216,7 @@ def post(task: Task, unpacked_params: UnpackedParams, workdir: str) -> str:
                 zip_path = Path(tmpdir) / "response.zip"
                 zip_path.parent.mkdir(parents=True, exist_ok=True)
 
-                zip_path.write_bytes(response.content)
+                zip_path.write_bytes(content)
 
                 with ZipFile(zip_path, "r") as zip_ref:
                     zip_ref.extractall(tmpdir)
@@ -197,7 +246,7 @@ def post(task: Task, unpacked_params: UnpackedParams, workdir: str) -> str:
             Path(file_path).parent.mkdir(parents=True, exist_ok=True)
 
             with Path.open(file_path, "wb") as f:
-                f.write(response.content)
+                f.write(content)
 
             msg = (
                 f"[SUCCESS] POST response saved to {len(task.outputs)} locations "
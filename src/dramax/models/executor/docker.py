@@ -1,27 +1,32 @@
+import shlex
+from pathlib import Path
+
 import docker
 
+from dramax.common.cancellation import CancellationToken
 from dramax.common.exceptions import DockerExecutionError
 from dramax.common.settings import settings
+from dramax.common.tracing import traced
 from dramax.models.dramatiq.task import Task
+from dramax.models.executor.pool import ContainerPool
+from dramax.services.storage import get_storage, unshare_files
 
 
-def docker_execute(task: Task, workdir: str) -> str:
+@traced("docker.run", "client", image="task.image", task_id="task.id")
+def docker_execute(
+    task: Task,
+    workdir: str,
+    token: CancellationToken | None = None,
+) -> str:
     """Runs a docker container with the given parameters.
 
     :param image: The docker image to run.
     :param parameters: The parameters to pass to the container.
     :param environment: The environment variables to pass to the container.
     :param local_dir: The local directory to mount in the container.
+    :param token: Cancellation token, stops the container when cancelled.
     :return: The logs of the container.
     """
-    client = docker.from_env()
-    client.login(
-        registry=settings.docker_registry,
-        username=settings.docker_username,
-        password=settings.docker_password,
-    )
-
-    client.images.pull(task.image)
 
     def create_cmd_string() -> str:
         """Builds the command to run in the container."""
@@ -33,16 +38,48 @@ def docker_execute(task: Task, workdir: str) -> str:
 
     cmd_string = create_cmd_string()
 
+    if task.options.warm_container or settings.docker_pool_enabled:
+        return pooled_execute(task, workdir, cmd_string, token)
+
+    client = docker.from_env()
+    client.login(
+        registry=settings.docker_registry,
+        username=settings.docker_username,
+        password=settings.docker_password,
+    )
+
+    client.images.pull(task.image)
+
     def create_volumes() -> dict:
         """Builds the volumes to mount in the container.
 
         By default, volumes are `/mnt/inputs/`, `/mnt/outputs/` and `/mnt/shared/`.
         """
-        return {
+        volumes = {
             f"{workdir}/mnt/inputs": {"bind": "/mnt/inputs/", "mode": "rw"},
             f"{workdir}/mnt/outputs": {"bind": "/mnt/outputs/", "mode": "rw"},
             f"{workdir}/mnt/shared": {"bind": "/mnt/shared/", "mode": "rw"},
         }
+        if get_storage().links_files:
+            # Inputs may be hard links to stored artifacts: mount them read-only
+            # so that containers, usually running as root, cannot alter them.
+            for artifact in task.inputs:
+                relative = Path(artifact.get_full_path(workdir)).relative_to(workdir)
+                if relative.parts[0] == "mnt":
+                    volumes[f"{workdir}/{relative}"] = {
+                        "bind": f"/{relative}",
+                        "mode": "ro",
+                    }
+        return volumes
+
+    def create_limits() -> dict:
+        """Builds the container resource limits declared in the task options."""
+        limits = {}
+        if task.options.cpus:
+            limits["nano_cpus"] = int(task.options.cpus * 1e9)
+        if task.options.memory:
+            limits["mem_limit"] = task.options.memory
+        return limits
 
     container = client.containers.run(
         image=task.image,
@@ -51,7 +88,14 @@ def docker_execute(task: Task, workdir: str) -> str:
         environment=task.environment,
         detach=True,
         tty=True,
+        **create_limits(),
     )
+
+    def stop_container() -> None:
+        container.stop(timeout=10)
+
+    if token:
+        token.on_cancel(stop_container)
     result = container.wait()
     logs = container.logs().decode("utf-8")
 
@@ -61,8 +105,48 @@ def docker_execute(task: Task, workdir: str) -> str:
     container.stop()
     container.remove(v=True)
 
+    if token:
+        token.remove_callback(stop_container)
+        token.raise_if_cancelled()
+
     if result["StatusCode"] != 0:
         error_message = f"Container failed:\n{logs}"
         raise DockerExecutionError(error_message)
 
     return logs
+
+
+@traced("docker.exec", "client", image="task.image", task_id="task.id")
+def pooled_execute(
+    task: Task,
+    workdir: str,
+    cmd_string: str,
+    token: CancellationToken | None = None,
+) -> str:
+    """Runs the task command with `docker exec` in a warm container of its image.
+
+    The `/mnt/inputs/`, `/mnt/outputs/` and `/mnt/shared/` layout of the task is
+    preserved, but the container is kept alive and reused by later tasks.
+    """
+    if get_storage().links_files:
+        # The data directory is mounted read-write for the lifetime of the
+        # container, so inputs cannot be mounted read-only as in `execute`: hard
+        # links to stored artifacts are replaced by private copies instead.
+        for artifact in task.inputs:
+            unshare_files(Path(artifact.get_full_path(workdir)))
+    exit_code, logs = ContainerPool.get_instance().execute(
+        image=task.image,
+        command=shlex.split(cmd_string),
+        workdir=workdir,
+        environment=task.environment,
+        cpus=task.options.cpus,
+        memory=task.options.memory,
+        token=token,
+    )
+    logs = f"{cmd_string}\n{logs}"
+
+    if exit_code != 0:
+        error_message = f"Container failed:\n{logs}"
+        raise DockerExecutionError(error_message, status_code=exit_code)
+
+    return logs
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import atexit
+import os
+import shlex
+import threading
+import time
+from pathlib import Path
+
+import docker
+from docker.errors import DockerException
+from docker.models.containers import Container
+from structlog import get_logger
+
+from dramax.common.cancellation import CancellationToken
+from dramax.common.settings import settings
+
+log = get_logger("dramax.docker.pool")
+
+# Host data directory of the author of a pool, as seen from inside its containers.
+# Task directories are linked from here into `/mnt/inputs`, `/mnt/outputs` and
+# `/mnt/shared` on each exec.
+POOL_DATA_DIR = "/mnt/.dramax"
+POOL_LABEL = "dramax.pool"
+POOL_AUTHOR_LABEL = "dramax.pool.author"
+MOUNTS = ("inputs", "outputs", "shared")
+
+# Keeps the container alive, and exits promptly on `docker stop`.
+KEEPALIVE = "trap 'exit 0' TERM; while :; do sleep 1; done"
+
+
+PoolKey = tuple[str, float | None, int | None, str]  # Image, CPUs, memory, author.
+
+
+class PooledContainer:
+    def __init__(
+        self, key: PoolKey, container: Container, entrypoint: list[str]
+    ) -> None:
+        self.key = key
+        self.container = container
+        self.entrypoint = entrypoint
+        self.last_used = time.monotonic()
+
+
+class ContainerPool:
+    """Long-lived containers per image, reused across tasks through `docker exec`.
+
+    Containers are grouped by image, resource limits and author, with at most
+    `max_size` containers per group. Idle containers are health checked before
+    being handed out, and removed by a background thread after `idle_timeout`
+    seconds.
+
+    A container mounts the data directory of its author only, since mounts
+    cannot change while it runs. Tasks are therefore isolated from the tasks of
+    other authors, but not from the other tasks of the same author, as they would
+    be in containers of their own.
+    """
+
+    _instance: ContainerPool | None = None
+
+    def __init__(
+        self,
+        client: docker.DockerClient | None = None,
+        max_size: int | None = None,
+        idle_timeout: int | None = None,
+    ) -> None:
+        self.client = client or docker.from_env()
+        self.max_size = max_size or settings.docker_pool_max_size
+        self.idle_timeout = idle_timeout or settings.docker_pool_idle_timeout
+        self._idle: dict[PoolKey, list[PooledContainer]] = {}
+        self._size: dict[PoolKey, int] = {}
+        self._condition = threading.Condition()
+        self._pid: int | None = None
+
+    @classmethod
+    def get_instance(cls) -> ContainerPool:
+        if cls._instance is None:
+            cls._instance = cls()
+            atexit.register(cls._instance.shutdown)
+        return cls._instance
+
+    def _ensure_evictor(self) -> None:
+        # Checked against the pid too, as threads do not survive a fork.
+        if self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(
+                target=self._evict_forever,
+                name="dramax-pool-evictor",
+                daemon=True,
+            ).start()
+
+    def _evict_forever(self) -> None:
+        while True:
+            time.sleep(self.idle_timeout / 2)
+            try:
+                self.evict_idle()
+            except Exception as e:  # noqa: BLE001
+                log.warning("Failed to evict idle pooled containers", error=str(e))
+
+    def _start(self, key: PoolKey) -> PooledContainer:
+        image, cpus, memory, author = key
+        self.client.login(
+            registry=settings.docker_registry,
+            username=settings.docker_username,
+            password=settings.docker_password,
+        )
+        pulled = self.client.images.pull(image)
+        entrypoint = pulled.attrs.get("Config", {}).get("Entrypoint") or []
+        limits = {}
+        if cpus:
+            limits["nano_cpus"] = int(cpus * 1e9)
+        if memory:
+            limits["mem_limit"] = memory
+        container = self.client.containers.run(
+            image=image,
+            entrypoint=["/bin/sh", "-c"],
+            command=[KEEPALIVE],
+            volumes={
+                str(Path(settings.data_dir, author)): {
+                    "bind": POOL_DATA_DIR,
+                    "mode": "rw",
+                },
+            },
+            labels={POOL_LABEL: image, POOL_AUTHOR_LABEL: author},
+            detach=True,
+            **limits,
+        )
+        log.info(
+            "Started pooled container",
+            image=image,
+            author=author,
+            container=container.short_id,
+        )
+        return PooledContainer(key, container, list(entrypoint))
+
+    @staticmethod
+    def _is_healthy(pooled: PooledContainer) -> bool:
+        try:
+            pooled.container.reload()
+        except DockerException:
+            return False
+        return pooled.container.status == "running"
+
+    def _remove(self, pooled: PooledContainer) -> None:
+        try:
+            pooled.container.remove(force=True, v=True)
+        except DockerException as e:
+            log.warning("Failed to remove pooled container", error=str(e))
+
+    def acquire(
+        self,
+        image: str,
+        cpus: float | None = None,
+        memory: int | None = None,
+        author: str = "",
+    ) -> PooledContainer:
+        """Return a healthy idle container for `image`, starting one if allowed.
+
+        Blocks while the pool of `image` with these limits and author is at
+        `max_size`.
+        """
+        key = (image, cpus, memory, author)
+        self._ensure_evictor()
+        self.evict_idle()
+        while True:
+            with self._condition:
+                idle = self._idle.setdefault(key, [])
+                candidate = idle.pop() if idle else None
+                if candidate is None:
+                    if self._size.get(key, 0) >= self.max_size:
+                        self._condition.wait()
+                        continue
+                    # Reserve the slot before starting the container outside the lock.
+                    self._size[key] = self._size.get(key, 0) + 1
+
+            if candidate is None:
+                try:
+                    return self._start(key)
+                except Exception:
+                    self._discard_slot(key)
+                    raise
+
+            if self._is_healthy(candidate):
+                return candidate
+
+            log.warning("Discarding unhealthy pooled container", image=image)
+            self._remove(candidate)
+            self._discard_slot(key)
+
+    def release(self, pooled: PooledContainer, healthy: bool = True) -> None:
+        """Return a container to the pool, or remove it if it is no longer usable."""
+        if not healthy:
+            self._remove(pooled)
+            self._discard_slot(pooled.key)
+            return
+        pooled.last_used = time.monotonic()
+        with self._condition:
+            self._idle.setdefault(pooled.key, []).append(pooled)
+            self._condition.notify_all()
+
+    def _discard_slot(self, key: PoolKey) -> None:
+        with self._condition:
+            self._size[key] = self._size.get(key, 1) - 1
+            self._condition.notify_all()
+
+    def evict_idle(self) -> None:
+        """Remove containers that have been idle for longer than `idle_timeout`."""
+        now = time.monotonic()
+        expired: list[PooledContainer] = []
+        with self._condition:
+            for idle in self._idle.values():
+                expired.extend(p for p in idle if now - p.last_used > self.idle_timeout)
+                idle[:] = [p for p in idle if now - p.last_used <= self.idle_timeout]
+        for pooled in expired:
+            log.info("Evicting idle pooled container", image=pooled.key[0])
+            self._remove(pooled)
+            self._discard_slot(pooled.key)
+
+    def shutdown(self) -> None:
+        """Remove every idle container. Called at interpreter exit."""
+        with self._condition:
+            idle = [pooled for items in self._idle.values() for pooled in items]
+            self._idle.clear()
+        for pooled in idle:
+            self._remove(pooled)
+            self._discard_slot(pooled.key)
+
+    def execute(
+        self,
+        image: str,
+        command: list[str],
+        workdir: str,
+        environment: dict | None = None,
+        cpus: float | None = None,
+        memory: int | None = None,
+        token: CancellationToken | None = None,
+    ) -> tuple[int, str]:
+        """Run `command` in a pooled container with the task directories of `workdir`.
+
+        `workdir` is `<data_dir>/<author>/<workflow>/<task>`, as laid out by
+        `task_workdir`. Cancelling `token` kills the container, which is then not
+        reused. Returns the exit code and the combined output of the command.
+        """
+        author, *task_dir = Path(workdir).relative_to(settings.data_dir).parts
+        links = []
+        for mount in MOUNTS:
+            Path(workdir, "mnt", mount).mkdir(parents=True, exist_ok=True)
+            target = shlex.quote(f"{POOL_DATA_DIR}/{'/'.join(task_dir)}/mnt/{mount}")
+            links.append(f"rm -rf /mnt/{mount} && ln -s {target} /mnt/{mount}")
+
+        pooled = self.acquire(image, cpus, memory, author)
+        script = " && ".join(
+            [*links, "exec " + shlex.join([*pooled.entrypoint, *command])]
+        )
+        kill = pooled.container.kill
+        if token:
+            token.on_cancel(kill)
+        try:
+            exit_code, output = pooled.container.exec_run(
+                ["/bin/sh", "-c", script],
+                environment=environment,
+            )
+            # Unlink the task directories so the next task starts from a clean layout.
+            unlink = "rm -f " + " ".join(f"/mnt/{mount}" for mount in MOUNTS)
+            pooled.container.exec_run(["/bin/sh", "-c", unlink])
+        except DockerException:
+            if token:
+                token.remove_callback(kill)
+            self.release(pooled, healthy=False)
+            if token:
+                token.raise_if_cancelled()
+            raise
+
+        if token:
+            # The container may serve another task next, it must not be killed then.
+            token.remove_callback(kill)
+            if token.cancelled:
+                self.release(pooled, healthy=False)
+                token.raise_if_cancelled()
+
+        self.release(pooled)
+        return exit_code, (output or b"").decode("utf-8")
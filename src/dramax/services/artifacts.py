@@ -0,0 +1,224 @@
+"""Transfers of directory and glob artifacts.
+
+A `File` whose path ends with "/" is a directory and one containing glob
+characters (`*`, `?`, `[`) selects files below its base directory, matched
+against their path relative to it as by `glob`: `*` and `?` do not match "/",
+and a `**` segment matches any number of directories. Collections are stored
+either as one object per file, transferred in parallel, or, with `archive`, as
+a single tar object `<base>.tar` streamed to and from the storage.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import re
+import tarfile
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING
+
+from structlog import get_logger
+
+from dramax.common.cancellation import CancellationToken
+from dramax.common.settings import settings
+from dramax.services.storage import get_storage
+
+if TYPE_CHECKING:
+    from dramax.models.dramatiq.task import File
+
+log = get_logger("dramax.artifacts")
+
+GLOB_CHARACTERS = frozenset("*?[")
+
+
+def is_collection(path: str) -> bool:
+    return path.endswith("/") or bool(GLOB_CHARACTERS & set(path))
+
+
+def split_glob(path: str) -> tuple[str, str | None]:
+    """Split `path` into its base directory and the glob pattern below it."""
+    parts = PurePosixPath(path).parts
+    for index, part in enumerate(parts):
+        if GLOB_CHARACTERS & set(part):
+            return str(PurePosixPath(*parts[:index])), "/".join(parts[index:])
+    return str(PurePosixPath(path)), None
+
+
+@lru_cache(maxsize=128)
+def _glob_regex(pattern: str) -> re.Pattern:
+    """Regular expression matching relative paths as the glob `pattern` does."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and (end := pattern.find("]", i + 2)) != -1:
+            content = pattern[i + 1 : end].replace("\\", "\\\\")
+            if content.startswith("!"):
+                content = "^" + content[1:]
+            parts.append(f"[{content}]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(parts) + r"\Z")
+
+
+def _matches(relative: str, pattern: str | None) -> bool:
+    return pattern is None or _glob_regex(pattern).match(relative) is not None
+
+
+def _parallel(function: Callable, items: list) -> None:
+    with ThreadPoolExecutor(max_workers=settings.transfer_concurrency) as executor:
+        # Consume the results to raise the first error, if any.
+        list(executor.map(function, items))
+
+
+def local_files(base_dir: Path, pattern: str | None) -> list[str]:
+    """Paths, relative to `base_dir`, of the files of a collection."""
+    if not base_dir.is_dir():
+        return []
+    return sorted(
+        relative
+        for path in base_dir.rglob("*")
+        if path.is_file()
+        and _matches(relative := str(path.relative_to(base_dir)), pattern)
+    )
+
+
+class _TarStream(io.RawIOBase):
+    """Readable tar archive of `files`, written by a thread through a pipe.
+
+    If writing the archive fails, reading raises the error of the writer instead
+    of ending early, so that storages never commit a truncated archive.
+    """
+
+    def __init__(self, base_dir: Path, files: list[str]) -> None:
+        read_fd, write_fd = os.pipe()
+        self._pipe = os.fdopen(read_fd, "rb")
+        self._errors: list[BaseException] = []
+        self._writer = threading.Thread(
+            target=self._write,
+            args=(write_fd, base_dir, files),
+            name="dramax-tar-writer",
+            daemon=True,
+        )
+        self._writer.start()
+
+    def _write(self, write_fd: int, base_dir: Path, files: list[str]) -> None:
+        try:
+            with (
+                os.fdopen(write_fd, "wb") as pipe,
+                tarfile.open(fileobj=pipe, mode="w|") as tar,
+            ):
+                for relative in files:
+                    tar.add(base_dir / relative, arcname=relative)
+        except BaseException as e:  # noqa: BLE001
+            self._errors.append(e)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: bytearray | memoryview) -> int:
+        count = self._pipe.readinto(buffer)
+        if not count:
+            self._writer.join()
+            if self._errors:
+                raise self._errors[0]
+        return count
+
+    def close(self) -> None:
+        # A writer still running fails on the closed pipe and stops.
+        self._pipe.close()
+        super().close()
+
+
+def upload_collection(
+    artifact: File,
+    workdir: str,
+    token: CancellationToken | None = None,
+) -> int:
+    """Upload the files of a directory or glob output. Returns how many."""
+    base, pattern = artifact.split_collection()
+    base_dir = Path(base.get_full_path(workdir))
+    object_base = base.get_object_name(workdir)
+    files = local_files(base_dir, pattern)
+    storage = get_storage()
+
+    if artifact.archive:
+        with _TarStream(base_dir, files) as stream:
+            storage.put_stream(stream, f"{object_base}.tar", token)
+    else:
+        _parallel(
+            lambda relative: storage.upload_object(
+                file_path=str(base_dir / relative),
+                object_path=f"{object_base}/{relative}",
+                token=token,
+            ),
+            files,
+        )
+    log.debug("Collection uploaded", path=object_base, files=len(files))
+    return len(files)
+
+
+def _members(tar: tarfile.TarFile, pattern: str | None) -> Iterator[tarfile.TarInfo]:
+    for member in tar:
+        if member.isfile() and _matches(member.name, pattern):
+            yield member
+
+
+def download_collection(
+    artifact: File,
+    workdir: str,
+    token: CancellationToken | None = None,
+) -> int:
+    """Download the files of a directory or glob input. Returns how many."""
+    base, pattern = artifact.split_collection()
+    base_dir = Path(base.get_full_path(workdir))
+    object_base = base.get_object_name(workdir)
+    storage = get_storage()
+    base_dir.mkdir(parents=True, exist_ok=True)
+
+    if artifact.archive:
+        count = 0
+        with (
+            storage.open_stream(f"{object_base}.tar") as stream,
+            tarfile.open(fileobj=stream, mode="r|") as tar,
+        ):
+            for member in _members(tar, pattern):
+                if token:
+                    token.raise_if_cancelled()
+                tar.extract(member, base_dir, filter="data")
+                count += 1
+    else:
+        prefix = f"{object_base}/"
+        files = [
+            relative
+            for name in storage.list_objects(prefix)
+            if _matches(relative := name[len(prefix) :], pattern)
+        ]
+        _parallel(
+            lambda relative: storage.get_object(
+                file_path=str(base_dir / relative),
+                object_name=f"{prefix}{relative}",
+                token=token,
+            ),
+            files,
+        )
+        count = len(files)
+    log.debug("Collection downloaded", path=object_base, files=count)
+    return count
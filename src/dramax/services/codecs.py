@@ -0,0 +1,150 @@
+"""Compression of artifacts stored in MinIO.
+
+The codec of an object is recorded in its `x-amz-meta-dramax-codec` metadata,
+so downloads decompress only the objects that were compressed and buckets may
+mix compressed and raw objects.
+"""
+
+from __future__ import annotations
+
+import zlib
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from pathlib import Path
+from typing import BinaryIO
+
+CODEC_METADATA = "x-amz-meta-dramax-codec"
+
+CHUNK_SIZE = 1024 * 1024
+
+
+# Incremental (de)compression of a chunk, and flush of the remaining output.
+Transform = Callable[[bytes], bytes]
+Flush = Callable[[], bytes]
+
+
+class Codec(ABC):
+    """Streaming compression format. Subclasses provide the (de)compressors."""
+
+    name: str = ""
+
+    def __init__(self, level: int | None = None) -> None:
+        self.level = level
+
+    @abstractmethod
+    def compressor(self) -> tuple[Transform, Flush]:
+        """Functions compressing a chunk and flushing the remaining output."""
+
+    @abstractmethod
+    def decompressor(self) -> tuple[Transform, Flush]:
+        """Functions decompressing a chunk and flushing the remaining output."""
+
+    def compress_file(self, source: str, target: str) -> None:
+        _transform_file(source, target, *self.compressor())
+
+    def decompress_file(self, source: str, target: str) -> None:
+        _transform_file(source, target, *self.decompressor())
+
+    def compressing_reader(self, raw: BinaryIO) -> BinaryIO:
+        return TransformReader(raw, *self.compressor())
+
+    def decompressing_reader(self, raw: BinaryIO) -> BinaryIO:
+        return TransformReader(raw, *self.decompressor())
+
+
+class GzipCodec(Codec):
+    """gzip from the standard library. The output does not depend on the time."""
+
+    name = "gzip"
+
+    def compressor(self) -> tuple[Transform, Flush]:
+        level = self.level if self.level is not None else 6
+        compressobj = zlib.compressobj(level, wbits=31)
+        return compressobj.compress, compressobj.flush
+
+    def decompressor(self) -> tuple[Transform, Flush]:
+        decompressobj = zlib.decompressobj(wbits=31)
+        return decompressobj.decompress, decompressobj.flush
+
+
+class ZstdCodec(Codec):
+    """Zstandard, requires the optional `zstandard` package."""
+
+    name = "zstd"
+
+    def __init__(self, level: int | None = None) -> None:
+        try:
+            import zstandard
+        except ImportError as e:
+            msg = "The zstd codec requires the `zstandard` package"
+            raise ImportError(msg) from e
+        super().__init__(level)
+        self._zstandard = zstandard
+
+    def compressor(self) -> tuple[Transform, Flush]:
+        level = self.level if self.level is not None else 3
+        compressobj = self._zstandard.ZstdCompressor(level=level).compressobj()
+        return compressobj.compress, compressobj.flush
+
+    def decompressor(self) -> tuple[Transform, Flush]:
+        decompressobj = self._zstandard.ZstdDecompressor().decompressobj()
+        return decompressobj.decompress, lambda: b""
+
+
+CODECS: dict[str, type[Codec]] = {codec.name: codec for codec in (GzipCodec, ZstdCodec)}
+
+
+def get_codec(name: str | None, level: int | None = None) -> Codec | None:
+    """Codec called `name`, or `None` for raw objects."""
+    if not name:
+        return None
+    if name not in CODECS:
+        msg = f"Unknown codec '{name}', expected one of {', '.join(CODECS)}"
+        raise ValueError(msg)
+    return CODECS[name](level)
+
+
+def _transform_file(
+    source: str,
+    target: str,
+    transform: Transform,
+    flush: Flush,
+) -> None:
+    with Path(source).open("rb") as src, Path(target).open("wb") as dst:
+        while chunk := src.read(CHUNK_SIZE):
+            dst.write(transform(chunk))
+        dst.write(flush())
+
+
+class TransformReader:
+    """Read-only file object applying `transform` to the data read from `raw`."""
+
+    def __init__(self, raw: BinaryIO, transform: Transform, flush: Flush) -> None:
+        self.raw = raw
+        self.transform = transform
+        self.flush = flush
+        self._buffer = bytearray()
+        self._eof = False
+
+    def _fill(self, size: int) -> None:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self.raw.read(CHUNK_SIZE)
+            if chunk:
+                self._buffer += self.transform(chunk)
+            else:
+                self._buffer += self.flush()
+                self._eof = True
+
+    def read(self, size: int = -1) -> bytes:
+        self._fill(size)
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.raw.close()
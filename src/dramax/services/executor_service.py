@@ -1,8 +1,11 @@
 from structlog import get_logger
 
+from dramax.common import profiling
+from dramax.common.cancellation import CancellationToken
 from dramax.common.exceptions import (
     FileNotFoundForUploadError,
     InputDownloadError,
+    TaskRevokedError,
     UploadError,
 )
 from dramax.models.dramatiq.task import Task
@@ -10,12 +13,17 @@ from dramax.models.executor.api import api_execute
 from dramax.models.executor.docker import docker_execute
 
 
-def execute_task(task: Task, workdir: str) -> str:
+def execute_task(
+    task: Task,
+    workdir: str,
+    token: CancellationToken | None = None,
+) -> str:
     """Execute a task using the task provided executor.
 
     Parameters
     ----------
     - task: A Task instance containing all the necessary data for execution.
+    - token: Optional cancellation token that aborts transfers and executors.
 
     Returns
     -------
@@ -26,26 +34,33 @@ def execute_task(task: Task, workdir: str) -> str:
 
     try:
         if len(task.inputs) > 0:
-            task.download_inputs(workdir)
+            with profiling.stage("download"):
+                task.download_inputs(workdir, token)
 
     except InputDownloadError as e:
         log.exception("Input(s) download failed", error=e)
         raise
 
     try:
-        if hasattr(task, "image") and task.image:
-            log.info("Docker task")
-            result = docker_execute(task, workdir)
-        elif hasattr(task, "url") and task.url:
-            log.info("API task")
-            result = api_execute(task, workdir)
+        with profiling.stage("run"):
+            if hasattr(task, "image") and task.image:
+                log.debug("Docker task")
+                result = docker_execute(task, workdir, token)
+            elif hasattr(task, "url") and task.url:
+                log.debug("API task")
+                result = api_execute(task, workdir, token)
+    except TaskRevokedError:
+        raise
     except Exception as e:
         log.exception("Unexpected exception was raised by executor", error=e)
         raise
     try:
-        task.upload_outputs(workdir)
-        task.create_upload_logs(result, workdir)
+        with profiling.stage("upload"):
+            task.upload_outputs(workdir, token)
+            task.create_upload_logs(result, workdir)
 
+    except TaskRevokedError:
+        raise
     except FileNotFoundForUploadError as e:
         log.exception(
             "Output file not found in task folder",
@@ -0,0 +1,219 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+from pydantic import BaseModel
+from structlog import get_logger
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
+from dramax.models.dramatiq.task import Result, Status, Task
+from dramax.models.dramatiq.workflow import Workflow, WorkflowStatus
+from dramax.services.executor_service import execute_task
+from dramax.services.memory import InMemoryClient
+from dramax.services.mongo import MongoService
+from dramax.services.storage import FilesystemStore, set_storage
+
+log = get_logger("dramax.local")
+
+
+class LocalTaskReport(BaseModel):
+    id: str
+    status: Status
+    elapsed: float = 0.0
+    message: str | None = None
+
+    class Config:
+        use_enum_values = True
+
+
+class LocalRunReport(BaseModel):
+    workflow_id: str
+    status: WorkflowStatus
+    elapsed: float
+    tasks: list[LocalTaskReport] = []
+
+    class Config:
+        use_enum_values = True
+
+
+class LocalRunner:
+    """Execute a workflow inside the current process.
+
+    Tasks are dispatched to a thread pool as soon as their dependencies
+    succeed, artifacts are kept in a local directory and state is written
+    to an embedded in-memory store, so no broker, MongoDB or MinIO is needed.
+    """
+
+    def __init__(
+        self,
+        workflow: Workflow,
+        max_workers: int = 4,
+        storage_dir: str | None = None,
+    ) -> None:
+        self.workflow = workflow
+        self.max_workers = max_workers
+        self.storage_dir = storage_dir or str(
+            Path(settings.data_dir, "dramax-local-store")
+        )
+
+    def _workdir(self, task: Task) -> str:
+        return str(
+            Path(settings.data_dir, task.metadata["author"], self.workflow.id, task.id)
+        )
+
+    def _run_task(self, task: Task) -> float:
+        task_manager = TaskManager()
+        task_manager.create_or_update_from_id(
+            task.id,
+            self.workflow.id,
+            updated_at=datetime.now(tz=settings.timezone),
+            status=Status.STATUS_RUNNING,
+        )
+        workdir = self._workdir(task)
+        Path(workdir).mkdir(parents=True, exist_ok=True)
+
+        start = time.perf_counter()
+        result = execute_task(task, workdir)
+        elapsed = time.perf_counter() - start
+
+        task_manager.create_or_update_from_id(
+            task.id,
+            self.workflow.id,
+            updated_at=datetime.now(tz=settings.timezone),
+            result=Result(log=result).dict(),
+            status=Status.STATUS_DONE,
+        )
+        task.cleanup_workdir(workdir)
+        return elapsed
+
+    def _fail(self, task_id: str, message: str) -> None:
+        TaskManager().create_or_update_from_id(
+            task_id,
+            self.workflow.id,
+            updated_at=datetime.now(tz=settings.timezone),
+            result=Result(message=message).dict(),
+            status=Status.STATUS_FAILED,
+        )
+
+    def run(self) -> LocalRunReport:
+        # The embedded stores replace the process-wide ones only for this run.
+        previous_client = MongoService.set_client(InMemoryClient())
+        previous_storage = set_storage(FilesystemStore(self.storage_dir))
+        try:
+            return self._run()
+        finally:
+            MongoService.set_client(previous_client)
+            set_storage(previous_storage)
+
+    def _run(self) -> LocalRunReport:
+        tasks = {task.id: task for task in self.workflow.tasks}
+        for task in tasks.values():
+            task.metadata.update(self.workflow.metadata.dict())
+            missing = set(task.depends_on) - tasks.keys()
+            if missing:
+                msg = f"Task '{task.id}' depends on unknown tasks: {sorted(missing)}"
+                raise ValueError(msg)
+            if task.fan_out:
+                msg = f"Task '{task.id}': fan-out is not supported by the local runner"
+                raise ValueError(msg)
+
+        WorkflowManager().create_or_update_from_id(
+            self.workflow.id,
+            metadata=self.workflow.metadata.dict(),
+            created_at=datetime.now(tz=settings.timezone),
+            status=WorkflowStatus.STATUS_RUNNING,
+        )
+        for task in tasks.values():
+            TaskManager().create(
+                task.id,
+                parent=self.workflow.id,
+                created_at=datetime.now(tz=settings.timezone),
+                status=Status.STATUS_PENDING,
+                **task.dict(),
+            )
+
+        waiting_on = {task_id: set(task.depends_on) for task_id, task in tasks.items()}
+        dependents: dict[str, list[str]] = {task_id: [] for task_id in tasks}
+        for task_id, task in tasks.items():
+            for upstream in task.depends_on:
+                dependents[upstream].append(task_id)
+
+        reports: dict[str, LocalTaskReport] = {}
+        start = time.perf_counter()
+
+        def skip(task_id: str, failed_dependency: str) -> None:
+            waiting_on.pop(task_id, None)
+            if task_id in reports:
+                return
+            message = f"Upstream task '{failed_dependency}' failed"
+            self._fail(task_id, message)
+            reports[task_id] = LocalTaskReport(
+                id=task_id, status=Status.STATUS_FAILED, message=message
+            )
+            for downstream in dependents[task_id]:
+                skip(downstream, task_id)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running: dict[Future, str] = {}
+
+            def submit_ready() -> None:
+                for task_id, upstream in list(waiting_on.items()):
+                    if not upstream:
+                        del waiting_on[task_id]
+                        log.info("Dispatching task", task_id=task_id)
+                        running[pool.submit(self._run_task, tasks[task_id])] = task_id
+
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_id = running.pop(future)
+                    try:
+                        elapsed = future.result()
+                    except Exception as e:
+                        log.exception("Task failed", task_id=task_id, error=str(e))
+                        self._fail(task_id, str(e))
+                        reports[task_id] = LocalTaskReport(
+                            id=task_id, status=Status.STATUS_FAILED, message=str(e)
+                        )
+                        for downstream in dependents[task_id]:
+                            skip(downstream, task_id)
+                        continue
+
+                    log.info(
+                        "Task finished", task_id=task_id, elapsed=round(elapsed, 4)
+                    )
+                    reports[task_id] = LocalTaskReport(
+                        id=task_id, status=Status.STATUS_DONE, elapsed=elapsed
+                    )
+                    for downstream in dependents[task_id]:
+                        if downstream in waiting_on:
+                            waiting_on[downstream].discard(task_id)
+                submit_ready()
+
+        # Whatever is still waiting belongs to a dependency cycle.
+        for task_id in waiting_on:
+            message = "Task is part of a dependency cycle"
+            self._fail(task_id, message)
+            reports[task_id] = LocalTaskReport(
+                id=task_id, status=Status.STATUS_FAILED, message=message
+            )
+
+        failed = any(
+            report.status == Status.STATUS_FAILED for report in reports.values()
+        )
+        status = WorkflowStatus.STATUS_FAILED if failed else WorkflowStatus.STATUS_DONE
+        WorkflowManager().create_or_update_from_id(
+            self.workflow.id,
+            updated_at=datetime.now(tz=settings.timezone),
+            status=status,
+        )
+
+        return LocalRunReport(
+            workflow_id=self.workflow.id,
+            status=status,
+            elapsed=time.perf_counter() - start,
+            tasks=[reports[task_id] for task_id in tasks if task_id in reports],
+        )
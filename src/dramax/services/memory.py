@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import copy
+import threading
+from collections.abc import Iterator
+from typing import Any, Self
+
+_OPERATORS = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+}
+
+_MISSING = object()
+
+
+def _get_field(doc: dict, dotted_key: str) -> Any:
+    value: Any = doc
+    for part in dotted_key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(_matches(doc, clause) for clause in condition):
+                return False
+            continue
+        if key == "$and":
+            if not all(_matches(doc, clause) for clause in condition):
+                return False
+            continue
+        value = _get_field(doc, key)
+        if (
+            isinstance(condition, dict)
+            and condition
+            and all(k.startswith("$") for k in condition)
+        ):
+            for operator, arg in condition.items():
+                if operator == "$exists":
+                    if (value is not _MISSING) != bool(arg):
+                        return False
+                    continue
+                present = None if value is _MISSING else value
+                if not _OPERATORS[operator](present, arg):
+                    return False
+        elif condition is None:
+            # As in MongoDB, `None` matches both null and missing fields.
+            if value is not _MISSING and value is not None:
+                return False
+        elif value is _MISSING or value != condition:
+            return False
+    return True
+
+
+def _project(doc: dict, projection: dict) -> dict:
+    projected: dict = {}
+    for key, include in projection.items():
+        value = _get_field(doc, key)
+        if not include or value is _MISSING:
+            continue
+        *parents, last = key.split(".")
+        target = projected
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[last] = value
+    return projected
+
+
+def _sort_key(value: Any) -> tuple:
+    # As in MongoDB, null and missing fields sort before any value.
+    return (0, None) if value is _MISSING or value is None else (1, value)
+
+
+def _group(docs: list[dict], spec: dict) -> list[dict]:
+    """`$group` stage, for `_id` field references and `$sum` accumulators."""
+
+    def resolve(expression: Any, doc: dict) -> Any:
+        if isinstance(expression, dict):
+            return {k: resolve(v, doc) for k, v in expression.items()}
+        if isinstance(expression, str) and expression.startswith("$"):
+            value = _get_field(doc, expression[1:])
+            return None if value is _MISSING else value
+        return expression
+
+    groups: dict[str, dict] = {}
+    for doc in docs:
+        key = resolve(spec["_id"], doc)
+        group = groups.setdefault(repr(key), {"_id": key})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            group[field] = group.get(field, 0) + resolve(accumulator["$sum"], doc)
+    return list(groups.values())
+
+
+class InMemoryCursor:
+    """Subset of the pymongo `Cursor` API: iteration, `sort` and `limit`."""
+
+    def __init__(self, docs: list[dict], projection: dict | None = None) -> None:
+        self._docs = docs
+        self._projection = projection
+        self._limit = 0
+        self._iterator: Iterator[dict] | None = None
+
+    def sort(self, key: str | list[tuple[str, int]], direction: int = 1) -> Self:
+        keys = [(key, direction)] if isinstance(key, str) else key
+        # Stable sorts, least significant key first.
+        for field, order in reversed(keys):
+            self._docs.sort(
+                key=lambda doc, field=field: _sort_key(_get_field(doc, field)),
+                reverse=order < 0,
+            )
+        return self
+
+    def limit(self, limit: int) -> Self:
+        self._limit = limit
+        return self
+
+    def __iter__(self) -> Self:
+        return self
+
+    def __next__(self) -> dict:
+        if self._iterator is None:
+            docs = self._docs[: self._limit] if self._limit else self._docs
+            if self._projection:
+                docs = [_project(doc, self._projection) for doc in docs]
+            self._iterator = iter(docs)
+        return next(self._iterator)
+
+
+def _apply_update(doc: dict, update: dict) -> None:
+    doc.update(copy.deepcopy(update.get("$set", {})))
+    for key, amount in update.get("$inc", {}).items():
+        doc[key] = doc.get(key, 0) + amount
+    for key in update.get("$unset", {}):
+        doc.pop(key, None)
+    for key, value in update.get("$addToSet", {}).items():
+        values = doc.setdefault(key, [])
+        if value not in values:
+            values.append(copy.deepcopy(value))
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, upserted: bool = False) -> None:
+        self.matched_count = matched_count
+        self.modified_count = matched_count
+        self.upserted_id = 1 if upserted else None
+
+
+class InMemoryCollection:
+    """Thread-safe subset of the pymongo `Collection` API backed by a list of dicts."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._docs: list[dict] = []
+        self._lock = threading.RLock()
+
+    def find(
+        self, query: dict | None = None, projection: dict | None = None
+    ) -> InMemoryCursor:
+        with self._lock:
+            docs = [
+                copy.deepcopy(doc) for doc in self._docs if _matches(doc, query or {})
+            ]
+        return InMemoryCursor(docs, projection)
+
+    def find_one(
+        self, query: dict | None = None, projection: dict | None = None
+    ) -> dict | None:
+        return next(self.find(query, projection), None)
+
+    def aggregate(self, pipeline: list[dict]) -> Iterator[dict]:
+        """Run a pipeline of `$match` and `$group` stages."""
+        docs = list(self.find())
+        for stage in pipeline:
+            if "$match" in stage:
+                docs = [doc for doc in docs if _matches(doc, stage["$match"])]
+            elif "$group" in stage:
+                docs = _group(docs, stage["$group"])
+            else:
+                msg = f"Unsupported aggregation stage: {stage}"
+                raise NotImplementedError(msg)
+        return iter(docs)
+
+    def create_index(self, keys: list[tuple[str, int]], **kwargs) -> str:
+        """Indexes are not needed by a list scan; only the name is returned."""
+        return "_".join(f"{field}_{order}" for field, order in keys)
+
+    def count_documents(self, query: dict) -> int:
+        with self._lock:
+            return sum(1 for doc in self._docs if _matches(doc, query))
+
+    def insert_one(self, document: dict) -> None:
+        with self._lock:
+            self._docs.append(copy.deepcopy(document))
+
+    def update_one(
+        self, query: dict, update: dict, upsert: bool = False
+    ) -> UpdateResult:
+        with self._lock:
+            for doc in self._docs:
+                if _matches(doc, query):
+                    _apply_update(doc, update)
+                    return UpdateResult(1)
+            if upsert:
+                fields = {k: v for k, v in query.items() if not isinstance(v, dict)}
+                doc = copy.deepcopy(fields)
+                _apply_update(doc, update)
+                self._docs.append(doc)
+                return UpdateResult(0, upserted=True)
+        return UpdateResult(0)
+
+    def find_one_and_update(
+        self,
+        query: dict,
+        update: dict,
+        upsert: bool = False,
+        return_document: bool = False,
+    ) -> dict | None:
+        """Return the document before the update, or after it when
+        `return_document` is `ReturnDocument.AFTER` (`True`), as in pymongo.
+        """
+        with self._lock:
+            for doc in self._docs:
+                if _matches(doc, query):
+                    before = copy.deepcopy(doc)
+                    _apply_update(doc, update)
+                    return copy.deepcopy(doc) if return_document else before
+            if upsert:
+                self.update_one(query, update, upsert=True)
+                return copy.deepcopy(self._docs[-1]) if return_document else None
+        return None
+
+    def distinct(self, key: str, query: dict | None = None) -> list:
+        values = []
+        for doc in self.find(query):
+            value = _get_field(doc, key)
+            if value is not _MISSING and value not in values:
+                values.append(value)
+        return values
+
+    def bulk_write(self, requests: list, ordered: bool = True) -> None:
+        """Apply pymongo `UpdateOne` requests, the only kind used by dramax."""
+        for request in requests:
+            self.update_one(request._filter, request._doc, upsert=request._upsert)  # noqa: SLF001
+
+    def update_many(self, query: dict, update: dict) -> UpdateResult:
+        matched = 0
+        with self._lock:
+            for doc in self._docs:
+                if _matches(doc, query):
+                    _apply_update(doc, update)
+                    matched += 1
+        return UpdateResult(matched)
+
+    def delete_many(self, query: dict) -> None:
+        with self._lock:
+            self._docs = [doc for doc in self._docs if not _matches(doc, query)]
+
+
+class InMemoryDatabase:
+    """Attribute and item access to lazily created `InMemoryCollection` objects."""
+
+    def __init__(self, name: str = "dramax") -> None:
+        self.name = name
+        self._collections: dict[str, InMemoryCollection] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = InMemoryCollection(name)
+            return self._collections[name]
+
+    def __getattr__(self, name: str) -> InMemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+class InMemoryClient:
+    """Embedded stand-in for `pymongo.MongoClient`, used for local and test runs."""
+
+    def __init__(self) -> None:
+        self._databases: dict[str, InMemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> InMemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = InMemoryDatabase(name)
+        return self._databases[name]
+
+    def server_info(self) -> dict:
+        return {"version": "in-memory"}
+
+    def close(self) -> None:
+        self._databases.clear()
@@ -1,14 +1,75 @@
 from __future__ import annotations
 
+import hashlib
+import http.client
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO
+
+import certifi
+import urllib3
 from minio import Minio
+from minio.error import S3Error
+from minio.helpers import get_part_info
 from structlog import get_logger
 
+from dramax.common.cancellation import CancellationToken
+from dramax.common.exceptions import TaskRevokedError
 from dramax.common.settings import settings
+from dramax.common.tracing import traced
+from dramax.services.codecs import CODEC_METADATA, Codec, get_codec
+from dramax.services.storage import ArtifactStore
 
 log = get_logger("dramax.minio")
 
+CHUNK_SIZE = 1024 * 1024
+
+# Part size of uploads of unknown length, such as archives, when
+# `settings.minio_part_size` is not set.
+STREAM_PART_SIZE = 64 * 1024 * 1024
+
+# Errors after which a download continues from the bytes already received.
+RESUMABLE_ERRORS = (urllib3.exceptions.HTTPError, http.client.HTTPException)
+
+
+def s3_etag(file_path: str, part_size: int = 0) -> str:
+    """ETag of `file_path` once uploaded with `fput_object(part_size=...)`.
+
+    Single-part uploads get the MD5 of the content. Multipart uploads get the
+    MD5 of the concatenated part digests, followed by the number of parts.
+    """
+    part_size, part_count = get_part_info(Path(file_path).stat().st_size, part_size)
+    digests = []
+    with Path(file_path).open("rb") as f:
+        for _ in range(part_count):
+            md5 = hashlib.md5()  # noqa: S324
+            remaining = part_size
+            while remaining > 0 and (chunk := f.read(min(CHUNK_SIZE, remaining))):
+                md5.update(chunk)
+                remaining -= len(chunk)
+            digests.append(md5)
+    if part_count == 1:
+        return digests[0].hexdigest()
+    combined = hashlib.md5(b"".join(d.digest() for d in digests))  # noqa: S324
+    return f"{combined.hexdigest()}-{part_count}"
+
 
-class MinioService:
+class CancellableProgress:
+    """MinIO progress hook aborting a multipart upload between parts when cancelled."""
+
+    def __init__(self, token: CancellationToken) -> None:
+        self.token = token
+
+    def set_meta(self, object_name: str, total_length: int) -> None:
+        self.token.raise_if_cancelled()
+
+    def update(self, size: int) -> None:
+        self.token.raise_if_cancelled()
+
+
+class MinioService(ArtifactStore):
     _instance: MinioService | None = None
 
     def __init__(self) -> None:
@@ -17,9 +78,21 @@ class MinioService:
             access_key=settings.minio_access_key,
             secret_key=settings.minio_secret_key,
             secure=False,
+            http_client=urllib3.PoolManager(
+                timeout=urllib3.Timeout(connect=300, read=300),
+                maxsize=settings.minio_max_connections,
+                ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+                retries=urllib3.Retry(
+                    total=5,
+                    backoff_factor=0.2,
+                    status_forcelist=[500, 502, 503, 504],
+                ),
+            ),
         )
         self.bucket = settings.minio_bucket
-        self._ensure_bucket_exists()
+        # The bucket is checked on the first transfer, not on construction, so
+        # that creating the service never touches the network.
+        self._bucket_ready = False
         log.debug("MinIO client initialized")
 
     @classmethod
@@ -29,6 +102,8 @@ class MinioService:
         return cls._instance
 
     def _ensure_bucket_exists(self) -> None:
+        if self._bucket_ready:
+            return
         found = self.client.bucket_exists(bucket_name=self.bucket)
         if not found:
             self.client.make_bucket(bucket_name=self.bucket)
@@ -37,27 +112,232 @@ class MinioService:
         else:
             msg = f"Bucket '{self.bucket}' already exists."
             log.debug(msg)
+        self._bucket_ready = True
 
-    def upload_object(self, file_path: str, object_path: str) -> None:
+    @traced("minio.upload", "client", object_name="object_path")
+    def upload_object(
+        self,
+        file_path: str,
+        object_path: str,
+        token: CancellationToken | None = None,
+    ) -> None:
+        self._ensure_bucket_exists()
+        codec = self._codec(Path(file_path).stat().st_size)
+        if codec is None:
+            self._upload_file(file_path, object_path, None, token)
+            return
+        # Compressed into a sibling file so that the ETag of unchanged objects
+        # can still be compared, as gzip and zstd output is deterministic.
+        compressed_path = f"{file_path}.{codec.name}.minio"
+        try:
+            codec.compress_file(file_path, compressed_path)
+            self._upload_file(compressed_path, object_path, codec, token)
+        finally:
+            Path(compressed_path).unlink(missing_ok=True)
+
+    def _codec(self, size: int | None = None) -> Codec | None:
+        """Codec of new objects of `size` bytes (`None` when unknown)."""
+        if size is not None and size < settings.artifact_codec_min_size:
+            return None
+        return get_codec(settings.artifact_codec, settings.artifact_codec_level)
+
+    def _upload_file(
+        self,
+        file_path: str,
+        object_path: str,
+        codec: Codec | None,
+        token: CancellationToken | None,
+    ) -> None:
+        if settings.minio_skip_unchanged and self._is_unchanged(file_path, object_path):
+            log.debug("Object unchanged, upload skipped", path=object_path)
+            return
         self.client.fput_object(
             bucket_name=self.bucket,
             object_name=object_path,
             file_path=file_path,
+            progress=CancellableProgress(token) if token else None,
+            part_size=settings.minio_part_size,
+            num_parallel_uploads=settings.minio_parallel_uploads,
+            metadata={CODEC_METADATA: codec.name} if codec else None,
+        )
+        log.debug(
+            "File uploaded to MinIO",
+            path=object_path,
+            codec=codec.name if codec else None,
         )
-        log.debug("File uploaded to MinIO", path=object_path)
 
-    def get_object(self, file_path: str, object_name: str) -> bytes:
-        """Download an object from MinIO and return its content as bytes."""
+    def _is_unchanged(self, file_path: str, object_name: str) -> bool:
+        """Whether the stored object has the same content as `file_path`.
+
+        Sizes are compared first, so the local file is only hashed when the
+        object may be identical.
+        """
         try:
-            response = self.client.fget_object(
+            stat = self.client.stat_object(
                 bucket_name=self.bucket,
                 object_name=object_name,
-                file_path=file_path,
             )
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject"):
+                return False
+            raise
+        if stat.size != Path(file_path).stat().st_size:
+            return False
+        return stat.etag.strip('"') == s3_etag(file_path, settings.minio_part_size)
+
+    @traced("minio.download", "client", object_name="object_name")
+    def get_object(
+        self,
+        file_path: str,
+        object_name: str,
+        token: CancellationToken | None = None,
+    ) -> None:
+        """Download an object from MinIO to `file_path`.
+
+        Data is written to `<file_path>.<etag>.part.minio` first. A download
+        interrupted by a network error continues from the bytes already written,
+        also across task retries, as long as the object does not change.
+        Compressed objects are decompressed once fully downloaded.
+        """
+        self._ensure_bucket_exists()
+        try:
+            self._download(file_path, object_name, token)
             msg = f"Object '{object_name}' downloaded from MinIO."
             log.debug(msg)
         except Exception as e:
             msg = f"Error getting object '{object_name}' from MinIO: {e}"
             log.exception(msg)
             raise
-        return response
+
+    def _download(
+        self,
+        file_path: str,
+        object_name: str,
+        token: CancellationToken | None = None,
+    ) -> None:
+        stat = self.client.stat_object(bucket_name=self.bucket, object_name=object_name)
+        etag = stat.etag.strip('"')
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_file_path = Path(f"{file_path}.{etag}.part.minio")
+        # Keeps a partial download; empty objects need no request at all.
+        tmp_file_path.touch()
+
+        for attempt in range(settings.minio_download_retries + 1):
+            offset = tmp_file_path.stat().st_size
+            if offset >= stat.size:
+                break
+            if offset:
+                log.info("Resuming download", path=object_name, offset=offset)
+            try:
+                self._download_range(tmp_file_path, object_name, etag, offset, token)
+                break
+            except RESUMABLE_ERRORS as e:
+                if attempt == settings.minio_download_retries:
+                    raise
+                log.warning("Download interrupted", path=object_name, error=str(e))
+            except TaskRevokedError:
+                tmp_file_path.unlink(missing_ok=True)
+                raise
+
+        if tmp_file_path.stat().st_size != stat.size:
+            tmp_file_path.unlink()
+            msg = f"Size of '{object_name}' does not match its stored size"
+            raise OSError(msg)
+
+        codec = get_codec(stat.metadata.get(CODEC_METADATA))
+        if codec is None:
+            os.replace(tmp_file_path, file_path)
+            return
+        decompressed_path = Path(f"{file_path}.{etag}.minio")
+        try:
+            codec.decompress_file(str(tmp_file_path), str(decompressed_path))
+            os.replace(decompressed_path, file_path)
+        finally:
+            decompressed_path.unlink(missing_ok=True)
+        tmp_file_path.unlink()
+
+    def _download_range(
+        self,
+        tmp_file_path: Path,
+        object_name: str,
+        etag: str,
+        offset: int,
+        token: CancellationToken | None = None,
+    ) -> None:
+        """Append the object from `offset` on, checking `token` between chunks."""
+        response = self.client.get_object(
+            bucket_name=self.bucket,
+            object_name=object_name,
+            offset=offset,
+            request_headers={"If-Match": etag},
+        )
+        if token:
+            token.on_cancel(response.close)
+        try:
+            with tmp_file_path.open("ab") as tmp_file:
+                for data in response.stream(amt=CHUNK_SIZE):
+                    if token:
+                        token.raise_if_cancelled()
+                    tmp_file.write(data)
+        except Exception:
+            if token:
+                token.raise_if_cancelled()
+            raise
+        finally:
+            if token:
+                token.remove_callback(response.close)
+            response.close()
+            response.release_conn()
+        if token:
+            token.raise_if_cancelled()
+
+    @traced("minio.put_stream", "client", object_name="object_path")
+    def put_stream(
+        self,
+        stream: BinaryIO,
+        object_path: str,
+        token: CancellationToken | None = None,
+    ) -> None:
+        self._ensure_bucket_exists()
+        codec = self._codec()
+        self.client.put_object(
+            bucket_name=self.bucket,
+            object_name=object_path,
+            data=codec.compressing_reader(stream) if codec else stream,
+            length=-1,  # Unknown, uploaded in parts as they are read.
+            part_size=settings.minio_part_size or STREAM_PART_SIZE,
+            progress=CancellableProgress(token) if token else None,
+            metadata={CODEC_METADATA: codec.name} if codec else None,
+        )
+        log.debug(
+            "Stream uploaded to MinIO",
+            path=object_path,
+            codec=codec.name if codec else None,
+        )
+
+    @contextmanager
+    def open_stream(self, object_name: str) -> Iterator[BinaryIO]:
+        self._ensure_bucket_exists()
+        response = self.client.get_object(
+            bucket_name=self.bucket,
+            object_name=object_name,
+        )
+        codec = get_codec(response.headers.get(CODEC_METADATA))
+        try:
+            yield codec.decompressing_reader(response) if codec else response
+        finally:
+            response.close()
+            response.release_conn()
+
+    @traced("minio.list_objects", "client", prefix="prefix")
+    def list_objects(self, prefix: str) -> list[str]:
+        """Names of the objects under `prefix`, sorted."""
+        self._ensure_bucket_exists()
+        return sorted(
+            obj.object_name
+            for obj in self.client.list_objects(
+                bucket_name=self.bucket,
+                prefix=prefix,
+                recursive=True,
+            )
+        )
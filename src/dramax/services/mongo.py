@@ -1,12 +1,39 @@
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient
 from pymongo.database import Database
 from pymongo.errors import ServerSelectionTimeoutError
 from structlog import get_logger
 
 from dramax.common.settings import settings
+from dramax.common.tracing import MongoCommandTracer
 
 log = get_logger("dramax.database")
 
+# Indexes of the queries of the API, workers and dispatcher, per collection.
+INDEXES: dict[str, list[list[tuple[str, int]]]] = {
+    "workflow": [
+        [("id", ASCENDING)],
+        # Listing, newest first, with and without filters.
+        [("created_at", DESCENDING), ("id", DESCENDING)],
+        [
+            ("metadata.author", ASCENDING),
+            ("created_at", DESCENDING),
+            ("id", DESCENDING),
+        ],
+        [("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+        # Archival of finished workflows.
+        [("status", ASCENDING), ("updated_at", ASCENDING)],
+    ],
+    "task": [
+        [("parent", ASCENDING), ("id", ASCENDING)],
+        [("parent", ASCENDING), ("status", ASCENDING)],
+        [("status", ASCENDING), ("parked", ASCENDING), ("created_at", ASCENDING)],
+        [("status", ASCENDING), ("updated_at", ASCENDING)],
+    ],
+    "workflow_archive": [
+        [("id", ASCENDING)],
+    ],
+}
+
 
 class MongoService:
     _client: MongoClient | None = None
@@ -19,7 +46,12 @@ class MongoService:
 
         log.debug("Connecting to MongoDB...", dns=settings.mongo_dns)
         try:
-            cls._client = MongoClient(settings.mongo_dns)
+            cls._client = MongoClient(
+                settings.mongo_dns,
+                event_listeners=[MongoCommandTracer()]
+                if settings.tracing_exporter
+                else [],
+            )
             cls._client.server_info()  # Trigger connection test
             log.debug("MongoDB connection established.")
         except ServerSelectionTimeoutError as e:
@@ -32,12 +64,30 @@ class MongoService:
 
         return cls._client
 
+    @classmethod
+    def set_client(cls, client: MongoClient | None) -> MongoClient | None:
+        """Replace the MongoDB client singleton, e.g. with an embedded in-memory store.
+
+        Returns the previous client, to be restored afterwards.
+        """
+        previous, cls._client = cls._client, client
+        return previous
+
     @classmethod
     def get_database(cls, name: str = "dramax") -> Database:
         """Get the specified MongoDB database. Defaults to 'dramax'."""
         client = cls.connect()
         return client[name]
 
+    @classmethod
+    def create_indexes(cls, db: Database | None = None) -> None:
+        """Create the indexes in `INDEXES`. Existing indexes are left as they are."""
+        db = db if db is not None else cls.get_database()
+        for collection, indexes in INDEXES.items():
+            for keys in indexes:
+                db[collection].create_index(keys, background=True)
+        log.debug("MongoDB indexes ensured.")
+
     @classmethod
     def disconnect(cls) -> None:
         """Close the MongoDB connection."""
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import errno
+import fcntl
+import os
+import shutil
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO
+
+from structlog import get_logger
+
+from dramax.common.cancellation import CancellationToken
+from dramax.common.settings import settings
+
+log = get_logger("dramax.storage")
+
+# `ioctl` request cloning a file on copy-on-write filesystems (btrfs, XFS), from
+# <linux/fs.h>.
+FICLONE = 0x40049409
+
+LINK_MODES = ("auto", "reflink", "hardlink", "copy")
+
+READ_ONLY = ~0o222
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class ArtifactStore(ABC):
+    """Where task inputs, outputs and logs are kept, addressed by object name."""
+
+    # Whether materialised files may share their data with the stored objects.
+    links_files: bool = False
+
+    @abstractmethod
+    def upload_object(
+        self,
+        file_path: str,
+        object_path: str,
+        token: CancellationToken | None = None,
+    ) -> None:
+        """Store the local file `file_path` as `object_path`."""
+
+    @abstractmethod
+    def get_object(
+        self,
+        file_path: str,
+        object_name: str,
+        token: CancellationToken | None = None,
+    ) -> None:
+        """Materialise the object `object_name` at the local path `file_path`."""
+
+    @abstractmethod
+    def list_objects(self, prefix: str) -> list[str]:
+        """Names of the objects under `prefix`, sorted."""
+
+    @abstractmethod
+    def put_stream(
+        self,
+        stream: BinaryIO,
+        object_path: str,
+        token: CancellationToken | None = None,
+    ) -> None:
+        """Store the content read from `stream`, of unknown size, as `object_path`."""
+
+    @abstractmethod
+    def open_stream(self, object_name: str) -> Iterator[BinaryIO]:
+        """Context manager reading the content of `object_name` as a stream."""
+
+
+def reflink(source: Path, target: Path) -> None:
+    """Clone `source` into `target`, sharing its blocks until either is modified."""
+    with source.open("rb") as src, target.open("wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            target.unlink(missing_ok=True)
+            raise
+
+
+class FilesystemStore(ArtifactStore):
+    """Artifact storage on a local or shared (e.g. NFS) filesystem.
+
+    Objects are files under `root`, laid out like the MinIO bucket. Instead of
+    copying, files are materialised according to `link_mode`:
+
+    - "reflink": copy-on-write clone, on filesystems supporting it.
+    - "hardlink": same inode. Linked objects are made read-only so that tasks
+      cannot modify stored artifacts in place through an input.
+    - "auto": reflink, then hardlink, whichever the filesystem supports.
+    - "copy": plain copies.
+
+    Linking falls back to copying, e.g. when the work directory and `root` are
+    on different filesystems.
+    """
+
+    def __init__(self, root: str, link_mode: str = "auto") -> None:
+        if link_mode not in LINK_MODES:
+            msg = f"link_mode must be one of {', '.join(LINK_MODES)}"
+            raise ValueError(msg)
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.link_mode = link_mode
+        self.links_files = link_mode != "copy"
+
+    def _resolve(self, object_name: str) -> Path:
+        return self.root / object_name.lstrip("/")
+
+    def _materialise(self, source: Path, target: Path) -> str:
+        """Atomically place `source` at `target`. Returns the method used."""
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_target = target.with_name(f".{target.name}.dramax-tmp")
+        tmp_target.unlink(missing_ok=True)
+        if self.link_mode in ("auto", "reflink"):
+            try:
+                reflink(source, tmp_target)
+            except OSError:
+                pass
+            else:
+                os.replace(tmp_target, target)
+                return "reflink"
+        if self.link_mode in ("auto", "hardlink"):
+            try:
+                os.link(source, tmp_target)
+                # Only once shared: a copy leaves the source writable.
+                source.chmod(source.stat().st_mode & READ_ONLY)
+            except OSError as e:
+                tmp_target.unlink(missing_ok=True)
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+            else:
+                os.replace(tmp_target, target)
+                return "hardlink"
+        shutil.copyfile(source, tmp_target)
+        os.replace(tmp_target, target)
+        return "copy"
+
+    def upload_object(
+        self,
+        file_path: str,
+        object_path: str,
+        token: CancellationToken | None = None,
+    ) -> None:
+        if token:
+            token.raise_if_cancelled()
+        target = self._resolve(object_path)
+        method = self._materialise(Path(file_path), target)
+        log.debug("File stored", path=str(target), method=method)
+
+    def get_object(
+        self,
+        file_path: str,
+        object_name: str,
+        token: CancellationToken | None = None,
+    ) -> None:
+        if token:
+            token.raise_if_cancelled()
+        source = self._resolve(object_name)
+        if not source.is_file():
+            msg = f"Object '{object_name}' not found in {self.root}"
+            raise FileNotFoundError(msg)
+        method = self._materialise(source, Path(file_path))
+        log.debug("File retrieved", path=str(source), method=method)
+
+    def put_stream(
+        self,
+        stream: BinaryIO,
+        object_path: str,
+        token: CancellationToken | None = None,
+    ) -> None:
+        target = self._resolve(object_path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_target = target.with_name(f".{target.name}.dramax-tmp")
+        try:
+            with tmp_target.open("wb") as f:
+                while chunk := stream.read(STREAM_CHUNK_SIZE):
+                    if token:
+                        token.raise_if_cancelled()
+                    f.write(chunk)
+        except BaseException:
+            tmp_target.unlink(missing_ok=True)
+            raise
+        os.replace(tmp_target, target)
+        log.debug("Stream stored", path=str(target))
+
+    @contextmanager
+    def open_stream(self, object_name: str) -> Iterator[BinaryIO]:
+        with self._resolve(object_name).open("rb") as f:
+            yield f
+
+    def list_objects(self, prefix: str) -> list[str]:
+        base = self._resolve(prefix)
+        if not base.is_dir():
+            return []
+        return sorted(
+            str(path.relative_to(self.root))
+            for path in base.rglob("*")
+            if path.is_file() and not path.name.endswith(".dramax-tmp")
+        )
+
+
+def unshare_files(path: Path) -> int:
+    """Replace hard-linked files at or under `path` by private copies.
+
+    Returns the number of files copied. Reflinked files are left as they are,
+    since they already are copy-on-write.
+    """
+    files = [path] if path.is_file() else path.rglob("*")
+    copied = 0
+    for file in files:
+        if file.is_symlink() or not file.is_file() or file.stat().st_nlink == 1:
+            continue
+        tmp_file = file.with_name(f".{file.name}.dramax-tmp")
+        shutil.copyfile(file, tmp_file)
+        os.replace(tmp_file, file)
+        copied += 1
+    return copied
+
+
+_storage: ArtifactStore | None = None
+
+
+def get_storage() -> ArtifactStore:
+    """Return the artifact storage used by tasks, as set by `STORAGE_BACKEND`."""
+    global _storage  # noqa: PLW0603
+    if _storage is not None:
+        return _storage
+    if settings.storage_backend == "filesystem":
+        _storage = FilesystemStore(
+            settings.storage_root or str(Path(settings.data_dir, "dramax-store")),
+            settings.storage_link_mode,
+        )
+        return _storage
+
+    from dramax.services.minio import MinioService
+
+    return MinioService.get_instance()
+
+
+def set_storage(storage: ArtifactStore | None) -> ArtifactStore | None:
+    """Override the artifact storage for this process. `None` restores the default.
+
+    Returns the previous override, to be restored afterwards.
+    """
+    global _storage  # noqa: PLW0603
+    previous, _storage = _storage, storage
+    return previous
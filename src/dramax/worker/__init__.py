@@ -1,5 +1,7 @@
-from .utils import set_running, set_success
-from .worker import set_failure, worker
+import importlib
+from typing import Any
+
+from dramax.common.configure_logger import configure_logger
 
 __all__ = [
     "set_failure",
@@ -8,6 +10,26 @@ __all__ = [
     "worker",
 ]
 
-from dramax.common.configure_logger import configure_logger
-
 configure_logger()
+
+_LAZY_ATTRIBUTES = {
+    "set_running": "dramax.worker.utils",
+    "set_success": "dramax.worker.utils",
+    "set_failure": "dramax.worker.worker",
+    "worker": "dramax.worker.worker",
+}
+
+
+def __getattr__(name: str) -> Any:
+    # Actors are loaded on first access, so that importing submodules such as
+    # `dramax.worker.resources` neither declares them nor sets up the broker.
+    if name not in _LAZY_ATTRIBUTES:
+        msg = f"module {__name__!r} has no attribute {name!r}"
+        raise AttributeError(msg)
+    module = importlib.import_module(_LAZY_ATTRIBUTES[name])
+    # Importing `dramax.worker.worker` binds the submodule as `worker` on this
+    # package, so rebind every lazy name to the actual object.
+    for attribute, module_name in _LAZY_ATTRIBUTES.items():
+        if module_name == module.__name__:
+            globals()[attribute] = getattr(module, attribute)
+    return globals()[name]
@@ -0,0 +1,110 @@
+"""Admission control of submitted workflows.
+
+Workflows are admitted while the cluster has capacity for them, as measured by
+the unfinished tasks in MongoDB and the messages waiting in the routed queues.
+Otherwise `/run` rejects them, with a Retry-After estimated from the recent
+completion rate, or accepts them parked, depending on
+`settings.workflow_admission_policy`.
+"""
+
+from __future__ import annotations
+
+import math
+from datetime import datetime, timedelta
+
+from pydantic import BaseModel
+from pymongo.database import Database
+from structlog import get_logger
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager
+from dramax.models.dramatiq.workflow import Workflow
+from dramax.worker.routing import routed_queues
+
+log = get_logger("dramax.worker.admission")
+
+ADMISSION_POLICIES = ("off", "reject", "park")
+
+
+class Admission(BaseModel):
+    admitted: bool
+    retry_after: int = 0  # Seconds, estimated, when not admitted.
+    reason: str = ""
+
+
+def queue_depth() -> int:
+    """Messages ready or delayed in the routed queues of the broker."""
+    from dramax.worker.scheduler import worker  # Sets up the broker.
+
+    depth = 0
+    for queue_name in routed_queues():
+        ready, delayed, _ = worker.broker.get_queue_message_counts(queue_name)
+        depth += ready + delayed
+    return depth
+
+
+class AdmissionControl:
+    def __init__(self, db: Database | None = None, policy: str | None = None) -> None:
+        self.db = db
+        self.policy = policy or settings.workflow_admission_policy
+        if self.policy not in ADMISSION_POLICIES:
+            msg = (
+                f"Unknown admission policy '{self.policy}', "
+                f"expected one of {ADMISSION_POLICIES}"
+            )
+            raise ValueError(msg)
+
+    def check(self, workflow: Workflow) -> Admission:
+        """Whether `workflow` fits in the current capacity of the cluster."""
+        if self.policy == "off":
+            return Admission(admitted=True)
+
+        task_manager = TaskManager(self.db)
+        reasons = []
+        excess = 0
+        max_tasks = settings.workflow_admission_max_tasks
+        if max_tasks:
+            unfinished = task_manager.count_unfinished()
+            # A workflow larger than the limit is admitted into an idle cluster.
+            if unfinished and unfinished + len(workflow.tasks) > max_tasks:
+                excess = unfinished + len(workflow.tasks) - max_tasks
+                reasons.append(f"{unfinished} unfinished tasks")
+        max_depth = settings.workflow_admission_max_queue_depth
+        if max_depth:
+            try:
+                depth = queue_depth()
+            except Exception as e:  # noqa: BLE001
+                log.warning("Queue depth unavailable, not checked", error=str(e))
+                depth = 0
+            if depth > max_depth:
+                excess = max(excess, depth - max_depth)
+                reasons.append(f"{depth} queued messages")
+
+        if not reasons:
+            return Admission(admitted=True)
+        admission = Admission(
+            admitted=False,
+            retry_after=self.retry_after(task_manager, excess),
+            reason=", ".join(reasons),
+        )
+        log.info(
+            "Workflow over capacity",
+            workflow_id=workflow.id,
+            policy=self.policy,
+            reason=admission.reason,
+            retry_after=admission.retry_after,
+        )
+        return admission
+
+    @staticmethod
+    def retry_after(task_manager: TaskManager, excess: int) -> int:
+        """Seconds until `excess` tasks finish at the recent completion rate."""
+        window = settings.workflow_admission_rate_window
+        since = datetime.now(tz=settings.timezone) - timedelta(seconds=window)
+        rate = task_manager.count_finished_since(since) / window
+        if not rate:
+            return settings.workflow_admission_max_retry_after
+        return max(
+            1,
+            min(math.ceil(excess / rate), settings.workflow_admission_max_retry_after),
+        )
@@ -0,0 +1,168 @@
+"""Archival of finished workflows out of the hot MongoDB collections.
+
+A workflow and its tasks are archived as one gzip-compressed JSON document,
+stored either as the object `archive/<workflow_id>.json.gz` in the artifact
+storage or inline in the `workflow_archive` collection. That collection also
+keeps one small entry per archived workflow, so that `/status` can tell
+archived workflows from unknown ones without looking into the storage.
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import time
+from datetime import datetime, timedelta
+
+from pydantic.json import pydantic_encoder
+from pymongo.database import Database
+from structlog import get_logger
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import WorkflowManager
+from dramax.models.dramatiq.task import Status
+from dramax.models.dramatiq.workflow import (
+    TaskInDatabase,
+    WorkflowInDatabase,
+    WorkflowSummary,
+)
+from dramax.services.mongo import MongoService
+from dramax.services.storage import get_storage
+
+log = get_logger("dramax.archive")
+
+ARCHIVE_BACKENDS = ("storage", "collection")
+UNFINISHED_STATUSES = (Status.STATUS_PENDING, Status.STATUS_RUNNING)
+
+
+def archive_object_name(workflow_id: str) -> str:
+    return f"archive/{workflow_id}.json.gz"
+
+
+class Archiver:
+    def __init__(
+        self,
+        db: Database | None = None,
+        after_days: float | None = None,
+        backend: str | None = None,
+    ) -> None:
+        self.db = db if db is not None else MongoService.get_database()
+        self.after_days = (
+            settings.archive_after_days if after_days is None else after_days
+        )
+        self.backend = backend or settings.archive_backend
+        if self.backend not in ARCHIVE_BACKENDS:
+            msg = (
+                f"Unknown archive backend '{self.backend}', "
+                f"expected one of {ARCHIVE_BACKENDS}"
+            )
+            raise ValueError(msg)
+
+    def archive(self) -> int:
+        """Archive one batch of expired workflows. Returns how many."""
+        before = datetime.now(tz=settings.timezone) - timedelta(days=self.after_days)
+        workflow_ids = WorkflowManager(self.db).find_finished_before(
+            before,
+            settings.archive_batch_size,
+        )
+        return sum(self.archive_workflow(workflow_id) for workflow_id in workflow_ids)
+
+    def archive_workflow(self, workflow_id: str) -> bool:
+        """Move a workflow and its tasks to the archive. Returns whether it did.
+
+        The archive is written before anything is deleted, so an interrupted
+        run is completed by the next one. Workflows with tasks still pending or
+        running, e.g. after being resumed meanwhile, are left in place.
+        """
+        workflow = self.db.workflow.find_one({"id": workflow_id})
+        if workflow is None:
+            return False
+        tasks = list(self.db.task.find({"parent": workflow_id}))
+        if any(task.get("status") in UNFINISHED_STATUSES for task in tasks):
+            log.info(
+                "Workflow has unfinished tasks, not archived", workflow_id=workflow_id
+            )
+            return False
+        for document in (workflow, *tasks):
+            document.pop("_id", None)
+        data = gzip.compress(
+            json.dumps(
+                {"workflow": workflow, "tasks": tasks},
+                default=pydantic_encoder,
+            ).encode(),
+        )
+
+        entry = {
+            "id": workflow_id,
+            "author": workflow.get("metadata", {}).get("author"),
+            "status": workflow.get("status"),
+            "created_at": workflow.get("created_at"),
+            "updated_at": workflow.get("updated_at"),
+            "archived_at": datetime.now(tz=settings.timezone),
+            "backend": self.backend,
+        }
+        if self.backend == "storage":
+            get_storage().put_stream(
+                io.BytesIO(data),
+                archive_object_name(workflow_id),
+            )
+        else:
+            entry["data"] = data
+        self.db.workflow_archive.update_one(
+            {"id": workflow_id},
+            {"$set": entry},
+            upsert=True,
+        )
+
+        self.db.task.delete_many({"parent": workflow_id})
+        self.db.workflow.delete_many({"id": workflow_id})
+        log.info(
+            "Workflow archived",
+            workflow_id=workflow_id,
+            tasks=len(tasks),
+            size=len(data),
+            backend=self.backend,
+        )
+        return True
+
+    def load(self, workflow_id: str) -> WorkflowInDatabase | None:
+        """The archived workflow `workflow_id`, with its tasks, if archived."""
+        entry = self.db.workflow_archive.find_one({"id": workflow_id})
+        if entry is None:
+            return None
+        if entry["backend"] == "storage":
+            with get_storage().open_stream(archive_object_name(workflow_id)) as f:
+                data = f.read()
+        else:
+            data = entry["data"]
+        archived = json.loads(gzip.decompress(data))
+        workflow = WorkflowInDatabase(
+            **archived["workflow"],
+            archived_at=entry["archived_at"],
+        )
+        workflow.tasks = [TaskInDatabase(**task) for task in archived["tasks"]]
+        return workflow
+
+    def find_summaries(self, workflow_ids: list[str]) -> list[WorkflowSummary]:
+        """Summaries of the given workflows, for those archived, from their entries."""
+        entries = self.db.workflow_archive.find(
+            {"id": {"$in": workflow_ids}},
+            dict.fromkeys(WorkflowSummary.__fields__.keys() - {"tasks"}, 1),
+        )
+        return [
+            WorkflowSummary(**{k: v for k, v in entry.items() if v is not None})
+            for entry in entries
+        ]
+
+    def run_forever(self, interval: float | None = None) -> None:
+        interval = interval or settings.archive_interval
+        log.info("Archiver started", after_days=self.after_days, backend=self.backend)
+        while True:
+            try:
+                # Batches are archived back to back while there is a backlog.
+                while self.archive() == settings.archive_batch_size:
+                    pass
+            except Exception as e:
+                log.exception("Archiver iteration failed", error=str(e))
+            time.sleep(interval)
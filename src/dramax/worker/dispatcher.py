@@ -0,0 +1,147 @@
+"""Fair-share release of parked tasks to the broker.
+
+With `settings.fair_share`, and for workflows with `max_parallelism`, tasks are
+stored as parked instead of being sent to the broker on submission. The
+dispatcher keeps at most `dispatch_max_in_flight` released tasks unfinished and
+fills free slots with parked tasks whose upstream tasks have finished, so that
+queues stay short and the order in which work reaches the workers is decided
+here rather than by the FIFO order of submissions.
+
+Authors share the slots by deficit round-robin: on every round each author with
+ready tasks earns its weight in credits and releases one task per credit, so a
+large batch workflow cannot starve the workflows of other authors.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+
+from pymongo.database import Database
+from structlog import get_logger
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
+from dramax.models.dramatiq.task import Task
+from dramax.models.dramatiq.workflow import TaskRef
+from dramax.worker.scheduler import Scheduler
+
+log = get_logger("dramax.dispatcher")
+
+
+def author_of(task: TaskRef) -> str:
+    return task.metadata.get("author", "anonymous")
+
+
+class Dispatcher:
+    def __init__(
+        self,
+        db: Database | None = None,
+        max_in_flight: int | None = None,
+        weights: dict[str, int] | None = None,
+    ) -> None:
+        self.db = db
+        self.max_in_flight = max_in_flight or settings.dispatch_max_in_flight
+        self.weights = settings.fair_share_weights if weights is None else weights
+        # Credits left to authors that still had ready tasks when slots ran out.
+        self.deficits: dict[str, int] = defaultdict(int)
+        self._last_author: str | None = None
+        self._scheduler: Scheduler | None = None
+
+    @property
+    def scheduler(self) -> Scheduler:
+        if self._scheduler is None:
+            self._scheduler = Scheduler(self.db)
+        return self._scheduler
+
+    def _rotation(self, authors: list[str]) -> list[str]:
+        """Authors in round-robin order, starting after the last one served."""
+        authors = sorted(authors)
+        if self._last_author is None:
+            return authors
+        start = next((i for i, a in enumerate(authors) if a > self._last_author), 0)
+        return authors[start:] + authors[:start]
+
+    def dispatch(self) -> int:
+        """Release parked tasks into the free slots once. Returns how many."""
+        task_manager = TaskManager(self.db)
+        parked = task_manager.find_parked()
+        if not parked:
+            return 0
+        in_flight = task_manager.find_in_flight()
+        slots = self.max_in_flight - len(in_flight)
+        if slots <= 0:
+            return 0
+
+        unfinished = {(t.parent, t.id) for t in parked + in_flight}
+        ready: dict[str, deque[TaskRef]] = defaultdict(deque)
+        for task in parked:
+            if not any((task.parent, up) in unfinished for up in task.depends_on):
+                ready[author_of(task)].append(task)
+        running = Counter(t.parent for t in in_flight)
+        limits = WorkflowManager(self.db).find_max_parallelism(
+            {t.parent for t in parked},
+        )
+
+        for author in list(self.deficits):
+            if author not in ready:
+                del self.deficits[author]
+
+        released = 0
+        while slots > 0 and any(ready.values()):
+            progress = False
+            for author in self._rotation([a for a, q in ready.items() if q]):
+                queue = ready[author]
+                self.deficits[author] += self.weights.get(author, 1)
+                while queue and self.deficits[author] >= 1 and slots > 0:
+                    task = queue.popleft()
+                    limit = limits.get(task.parent)
+                    if limit is not None and running[task.parent] >= limit:
+                        continue
+                    if not self._release(task_manager, task):
+                        continue
+                    running[task.parent] += 1
+                    self.deficits[author] -= 1
+                    slots -= 1
+                    released += 1
+                    progress = True
+                    self._last_author = author
+                if not queue:
+                    self.deficits.pop(author, None)
+                if slots <= 0:
+                    break
+            if not progress:
+                break
+        return released
+
+    def _release(self, task_manager: TaskManager, task: TaskRef) -> bool:
+        now = datetime.now(tz=settings.timezone)
+        if not task_manager.release(task.id, task.parent, updated_at=now):
+            return False
+        log.debug(
+            "Releasing task",
+            task_id=task.id,
+            workflow_id=task.parent,
+            author=author_of(task),
+        )
+        # Only the released tasks are loaded in full, to be routed.
+        stored = task_manager.find_one(id=task.id, parent=task.parent)
+        self.scheduler.dispatch(
+            Task(**stored.dict(include=set(Task.__fields__))),
+            task.parent,
+            spec_version=stored.spec_version,
+        )
+        return True
+
+    def run_forever(self, interval: float | None = None) -> None:
+        interval = interval or settings.dispatch_interval
+        log.info("Dispatcher started", max_in_flight=self.max_in_flight)
+        while True:
+            try:
+                released = self.dispatch()
+                if released:
+                    log.info("Released tasks", count=released)
+            except Exception as e:
+                log.exception("Dispatcher iteration failed", error=str(e))
+            time.sleep(interval)
@@ -0,0 +1,262 @@
+"""Map/reduce fan-out of tasks at runtime.
+
+A task with `fan_out` is not executed itself: its input is split into shards
+and one copy of the task (`<id>-shard-<n>`) runs per shard, at most
+`max_concurrency` at a time. The fan-out task succeeds once all its shards do,
+and inputs of downstream tasks sourced from it are expanded into one file per
+shard, placed at `<path>/<n>/<name>`.
+"""
+
+from __future__ import annotations
+
+import math
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+
+from structlog import get_logger
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager
+from dramax.models.dramatiq.task import File, Status, Task
+from dramax.services.storage import get_storage
+
+log = get_logger("dramax.worker.fanout")
+
+
+def shard_id(task_id: str, index: int) -> str:
+    return f"{task_id}-shard-{index:05d}"
+
+
+def _chunks(items: list, shards: int | None, shard_size: int | None) -> list[list]:
+    size = shard_size or max(1, math.ceil(len(items) / shards))
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def _split_file(
+    path: Path,
+    shards: int | None,
+    shard_size: int | None,
+    by_lines: bool,
+) -> Iterator[bytes]:
+    """Yield consecutive pieces of the file at `path`, by lines or by bytes."""
+    if by_lines:
+        with path.open("rb") as f:
+            total = sum(1 for _ in f)
+        size = shard_size or max(1, math.ceil(total / shards))
+        with path.open("rb") as f:
+            chunk: list[bytes] = []
+            for line in f:
+                chunk.append(line)
+                if len(chunk) == size:
+                    yield b"".join(chunk)
+                    chunk = []
+            if chunk:
+                yield b"".join(chunk)
+        return
+
+    size = shard_size or max(1, math.ceil(path.stat().st_size / shards))
+    with path.open("rb") as f:
+        while piece := f.read(size):
+            yield piece
+
+
+def split_input(task: Task, workdir: str) -> list[list[File]]:
+    """Split the fan-out input of `task` and return the input files of each shard.
+
+    With "files", shards reference the existing objects under the input prefix.
+    With "lines" and "bytes", the input is downloaded, split, and every piece is
+    uploaded under `shards/` in the storage of `task`.
+    """
+    fan_out = task.fan_out
+    artifact = task.get_input(fan_out.input)
+    storage = get_storage()
+    # Shards live in other work directories, so inputs are referenced through
+    # the task that owns them.
+    if artifact.source and artifact.sourcePath:
+        source, source_path = artifact.source, artifact.sourcePath
+    else:
+        source, source_path = task.id, artifact.path
+
+    if fan_out.split_by == "files":
+        prefix = artifact.get_object_name(workdir).rstrip("/") + "/"
+        names = [name[len(prefix) :] for name in storage.list_objects(prefix)]
+        return [
+            [
+                File(
+                    name=artifact.name,
+                    path=f"{artifact.path.rstrip('/')}/{name}",
+                    source=source,
+                    sourcePath=f"{source_path.rstrip('/')}/{name}",
+                )
+                for name in chunk
+            ]
+            for chunk in _chunks(names, fan_out.shards, fan_out.shard_size)
+        ]
+
+    file_path = Path(artifact.get_full_path(workdir))
+    storage.get_object(
+        file_path=str(file_path),
+        object_name=artifact.get_object_name(workdir),
+    )
+    shard_files = []
+    pieces = _split_file(
+        file_path,
+        fan_out.shards,
+        fan_out.shard_size,
+        by_lines=fan_out.split_by == "lines",
+    )
+    for index, piece in enumerate(pieces):
+        piece_file = File(path=f"shards/{index:05d}/{file_path.name}")
+        piece_path = Path(piece_file.get_full_path(workdir))
+        piece_path.parent.mkdir(parents=True, exist_ok=True)
+        piece_path.write_bytes(piece)
+        storage.upload_object(
+            file_path=str(piece_path),
+            object_path=piece_file.get_object_name(workdir),
+        )
+        shard_files.append(
+            [
+                File(
+                    name=artifact.name,
+                    path=artifact.path,
+                    source=task.id,
+                    sourcePath=piece_file.path,
+                ),
+            ],
+        )
+    return shard_files
+
+
+def make_shards(task: Task, shard_inputs: list[list[File]]) -> list[Task]:
+    """Copies of `task`, one per shard, with the fan-out input replaced."""
+    fan_out_input = task.get_input(task.fan_out.input)
+    other_inputs = [f for f in task.inputs if f is not fan_out_input]
+    return [
+        task.copy(
+            update={
+                "id": shard_id(task.id, index),
+                "name": f"{task.name}-shard-{index:05d}",
+                "inputs": other_inputs + inputs,
+                "fan_out": None,
+                "depends_on": [],
+                "metadata": {**task.metadata, "shard_of": task.id, "shard": index},
+            },
+            deep=True,
+        )
+        for index, inputs in enumerate(shard_inputs)
+    ]
+
+
+def _dispatch_next(task_id: str, workflow_id: str, shards: int) -> bool:
+    """Dispatch the next pending shard of a fan-out task, if any is left."""
+    from dramax.worker.scheduler import Scheduler  # Avoid circular import.
+
+    task_manager = TaskManager()
+    index = task_manager.claim_next_shard(task_id, workflow_id, shards)
+    if index is None:
+        return False
+    shard = task_manager.find_one(id=shard_id(task_id, index), parent=workflow_id)
+    Scheduler(task_manager.db).dispatch(
+        Task(**shard.dict(include=set(Task.__fields__))),
+        workflow_id,
+        spec_version=shard.spec_version,
+    )
+    return True
+
+
+def start_fan_out(task: Task, workflow_id: str, workdir: str) -> int:
+    """Split the input of `task`, create its shards and dispatch the first ones.
+
+    Returns the number of shards. Redelivered messages of a fan-out task that
+    was already split do nothing.
+    """
+    task_manager = TaskManager()
+    task_in_db = task_manager.find_one(id=task.id, parent=workflow_id)
+    if task_in_db and task_in_db.shards is not None:
+        log.info("Fan-out already started", task_id=task.id, shards=task_in_db.shards)
+        return task_in_db.shards
+
+    shards = make_shards(task, split_input(task, workdir))
+    if len(shards) > settings.fan_out_max_shards:
+        msg = (
+            f"Fan-out of task '{task.id}' produces {len(shards)} shards, "
+            f"more than the maximum of {settings.fan_out_max_shards}"
+        )
+        raise ValueError(msg)
+
+    now = datetime.now(tz=settings.timezone)
+    spec_version = task_manager.count_split(task.id, workflow_id)
+    for shard in shards:
+        task_manager.create(
+            shard.id,
+            parent=workflow_id,
+            created_at=now,
+            status=Status.STATUS_PENDING,
+            spec_version=spec_version,
+            **shard.dict(),
+        )
+    task_manager.create_or_update_from_id(
+        task.id,
+        workflow_id,
+        updated_at=now,
+        shards=len(shards),
+        next_shard=0,
+        done_shards=[],
+    )
+    log.info("Fan-out started", task_id=task.id, shards=len(shards))
+
+    for _ in range(task.fan_out.max_concurrency or len(shards)):
+        if not _dispatch_next(task.id, workflow_id, len(shards)):
+            break
+    return len(shards)
+
+
+def shard_finished(shard: Task, workflow_id: str) -> bool:
+    """Account for a successful shard and dispatch the next one.
+
+    Returns whether it was the last shard, in which case the caller marks the
+    fan-out task as done.
+    """
+    task_manager = TaskManager()
+    parent = task_manager.find_one(id=shard.metadata["shard_of"], parent=workflow_id)
+    done = task_manager.complete_shard(parent.id, workflow_id, shard.metadata["shard"])
+    if done is None:
+        log.info("Shard already finished", task_id=parent.id, shard=shard.id)
+        return False
+    log.info("Shard finished", task_id=parent.id, done=done, shards=parent.shards)
+    if done >= parent.shards:
+        return True
+    _dispatch_next(parent.id, workflow_id, parent.shards)
+    return False
+
+
+def expand_fan_in(task: Task, workflow_id: str) -> Task:
+    """Replace inputs sourced from fan-out tasks with one input per shard."""
+    sources = {f.source for f in task.inputs if f.source}
+    if not sources:
+        return task
+    fan_outs = {
+        t.id: t
+        for t in TaskManager().find(parent=workflow_id, shards={"$ne": None})
+        if t.id in sources
+    }
+    if not fan_outs:
+        return task
+
+    inputs = []
+    for artifact in task.inputs:
+        if artifact.source not in fan_outs:
+            inputs.append(artifact)
+            continue
+        name = Path(artifact.sourcePath or artifact.path).name
+        inputs.extend(
+            File(
+                name=artifact.name,
+                path=f"{artifact.path.rstrip('/')}/{index:05d}/{name}",
+                source=shard_id(artifact.source, index),
+                sourcePath=artifact.sourcePath,
+            )
+            for index in range(fan_outs[artifact.source].shards)
+        )
+    return task.copy(update={"inputs": inputs})
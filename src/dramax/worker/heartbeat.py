@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import os
+import socket
+import threading
+from datetime import datetime
+from types import TracebackType
+
+from structlog import get_logger
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager
+
+log = get_logger("dramax.worker.heartbeat")
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Heartbeat:
+    """Periodically records that a task is still being executed by this worker.
+
+    Used as a context manager around the execution of a task; the reaper relies
+    on these heartbeats to detect tasks whose worker died.
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        workflow_id: str,
+        interval: float | None = None,
+    ) -> None:
+        self.task_id = task_id
+        self.workflow_id = workflow_id
+        self.interval = interval or settings.heartbeat_interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"dramax-heartbeat-{task_id}",
+            daemon=True,
+        )
+
+    def beat(self) -> None:
+        TaskManager().create_or_update_from_id(
+            self.task_id,
+            self.workflow_id,
+            heartbeat_at=datetime.now(tz=settings.timezone),
+            worker_id=WORKER_ID,
+        )
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.beat()
+            except Exception as e:  # noqa: BLE001
+                log.warning(
+                    "Failed to write heartbeat", task_id=self.task_id, error=str(e)
+                )
+
+    def __enter__(self) -> Heartbeat:
+        self.beat()
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.interval)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from types import FrameType
+
+from pydantic import BaseModel, validator
+from structlog import get_logger
+
+log = get_logger("dramax.worker.pools")
+
+IO_MODES = ("threads", "gevent")
+
+
+class WorkerPool(BaseModel):
+    """Worker processes bound to a set of queues, see `settings.worker_pools`."""
+
+    queues: list[str]
+    processes: int
+    threads: int
+    io_mode: str = "threads"
+
+    @validator("io_mode")
+    def io_mode_is_known(cls, io_mode: str) -> str:
+        if io_mode not in IO_MODES:
+            msg = f"io mode must be one of {', '.join(IO_MODES)}"
+            raise ValueError(msg)
+        return io_mode
+
+    @classmethod
+    def parse(cls, spec: str) -> WorkerPool:
+        """Parse a "queue[,queue...]:processes:threads[:io-mode]" spec."""
+        fields = spec.split(":")
+        if len(fields) not in (3, 4) or not fields[0]:
+            msg = f"Invalid worker pool {spec!r}, expected queues:processes:threads"
+            raise ValueError(msg)
+        return cls(
+            queues=fields[0].split(","),
+            processes=fields[1],
+            threads=fields[2],
+            **({"io_mode": fields[3]} if len(fields) == 4 else {}),  # noqa: PLR2004
+        )
+
+    def command(self) -> list[str]:
+        return [
+            sys.executable,
+            "-m",
+            "dramax",
+            "worker",
+            "--io-mode",
+            self.io_mode,
+            "--processes",
+            str(self.processes),
+            "--threads",
+            str(self.threads),
+            "--queues",
+            *self.queues,
+        ]
+
+
+def pool_environment(index: int, host_processes: int) -> dict[str, str]:
+    """Environment of the `index`-th pool.
+
+    Each pool runs its own dramatiq Prometheus exporter, so they get consecutive
+    ports and separate metric databases. `host_processes`, the processes of all
+    pools, sizes the default resource budget of each process.
+    """
+    prefix = os.getenv(
+        "dramatiq_prom_db", f"{tempfile.gettempdir()}/dramatiq-prometheus"
+    )
+    return {
+        **os.environ,
+        "dramatiq_prom_port": str(int(os.getenv("dramatiq_prom_port", "9191")) + index),
+        "dramatiq_prom_db": f"{prefix}-pool{index}",
+        "dramatiq_prom_lock": f"{prefix}-pool{index}.lock",
+        "WORKER_PROCESSES": os.getenv("WORKER_PROCESSES", str(host_processes)),
+    }
+
+
+def run_pools(pools: list[WorkerPool], poll_interval: float = 1) -> int:
+    """Run every pool in its own `dramax worker` and supervise them.
+
+    Termination signals are forwarded to all pools. When any pool exits, the
+    others are stopped and its exit code is returned.
+    """
+    processes = []
+    host_processes = sum(pool.processes for pool in pools)
+    for index, pool in enumerate(pools):
+        log.info(
+            "Starting worker pool",
+            queues=pool.queues,
+            processes=pool.processes,
+            threads=pool.threads,
+            io_mode=pool.io_mode,
+        )
+        processes.append(
+            subprocess.Popen(
+                pool.command(), env=pool_environment(index, host_processes)
+            ),  # noqa: S603
+        )
+
+    def stop(signum: int, _: FrameType | None = None) -> None:
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        while True:
+            for pool, process in zip(pools, processes, strict=True):
+                if (returncode := process.poll()) is not None:
+                    log.info("Worker pool exited", queues=pool.queues, code=returncode)
+                    stop(signal.SIGTERM)
+                    for other in processes:
+                        other.wait()
+                    return returncode
+            time.sleep(poll_interval)
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
@@ -0,0 +1,103 @@
+"""Profiling of the `worker` actor, see `dramax.common.profiling`.
+
+Tasks are profiled from before the actor is called until it returns, with its
+stages (`upstream`, `download`, `run` and `upload`) timed. The profile is stored
+as `<timestamp>-profile.prof` next to the logs of the task, and its summary in
+the `profile` field of the task.
+
+Profilers are process-wide as of Python 3.12, so the profile of a task also
+records the tasks run meanwhile by the other worker threads of the process.
+Stage timings are those of the task itself, but its hottest functions are only
+its own with a single worker thread, e.g. `--pool docker:1:1`. The number of
+threads is recorded in the summary.
+"""
+
+from __future__ import annotations
+
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import dramatiq
+from structlog import get_logger
+
+from dramax.common.profiling import Profiler
+from dramax.common.settings import settings
+from dramax.worker.writes import StatusWriter
+
+log = get_logger("dramax.worker.profiling")
+
+
+class ProfileTasks(dramatiq.Middleware):
+    def __init__(self) -> None:
+        # Middleware hooks of a message run in the thread processing it.
+        self._local = threading.local()
+        self._threads: int | None = None
+
+    def before_worker_boot(
+        self,
+        broker: dramatiq.Broker,
+        worker: dramatiq.Worker,
+    ) -> None:
+        self._threads = worker.worker_threads
+
+    def before_process_message(
+        self,
+        broker: dramatiq.Broker,
+        message: dramatiq.Message,
+    ) -> None:
+        self._local.profile = None
+        if message.actor_name != "worker":
+            return
+        from dramax.worker.utils import load_task
+
+        try:
+            workflow_id = message.args[1]
+            task = load_task(message.args[0], workflow_id)
+        except Exception:  # noqa: BLE001
+            # The actor reports invalid tasks itself.
+            return
+        if not (settings.profile_tasks or task.options.profile):
+            return
+        profiler = Profiler.start()
+        if profiler is not None:
+            self._local.profile = (profiler, task, workflow_id)
+
+    def after_process_message(
+        self,
+        broker: dramatiq.Broker,
+        message: dramatiq.Message,
+        *,
+        result: object = None,
+        exception: BaseException | None = None,
+    ) -> None:
+        profile = getattr(self._local, "profile", None)
+        if profile is None:
+            return
+        self._local.profile = None
+        profiler, task, workflow_id = profile
+        profiler.stop()
+
+        from dramax.worker.utils import task_workdir
+
+        name = datetime.now(tz=settings.timezone).strftime("%d-%m-%Y-%H:%M:%S")
+        object_name = str(Path(task_workdir(task, workflow_id), f"{name}-profile.prof"))
+        try:
+            summary = profiler.save(object_name)
+        except Exception as e:  # noqa: BLE001
+            log.warning("Failed to store task profile", task_id=task.id, error=str(e))
+            summary = profiler.summary()
+        summary.threads = self._threads
+        StatusWriter.get_instance().update_task(
+            task.id, workflow_id, profile=summary.dict()
+        )
+        log.info(
+            "Task profiled",
+            task_id=task.id,
+            workflow_id=workflow_id,
+            total=round(summary.total, 4),
+            threads=summary.threads,
+            object_name=summary.object_name,
+        )
+
+    after_skip_message = after_process_message
@@ -0,0 +1,119 @@
+"""Rate limits and in-flight caps of tasks per target host or label.
+
+Limits are declared in `settings.rate_limits`, keyed by the host of the URL of
+API tasks or by "label:<name>" for tasks with that label in `options.labels`.
+A task takes a slot of every limit that applies to it before running, and
+tasks over a limit are deferred instead of failed.
+"""
+
+from __future__ import annotations
+
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+from dramatiq.rate_limits import (
+    ConcurrentRateLimiter,
+    RateLimiter,
+    RateLimiterBackend,
+    RateLimitExceeded,
+    WindowRateLimiter,
+)
+from dramatiq.rate_limits.backends import StubBackend
+from structlog import get_logger
+
+from dramax.common.settings import RateLimit, settings
+from dramax.models.dramatiq.task import Task
+
+log = get_logger("dramax.worker.ratelimits")
+
+RATE_LIMITER_BACKENDS = ("stub", "redis", "memcached")
+
+
+def make_backend() -> RateLimiterBackend:
+    """Rate limiter backend selected by `settings.rate_limiter_backend`."""
+    name = settings.rate_limiter_backend
+    if name not in RATE_LIMITER_BACKENDS:
+        msg = f"rate_limiter_backend must be one of {', '.join(RATE_LIMITER_BACKENDS)}"
+        raise ValueError(msg)
+    if name == "stub":
+        return StubBackend()
+    try:
+        if name == "redis":
+            from dramatiq.rate_limits.backends import RedisBackend
+
+            return RedisBackend(url=settings.rate_limiter_url)
+        from dramatiq.rate_limits.backends import MemcachedBackend
+
+        return MemcachedBackend(servers=[settings.rate_limiter_url])
+    except ImportError as e:
+        msg = f"The {name} rate limiter backend requires `dramatiq[{name}]`"
+        raise ImportError(msg) from e
+
+
+def limit_keys(task: Task, limits: dict[str, RateLimit]) -> list[str]:
+    """Keys of the limits that apply to `task`."""
+    keys = []
+    if task.url and (host := urlsplit(task.url).hostname):
+        keys.append(host)
+    keys.extend(f"label:{label}" for label in task.options.labels)
+    return [key for key in keys if key in limits]
+
+
+class RateLimits:
+    _instance: RateLimits | None = None
+
+    def __init__(
+        self,
+        backend: RateLimiterBackend | None = None,
+        limits: dict[str, RateLimit] | None = None,
+    ) -> None:
+        self.limits = settings.rate_limits if limits is None else limits
+        # Backends may connect on creation, so only build one if limits are set.
+        self.backend = backend or (make_backend() if self.limits else None)
+
+    @classmethod
+    def get_instance(cls) -> RateLimits:
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def limiters(self, task: Task) -> list[RateLimiter]:
+        keys = limit_keys(task, self.limits)
+        # In-flight slots go first: they are given back when a later limit is
+        # reached, whereas requests of a window are spent once taken.
+        concurrent = [
+            ConcurrentRateLimiter(
+                self.backend,
+                f"dramax-in-flight:{key}",
+                limit=self.limits[key].max_in_flight,
+                ttl=settings.rate_limit_in_flight_ttl * 1000,
+            )
+            for key in keys
+            if self.limits[key].max_in_flight
+        ]
+        windows = [
+            WindowRateLimiter(
+                self.backend,
+                f"dramax-requests:{key}",
+                limit=self.limits[key].requests,
+                window=self.limits[key].window,
+            )
+            for key in keys
+            if self.limits[key].requests
+        ]
+        return concurrent + windows
+
+    def acquire(self, task: Task) -> ExitStack | None:
+        """Take a slot of every limit of `task`, released when the stack is closed.
+
+        Returns `None`, holding nothing, if any limit is reached.
+        """
+        stack = ExitStack()
+        for limiter in self.limiters(task):
+            try:
+                stack.enter_context(limiter.acquire(raise_on_failure=True))
+            except RateLimitExceeded:
+                stack.close()
+                log.info("Rate limit reached", task_id=task.id, key=limiter.key)
+                return None
+        return stack
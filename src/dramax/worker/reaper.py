@@ -0,0 +1,128 @@
+import time
+from datetime import datetime, timedelta
+
+from pymongo.database import Database
+from structlog import get_logger
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager
+from dramax.models.dramatiq.task import Result, Status
+from dramax.models.dramatiq.workflow import TaskInDatabase
+from dramax.worker.utils import set_workflow_run_state
+
+log = get_logger("dramax.reaper")
+
+POLICIES = ("fail", "requeue")
+
+
+class Reaper:
+    """Detect running tasks whose heartbeat expired and fail or requeue them.
+
+    Heartbeats are written by the worker process itself, so an expired heartbeat
+    means that the process died or lost its connections, and the broker
+    redelivers its unacknowledged message. With the "requeue" policy a task is
+    therefore only put back to pending, without dispatching another copy that
+    would run alongside the redelivered one, until it has been requeued
+    `max_requeues` times, after which it is failed.
+    """
+
+    def __init__(
+        self,
+        db: Database | None = None,
+        timeout: float | None = None,
+        policy: str | None = None,
+        max_requeues: int | None = None,
+    ) -> None:
+        self.db = db
+        self.timeout = timeout or settings.heartbeat_timeout
+        self.policy = policy or settings.reaper_policy
+        self.max_requeues = (
+            max_requeues if max_requeues is not None else settings.reaper_max_requeues
+        )
+        if self.policy not in POLICIES:
+            msg = f"Unknown reaper policy '{self.policy}', expected one of {POLICIES}"
+            raise ValueError(msg)
+
+    def reap(self) -> int:
+        """Handle all expired tasks once. Returns the number of tasks reaped."""
+        now = datetime.now(tz=settings.timezone)
+        task_manager = TaskManager(self.db)
+        expired = task_manager.find_stale(now - timedelta(seconds=self.timeout))
+
+        reaped = 0
+        for task in expired:
+            if self.policy == "requeue" and task.requeues < self.max_requeues:
+                reaped += self._requeue(task_manager, task, now)
+            else:
+                reaped += self._fail(task_manager, task, now)
+        return reaped
+
+    def _requeue(
+        self,
+        task_manager: TaskManager,
+        task: TaskInDatabase,
+        now: datetime,
+    ) -> bool:
+        if not task_manager.update_if_unchanged(
+            task,
+            status=Status.STATUS_PENDING,
+            requeues=task.requeues + 1,
+            updated_at=now,
+        ):
+            return False
+        log.warning(
+            "Requeuing task with expired heartbeat, to be redelivered by the broker",
+            task_id=task.id,
+            workflow_id=task.parent,
+            worker_id=task.worker_id,
+            requeues=task.requeues + 1,
+        )
+        set_workflow_run_state(workflow_id=task.parent)
+        return True
+
+    def _fail(
+        self,
+        task_manager: TaskManager,
+        task: TaskInDatabase,
+        now: datetime,
+    ) -> bool:
+        message = (
+            f"Worker '{task.worker_id}' stopped sending heartbeats for more than "
+            f"{self.timeout} seconds"
+        )
+        if not task_manager.update_if_unchanged(
+            task,
+            status=Status.STATUS_FAILED,
+            result=Result(message=message).dict(),
+            updated_at=now,
+        ):
+            return False
+        log.warning(
+            "Failing task with expired heartbeat",
+            task_id=task.id,
+            workflow_id=task.parent,
+            worker_id=task.worker_id,
+        )
+        # As in `set_failure`, a failed shard fails its fan-out task.
+        if "shard_of" in task.metadata:
+            task_manager.create_or_update_from_id(
+                task.metadata["shard_of"],
+                task.parent,
+                status=Status.STATUS_FAILED,
+                result=Result(message=f"Shard {task.id} failed").dict(),
+                updated_at=now,
+            )
+        set_workflow_run_state(workflow_id=task.parent)
+        return True
+
+    def run_forever(self, interval: float | None = None) -> None:
+        interval = interval or settings.reaper_interval
+        log.info("Reaper started", policy=self.policy, timeout=self.timeout)
+        while True:
+            try:
+                reaped = self.reap()
+                if reaped:
+                    log.info("Reaped tasks", count=reaped)
+            except Exception as e:
+                log.exception("Reaper iteration failed", error=str(e))
+            time.sleep(interval)
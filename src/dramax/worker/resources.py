@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import os
+import threading
+
+from structlog import get_logger
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.task import Options, parse_memory
+
+log = get_logger("dramax.worker.resources")
+
+
+def host_memory() -> int:
+    """Total physical memory of the host in bytes."""
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+class ResourceBudget:
+    """CPU and memory budget used to admit Docker tasks on this worker process.
+
+    By default, each of the `worker_processes` on the host gets an equal share
+    of its CPUs and memory.
+
+    Tasks without declared requirements are always admitted. A task that asks
+    for more than the whole budget is still admitted when no other reserving
+    task is running, so oversized tasks can never starve.
+    """
+
+    _instance: ResourceBudget | None = None
+
+    def __init__(self, cpus: float, memory: int) -> None:
+        self.cpus = cpus
+        self.memory = memory
+        self.used_cpus = 0.0
+        self.used_memory = 0
+        self.running = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> ResourceBudget:
+        if cls._instance is None:
+            # Each process accounts for its own tasks only, so by default the
+            # host is split evenly instead of every process claiming all of it.
+            processes = max(settings.worker_processes, 1)
+            cpus = settings.worker_cpus or (os.cpu_count() or 1) / processes
+            memory = parse_memory(settings.worker_memory) or host_memory() // processes
+            cls._instance = cls(cpus=cpus, memory=memory)
+            log.info(
+                "Worker resource budget",
+                cpus=cls._instance.cpus,
+                memory=cls._instance.memory,
+            )
+        return cls._instance
+
+    @staticmethod
+    def requirements(options: Options) -> tuple[float, int]:
+        return options.cpus or 0.0, options.memory or 0
+
+    def try_acquire(self, options: Options) -> bool:
+        """Reserve the resources declared in `options`. Returns whether it fits."""
+        cpus, memory = self.requirements(options)
+        if not cpus and not memory:
+            return True
+        with self._lock:
+            fits = (
+                self.used_cpus + cpus <= self.cpus
+                and self.used_memory + memory <= self.memory
+            )
+            if not fits and self.running > 0:
+                return False
+            self.used_cpus += cpus
+            self.used_memory += memory
+            self.running += 1
+            return True
+
+    def release(self, options: Options) -> None:
+        cpus, memory = self.requirements(options)
+        if not cpus and not memory:
+            return
+        with self._lock:
+            self.used_cpus = max(0.0, self.used_cpus - cpus)
+            self.used_memory = max(0, self.used_memory - memory)
+            self.running = max(0, self.running - 1)
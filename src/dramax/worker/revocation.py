@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from structlog import get_logger
+
+from dramax.common.cancellation import CancellationToken
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import WorkflowManager
+
+log = get_logger("dramax.worker.revocation")
+
+
+class RevocationCache:
+    """Set of recently revoked workflow ids, refreshed from MongoDB periodically.
+
+    Checking a message against the cache does not hit the database; at most
+    one query is issued every `revocation_refresh_interval` seconds.
+    """
+
+    _instance: RevocationCache | None = None
+
+    def __init__(self, refresh_interval: float | None = None) -> None:
+        self.refresh_interval = (
+            refresh_interval
+            if refresh_interval is not None
+            else settings.revocation_refresh_interval
+        )
+        self._revoked: set[str] = set()
+        self._refreshed_at = float("-inf")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> RevocationCache:
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def refresh(self) -> set[str]:
+        since = datetime.now(tz=settings.timezone) - timedelta(
+            seconds=settings.revocation_window,
+        )
+        revoked = WorkflowManager().find_revoked_ids(since)
+        with self._lock:
+            self._revoked = revoked
+            self._refreshed_at = time.monotonic()
+        return revoked
+
+    def revoked(self) -> set[str]:
+        with self._lock:
+            stale = time.monotonic() - self._refreshed_at >= self.refresh_interval
+            revoked = self._revoked
+        if stale:
+            try:
+                revoked = self.refresh()
+            except Exception as e:  # noqa: BLE001
+                log.warning("Could not refresh revoked workflows", error=str(e))
+        return revoked
+
+    def is_revoked(self, workflow_id: str) -> bool:
+        return workflow_id in self.revoked()
+
+
+class RevocationWatcher:
+    """Cancels the tokens of running tasks whose workflow gets revoked.
+
+    A daemon thread is started with the first tracked task and polls the
+    `RevocationCache` only while tasks are running.
+    """
+
+    _instance: RevocationWatcher | None = None
+
+    def __init__(self, cache: RevocationCache | None = None) -> None:
+        self.cache = cache or RevocationCache.get_instance()
+        self._tokens: dict[int, CancellationToken] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def get_instance(cls) -> RevocationWatcher:
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @contextmanager
+    def track(self, task_id: str, workflow_id: str) -> Iterator[CancellationToken]:
+        """Provide a token cancelled as soon as `workflow_id` is revoked."""
+        token = CancellationToken(task_id, workflow_id)
+        with self._lock:
+            self._tokens[id(token)] = token
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._watch,
+                    name="dramax-revocation-watcher",
+                    daemon=True,
+                )
+                self._thread.start()
+        try:
+            yield token
+        finally:
+            with self._lock:
+                self._tokens.pop(id(token), None)
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.cache.refresh_interval)
+            with self._lock:
+                tokens = list(self._tokens.values())
+            if not tokens:
+                continue
+            revoked = self.cache.revoked()
+            for token in tokens:
+                if token.workflow_id in revoked and not token.cancelled:
+                    log.info(
+                        "Cancelling running task of revoked workflow",
+                        task_id=token.task_id,
+                        workflow_id=token.workflow_id,
+                    )
+                    token.cancel()
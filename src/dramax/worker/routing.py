@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.task import Task
+
+
+def executor_type(task: Task) -> str | None:
+    """Executor used by `execute_task` for `task`: "docker", "api" or `None`."""
+    if task.image:
+        return "docker"
+    if task.url:
+        return "api"
+    return None
+
+
+def route(task: Task) -> str:
+    """Name of the queue `task` is sent to.
+
+    An explicit `options.queue_name` wins, then the first label with a queue in
+    `settings.label_queues`, then the queue of its executor type.
+    """
+    if task.options.queue_name:
+        return task.options.queue_name
+    for label in task.options.labels:
+        if label in settings.label_queues:
+            return settings.label_queues[label]
+    return settings.executor_queues.get(
+        executor_type(task),
+        settings.default_actor_opts.queue_name,
+    )
+
+
+def routed_queues() -> set[str]:
+    """Every queue tasks can be routed to by the settings."""
+    return {
+        settings.default_actor_opts.queue_name,
+        *settings.executor_queues.values(),
+        *settings.label_queues.values(),
+    }
@@ -1,25 +1,34 @@
 from collections import defaultdict
 from datetime import datetime
+from graphlib import TopologicalSorter
 
 import structlog
 from pymongo.database import Database
 
+from dramax.common.exceptions import WorkflowNotResumableError
 from dramax.common.settings import settings
+from dramax.common.tracing import Tracer, traced
 from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
 from dramax.models.dramatiq.task import Status, Task
 from dramax.models.dramatiq.workflow import Workflow, WorkflowStatus
 from dramax.services.mongo import MongoService
-from dramax.worker import set_failure, worker
+from dramax.worker.routing import route
+from dramax.worker.worker import set_failure, worker
 
 
 class Scheduler:
     def __init__(self, db: Database | None = None) -> None:
-        self.db = db or MongoService.get_database()
+        self.db = db if db is not None else MongoService.get_database()
         self.log = structlog.get_logger("dramax.scheduler")
-        self.log.info("Scheduler Initialized")
+        self.log.debug("Scheduler initialized")
 
-    def run(self, workflow: Workflow) -> None:
-        """Execute workflow."""
+    @traced("scheduler.run", workflow_id="workflow.id")
+    def run(self, workflow: Workflow, park: bool = False) -> None:
+        """Execute workflow.
+
+        With `park`, the workflow was accepted over capacity: its tasks wait for
+        `dramax dispatch` to release them.
+        """
         # Create workflow in database. We split this from the task creation
         # so that we can have a workflow in the database before any task is
         # created.
@@ -28,7 +37,10 @@ class Scheduler:
             workflow.id,
             metadata=workflow.metadata.dict(),
             created_at=datetime.now(tz=settings.timezone),
-            status=WorkflowStatus.STATUS_PENDING,
+            status=WorkflowStatus.STATUS_PARKED
+            if park
+            else WorkflowStatus.STATUS_PENDING,
+            max_parallelism=workflow.max_parallelism,
         )
 
         for task in workflow.tasks:
@@ -42,32 +54,128 @@ class Scheduler:
         if len(sorted_tasks) != len(workflow.tasks):
             msg = "Some tasks are missing"
             raise ValueError(msg)
-        log = structlog.get_logger()
         for task_id in sorted_tasks:
-            log.info("inverted_index tasks", task_id=task_id)
-            self.enqueue(task=inverted_index[task_id], workflow_id=workflow.id)
-
-    def enqueue(self, task: Task, workflow_id: str) -> None:
+            self.enqueue(
+                task=inverted_index[task_id],
+                workflow_id=workflow.id,
+                park=park or workflow.parks_tasks,
+            )
+
+    def resume(self, workflow_id: str) -> list[str]:
+        """Run again the failed tasks of a finished workflow, and their descendants.
+
+        Successful tasks keep their status and stored outputs. The other tasks
+        are reset to pending and dispatched again, upstream tasks first, under
+        the same workflow id, or parked for `dramax dispatch` as on submission.
+        Returns the ids of the reset tasks. Of concurrent resumes of a workflow,
+        only the first one runs, the others are refused.
+        """
+        workflow = WorkflowManager(self.db).find_one(id=workflow_id)
+        if workflow is None:
+            raise WorkflowNotResumableError(workflow_id, "not found")
+        if workflow.is_revoked:
+            raise WorkflowNotResumableError(workflow_id, "it was revoked")
+
+        task_manager = TaskManager(self.db)
+        tasks = task_manager.find(parent=workflow_id)
+        if any(
+            t.status in (Status.STATUS_PENDING, Status.STATUS_RUNNING) for t in tasks
+        ):
+            raise WorkflowNotResumableError(workflow_id, "tasks are still running")
+
+        # Shards are split again from their fan-out task, so they are left out.
+        tasks = {t.id: t for t in tasks if "shard_of" not in t.metadata}
+        children = defaultdict(list)
+        for task in tasks.values():
+            for upstream in task.depends_on:
+                children[upstream].append(task.id)
+
+        to_run = set()
+        stack = [t.id for t in tasks.values() if t.status != Status.STATUS_DONE]
+        while stack:
+            task_id = stack.pop()
+            if task_id not in to_run:
+                to_run.add(task_id)
+                stack.extend(children[task_id])
+        if not to_run:
+            raise WorkflowNotResumableError(workflow_id, "no task failed")
+
+        now = datetime.now(tz=settings.timezone)
+        if not WorkflowManager(self.db).claim_resume(
+            workflow_id, updated_at=now, resumed_at=now
+        ):
+            raise WorkflowNotResumableError(workflow_id, "it is being resumed already")
+        park = settings.fair_share or workflow.max_parallelism is not None
+        task_manager.delete_shards(sorted(to_run), workflow_id)
+        for task_id in to_run:
+            task_manager.reset(task_id, workflow_id, updated_at=now, parked=park)
+
+        graph = {
+            task_id: [t for t in tasks[task_id].depends_on if t in to_run]
+            for task_id in to_run
+        }
+        order = list(TopologicalSorter(graph).static_order())
+        self.log.info("Resuming workflow", workflow_id=workflow_id, tasks=order)
+        if park:
+            return order
+        for task_id in order:
+            task = tasks[task_id]
+            self.dispatch(
+                Task(**task.dict(include=set(Task.__fields__))),
+                workflow_id,
+                spec_version=task.spec_version,
+            )
+        return order
+
+    def enqueue(self, task: Task, workflow_id: str, park: bool = False) -> None:
+        """Store a task and dispatch it, unless `park` leaves it to the dispatcher."""
         task_dict = task.dict()
         self.log.info("Enqueuing task", task_id=task.id, workflow_id=workflow_id)
 
-        TaskManager().create(
+        # Resubmitting a workflow id replaces its tasks, under a new spec version.
+        task_manager = TaskManager(self.db)
+        if task.fan_out:
+            # Split again when run, as the input may have changed.
+            task_manager.delete_shards([task.id], workflow_id)
+        spec_version = task_manager.store_spec(
             task.id,
-            parent=workflow_id,
+            workflow_id,
             created_at=datetime.now(tz=settings.timezone),
             status=Status.STATUS_PENDING,
+            parked=park,
             **task_dict,
         )
 
-        self.log.info("Entering worker")
-        worker.send_with_options(
-            args=(task_dict, workflow_id),
+        if not park:
+            self.dispatch(task, workflow_id, spec_version=spec_version)
+
+    def dispatch(self, task: Task, workflow_id: str, spec_version: int = 1) -> None:
+        """Send a task, already stored in the database, to the workers.
+
+        With `settings.compact_messages`, the message only references the stored
+        spec by id and `spec_version`.
+        """
+        queue_name = route(task)
+        payload = (
+            {"id": task.id, "spec_version": spec_version}
+            if settings.compact_messages
+            else task.dict()
+        )
+        message = worker.message_with_options(
+            args=(payload, workflow_id),
             on_failure=set_failure,
-            queue_name=task.options.queue_name
-            or settings.default_actor_opts.queue_name,
             options={"task_id": task.id, "workflow_id": workflow_id},
         )
-        self.log.info("Finished worker")
+        with Tracer.get_instance().span(
+            "scheduler.dispatch",
+            "producer",
+            task_id=task.id,
+            workflow_id=workflow_id,
+            queue_name=queue_name,
+        ):
+            # Actors are bound to a single queue, the message is routed instead.
+            worker.broker.enqueue(message.copy(queue_name=queue_name))
+        self.log.debug("Task dispatched", task_id=task.id, queue_name=queue_name)
 
     @staticmethod
     def sorted_tasks(workflow: Workflow) -> list:
@@ -0,0 +1,68 @@
+"""Trace context of broker messages, see `dramax.common.tracing`.
+
+Messages enqueued within a span carry its `traceparent` in their options, and
+workers process them within a consumer span that continues the trace.
+"""
+
+from __future__ import annotations
+
+import threading
+
+import dramatiq
+
+from dramax.common.tracing import TRACEPARENT, Tracer, extract, inject
+
+
+class TraceMessages(dramatiq.Middleware):
+    def __init__(self) -> None:
+        # Middleware hooks of a message run in the thread processing it.
+        self._local = threading.local()
+
+    def before_enqueue(
+        self,
+        broker: dramatiq.Broker,
+        message: dramatiq.Message,
+        delay: int,
+    ) -> None:
+        traceparent = inject()
+        if traceparent is not None:
+            message.options[TRACEPARENT] = traceparent
+
+    def before_process_message(
+        self,
+        broker: dramatiq.Broker,
+        message: dramatiq.Message,
+    ) -> None:
+        self._local.span = None
+        tracer = Tracer.get_instance()
+        if not tracer.enabled:
+            return
+        options = message.options.get("options", {})
+        self._local.span = tracer.start_span(
+            f"{message.actor_name} process",
+            "consumer",
+            parent=extract(message.options.get(TRACEPARENT)),
+            attributes={
+                "messaging.message_id": message.message_id,
+                "messaging.destination": message.queue_name,
+                "messaging.retries": message.options.get("retries", 0),
+                "task_id": options.get("task_id"),
+                "workflow_id": options.get("workflow_id"),
+            },
+        )
+
+    def after_process_message(
+        self,
+        broker: dramatiq.Broker,
+        message: dramatiq.Message,
+        *,
+        result: object = None,
+        exception: BaseException | None = None,
+    ) -> None:
+        span = getattr(self._local, "span", None)
+        if span is None:
+            return
+        self._local.span = None
+        Tracer.get_instance().end_span(*span, exception=exception)
+
+    after_skip_message = after_process_message
@@ -1,101 +1,145 @@
-from collections.abc import Callable
+import random
 from datetime import datetime
-from typing import Any
+from functools import lru_cache
+from pathlib import Path
 
-from dramatiq import set_broker
+from dramatiq import Message, set_broker
+from dramatiq.broker import Broker
 from dramatiq.brokers.rabbitmq import RabbitmqBroker
+from dramatiq.brokers.stub import StubBroker
 from dramatiq.middleware import CurrentMessage, Retries
 from structlog import get_logger
 
 from dramax.common.configure_logger import configure_logger
+from dramax.common.exceptions import TaskSpecNotFoundError
 from dramax.common.settings import settings
-from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
-from dramax.models.dramatiq.task import Result, Status
-from dramax.models.dramatiq.workflow import WorkflowStatus
-from dramax.services.minio import MinioService
+from dramax.models.dramatiq.manager import TaskManager
+from dramax.models.dramatiq.task import Result, Status, Task
+from dramax.worker.profiling import ProfileTasks
+from dramax.worker.routing import routed_queues
+from dramax.worker.tracing import TraceMessages
+from dramax.worker.writes import FlushStatusWrites, StatusWriter
 
 configure_logger()
 
 
-def setup_worker() -> tuple[Any, RabbitmqBroker, MinioService]:
-    log = get_logger("dramax.worker")
-    log.info("Setting up RabbitMQ broker", url=settings.rabbit_dns)
+BROKER_BACKENDS = ("rabbitmq", "stub")
+
 
-    broker = RabbitmqBroker(url=settings.rabbit_dns)
+def setup_worker() -> Broker:
+    """Create the broker used by actors, RabbitMQ unless `broker_backend` is "stub".
+
+    No connection is opened here: dramatiq connects on the first enqueue or
+    consume, and MinIO/MongoDB clients are created on first use, so importing
+    the worker modules stays cheap.
+    """
+    log = get_logger("dramax.worker")
+    if settings.broker_backend not in BROKER_BACKENDS:
+        msg = f"broker_backend must be one of {', '.join(BROKER_BACKENDS)}"
+        raise ValueError(msg)
+    if settings.broker_backend == "stub":
+        log.debug("Setting up in-memory stub broker")
+        broker = StubBroker()
+    else:
+        log.debug("Setting up RabbitMQ broker", url=settings.rabbit_dns)
+        broker = RabbitmqBroker(url=settings.rabbit_dns)
     broker.add_middleware(CurrentMessage())
     broker.add_middleware(Retries(max_retries=5))
+    broker.add_middleware(FlushStatusWrites())
+    broker.add_middleware(ProfileTasks())
+    broker.add_middleware(TraceMessages())
+    # Declared up front so workers consume routed queues (unless restricted
+    # with `--queues`) before any task has been sent to them.
+    for queue_name in sorted(routed_queues()):
+        broker.declare_queue(queue_name)
 
     set_broker(broker)
-    log.info("Connected to queue", queue_name=settings.default_actor_opts.queue_name)
+    log.debug("Broker ready", queues=sorted(broker.get_declared_queues()))
+
+    return broker
+
+
+@lru_cache(maxsize=settings.task_spec_cache_size)
+def _get_task_spec(task_id: str, workflow_id: str, spec_version: int) -> Task:
+    task = TaskManager().find_one(
+        id=task_id,
+        parent=workflow_id,
+        # Tasks stored before spec versions existed are at version 1.
+        spec_version={"$in": [1, None]} if spec_version == 1 else spec_version,
+    )
+    if task is None:
+        raise TaskSpecNotFoundError(task_id, workflow_id, spec_version)
+    return Task(**task.dict(include=set(Task.__fields__)))
+
+
+def load_task(payload: dict, workflow_id: str) -> Task:
+    """Build the task of a message, fetching the spec of compact messages.
+
+    Specs are cached per process by version, so re-enqueued messages of the
+    same task do not hit MongoDB again.
+    """
+    if payload.keys() == {"id", "spec_version"}:
+        task = _get_task_spec(payload["id"], workflow_id, payload["spec_version"])
+        return task.copy(deep=True)
+    return Task(**payload)
 
-    minio_service = MinioService.get_instance()
 
-    log.info("Worker is ready")
+def task_workdir(task: Task, workflow_id: str) -> str:
+    """Local working directory of a task, mirrored by its objects in the storage."""
+    return str(Path(settings.data_dir, task.metadata["author"], workflow_id, task.id))
 
-    return broker, minio_service
+
+def defer_message(message: Message, broker: Broker, reason: str) -> int:
+    """Re-enqueue `message` with an exponential backoff. Returns the delay in ms.
+
+    The number of deferrals is kept in the message options so consecutive
+    deferrals of the same task back off further.
+    """
+    deferrals = message.options.get("deferrals", 0)
+    backoff = min(
+        settings.admission_backoff * 2**deferrals,
+        settings.admission_max_backoff,
+    )
+    delay = int(backoff * random.uniform(0.5, 1.0))  # noqa: S311
+    broker.enqueue(message.copy(options={"deferrals": deferrals + 1}), delay=delay)
+    get_logger("dramax.worker").info(
+        "Task deferred",
+        reason=reason,
+        deferrals=deferrals + 1,
+        delay_ms=delay,
+    )
+    return delay
 
 
 def set_workflow_run_state(workflow_id: str) -> None:
     """Set workflow state based on task statuses."""
-    log = get_logger("dramax.worker")
-    workflow_in_db = WorkflowManager().find_one(id=workflow_id)
-    if not workflow_in_db:
-        log.error(
-            "Workflow not found. This should not happen.",
-            workflow_id=workflow_id,
-        )
-        msg = f"Workflow `{workflow_id}` not found"
-        raise ValueError(msg)
+    StatusWriter.get_instance().refresh_workflow(workflow_id)
 
-    tasks = TaskManager().find(parent=workflow_id)
-
-    task_status_only = []
-    for task in tasks:
-        status = task.status
-        task_status_only.append(status)
-
-    def check(comp: Callable, stats: list) -> bool:
-        return comp([s in stats for s in task_status_only])
-
-    if workflow_in_db.is_revoked:
-        workflow_status = WorkflowStatus.STATUS_REVOKED
-    elif check(all, [Status.STATUS_DONE]):
-        workflow_status = WorkflowStatus.STATUS_DONE
-    elif check(all, [Status.STATUS_PENDING]):
-        workflow_status = WorkflowStatus.STATUS_PENDING
-    elif check(any, [Status.STATUS_FAILED]):
-        workflow_status = WorkflowStatus.STATUS_FAILED
-    elif check(any, [Status.STATUS_PENDING]) and not check(any, [Status.STATUS_FAILED]):
-        workflow_status = WorkflowStatus.STATUS_PENDING
-    elif check(any, [Status.STATUS_RUNNING]) and not check(any, [Status.STATUS_FAILED]):
-        workflow_status = WorkflowStatus.STATUS_RUNNING
-    else:
-        workflow_status = WorkflowStatus.STATUS_PENDING
 
-    WorkflowManager().create_or_update_from_id(
-        workflow_id=workflow_id,
+def set_running(task_id: str, workflow_id: str) -> None:
+    StatusWriter.get_instance().update_task(
+        task_id,
+        workflow_id,
         updated_at=datetime.now(tz=settings.timezone),
-        status=workflow_status,
+        status=Status.STATUS_RUNNING,
     )
 
 
-def set_running(task_id: str, workflow_id: str) -> None:
-    TaskManager().create_or_update_from_id(
+def set_revoked(task_id: str, workflow_id: str) -> None:
+    StatusWriter.get_instance().update_task(
         task_id,
         workflow_id,
         updated_at=datetime.now(tz=settings.timezone),
-        status=Status.STATUS_RUNNING,
+        status=Status.STATUS_REVOKED,
     )
-    set_workflow_run_state(workflow_id=workflow_id)
 
 
 def set_success(task_id: str, workflow_id: str, result_data: str) -> None:
     task_result = Result(log=result_data)
-    TaskManager().create_or_update_from_id(
+    StatusWriter.get_instance().update_task(
         task_id,
         workflow_id,
         updated_at=datetime.now(tz=settings.timezone),
         result=task_result.dict(),
         status=Status.STATUS_DONE,
     )
-    set_workflow_run_state(workflow_id=workflow_id)
@@ -6,17 +6,34 @@ import dramatiq
 from dramatiq.middleware import CurrentMessage
 from structlog import get_logger
 
+from dramax.common import profiling
+from dramax.common.configure_logger import Lazy
 from dramax.common.exceptions import (
     TaskDeferredError,
     TaskFailedError,
+    TaskRevokedError,
 )
 from dramax.common.settings import settings
 from dramax.models.dramatiq.manager import TaskManager
-from dramax.models.dramatiq.task import Result, Status, Task
+from dramax.models.dramatiq.task import Result, Status
 from dramax.services.executor_service import execute_task
-from dramax.worker.utils import set_success, set_workflow_run_state, setup_worker
+from dramax.worker.fanout import expand_fan_in, shard_finished, start_fan_out
+from dramax.worker.heartbeat import Heartbeat
+from dramax.worker.ratelimits import RateLimits
+from dramax.worker.resources import ResourceBudget
+from dramax.worker.revocation import RevocationCache, RevocationWatcher
+from dramax.worker.utils import (
+    defer_message,
+    load_task,
+    set_revoked,
+    set_running,
+    set_success,
+    setup_worker,
+    task_workdir,
+)
+from dramax.worker.writes import TERMINAL_STATUSES, StatusWriter
 
-broker, minio_client = setup_worker()
+broker = setup_worker()
 
 log = get_logger("dramax.worker")
 
@@ -24,27 +41,41 @@ log = get_logger("dramax.worker")
 @dramatiq.actor(**settings.default_actor_opts.dict())
 def worker(task: dict, workflow_id: str) -> None:
     message = CurrentMessage.get_current_message()
-
-    # Conversion to Task to work easier
-    parsed_task = Task(**task)
     log = get_logger()
 
     log = log.bind(
         message_id=message.message_id,
-        task_id=parsed_task.id,
+        task_id=task["id"],
         workflow_id=workflow_id,
     )
-    workdir = str(
-        Path(
-            settings.data_dir,
-            parsed_task.metadata["author"],
-            workflow_id,
-            parsed_task.id,
-        ),
-    )
 
-    log.info("Running task", task=parsed_task)
-    log.info("Work directory", workdir=workdir)
+    # Messages redelivered after the task finished, e.g. failed by the reaper, or
+    # once its requeues are used up, are acknowledged without running it again.
+    state = TaskManager().find_run_state(task["id"], workflow_id)
+    if state and (
+        Status(state.get("status") or Status.STATUS_PENDING).value in TERMINAL_STATUSES
+        or state.get("requeues", 0) > settings.reaper_max_requeues
+    ):
+        log.info(
+            "Task already finished, dropping message",
+            status=state.get("status"),
+            requeues=state.get("requeues", 0),
+        )
+        return
+
+    # Conversion to Task to work easier
+    parsed_task = load_task(task, workflow_id)
+
+    # Drop tasks of revoked workflows before doing any work.
+    if RevocationCache.get_instance().is_revoked(workflow_id):
+        log.info("Workflow revoked, dropping task")
+        set_revoked(parsed_task.id, workflow_id)
+        return
+
+    workdir = task_workdir(parsed_task, workflow_id)
+
+    log.info("Running task", task_name=parsed_task.name, workdir=workdir)
+    log.debug("Task spec", task=Lazy(parsed_task.dict))
 
     Path(workdir).mkdir(parents=True, exist_ok=True)
 
@@ -52,26 +83,69 @@ def worker(task: dict, workflow_id: str) -> None:
 
     # Check if upstream tasks have failed before running this task.
     try:
-        TaskManager().check_upstream(parsed_task, workflow_id, message, broker)
+        with profiling.stage("upstream"):
+            TaskManager().check_upstream(parsed_task, workflow_id, message, broker)
     except TaskDeferredError:
         log.info("Task deferred due to upstream dependency not finished")
         return
     except TaskFailedError as e:
         log.exception("Task cannot proceed due to upstream failure", error=str(e))
         raise
+    except TaskRevokedError:
+        log.info("Upstream task revoked, dropping task")
+        set_revoked(parsed_task.id, workflow_id)
+        return
+
+    if parsed_task.fan_out:
+        log.info("Fan-out task, dispatching shards")
+        set_running(parsed_task.id, workflow_id)
+        if start_fan_out(parsed_task, workflow_id, workdir) == 0:
+            set_success(parsed_task.id, workflow_id, "[SUCCESS] No shards to run.")
+        return
+
+    parsed_task = expand_fan_in(parsed_task, workflow_id)
+
+    rate_limits = RateLimits.get_instance().acquire(parsed_task)
+    if rate_limits is None:
+        defer_message(message, broker, reason="rate limit of target reached")
+        return
+
+    budget = ResourceBudget.get_instance()
+    if not budget.try_acquire(parsed_task.options):
+        rate_limits.close()
+        defer_message(message, broker, reason="worker resource budget exhausted")
+        return
 
     try:
         log.info("Executing task")
-        result = execute_task(parsed_task, workdir)
-
+        set_running(parsed_task.id, workflow_id)
+        with (
+            Heartbeat(parsed_task.id, workflow_id),
+            RevocationWatcher.get_instance().track(
+                parsed_task.id, workflow_id
+            ) as token,
+        ):
+            result = execute_task(parsed_task, workdir, token)
+
+    except TaskRevokedError:
+        log.info("Workflow revoked, task interrupted")
+        set_revoked(parsed_task.id, workflow_id)
+        return
     except Exception as e:
         log.exception("Task not executed properly", error=str(e))
         raise
+    finally:
+        budget.release(parsed_task.options)
+        rate_limits.close()
 
     set_success(parsed_task.id, workflow_id, result)
 
     log.info("Task finished successfully")
 
+    shard_of = parsed_task.metadata.get("shard_of")
+    if shard_of and shard_finished(parsed_task, workflow_id):
+        set_success(shard_of, workflow_id, "[SUCCESS] All shards finished.")
+
     try:
         parsed_task.cleanup_workdir(workdir)
     except Exception as e:
@@ -86,11 +160,21 @@ def set_failure(message: dramatiq.MessageProxy, exception_data: str) -> None:
     actor_opts = message["options"]["options"]
     workflow_id = actor_opts["workflow_id"]
     task_result = Result(message=exception_data)
-    TaskManager().create_or_update_from_id(
+    writer = StatusWriter.get_instance()
+    writer.update_task(
         actor_opts["task_id"],
         workflow_id,
         updated_at=datetime.now(tz=settings.timezone),
         result=task_result.dict(),
         status=Status.STATUS_FAILED,
     )
-    set_workflow_run_state(workflow_id=workflow_id)
+    # A failed shard fails its fan-out task, so downstream tasks do not wait.
+    task = TaskManager().find_one(id=actor_opts["task_id"], parent=workflow_id)
+    if task and "shard_of" in task.metadata:
+        writer.update_task(
+            task.metadata["shard_of"],
+            workflow_id,
+            updated_at=datetime.now(tz=settings.timezone),
+            result=Result(message=f"Shard {task.id} failed").dict(),
+            status=Status.STATUS_FAILED,
+        )
@@ -0,0 +1,197 @@
+"""Coalesced, batched status writes of worker processes.
+
+Status transitions of tasks are buffered per process. Updates of the same task
+within a batch are merged, later fields winning, and written with a single
+`bulk_write` once `status_batch_size` tasks are pending or every
+`status_flush_interval` seconds. Batches are written one after another, so the
+updates of a task always reach MongoDB in order. Workflow statuses are then
+recomputed once per workflow and batch, instead of after every task update.
+
+Terminal transitions (success, failure, revocation) are not buffered: they are
+written along with the pending updates of their task, and the status of their
+workflow is recomputed, before the message of the task is acknowledged. A
+worker killed meanwhile therefore only loses non-terminal updates, such as
+`running`, which the next transition overwrites.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+
+import dramatiq
+from pymongo.database import Database
+from structlog import get_logger
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
+from dramax.models.dramatiq.task import Status
+from dramax.models.dramatiq.workflow import workflow_status
+
+log = get_logger("dramax.worker.writes")
+
+TERMINAL_STATUSES = {
+    Status.STATUS_DONE.value,
+    Status.STATUS_FAILED.value,
+    Status.STATUS_REVOKED.value,
+}
+
+
+class StatusWriter:
+    _instance: StatusWriter | None = None
+
+    def __init__(
+        self,
+        db: Database | None = None,
+        batch_size: int | None = None,
+        flush_interval: float | None = None,
+    ) -> None:
+        self.db = db
+        self.batch_size = batch_size or settings.status_batch_size
+        self.flush_interval = (
+            settings.status_flush_interval if flush_interval is None else flush_interval
+        )
+        self._tasks: dict[tuple[str, str], dict] = {}
+        self._workflows: set[str] = set()
+        self._lock = threading.Lock()
+        # Held while a batch is written, so that batches never overlap.
+        self._flush_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+
+    @classmethod
+    def get_instance(cls) -> StatusWriter:
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def update_task(self, task_id: str, workflow_id: str, **fields) -> None:
+        """Set `fields` on a task, then refresh the status of its workflow."""
+        status = fields.get("status")
+        if not self.flush_interval or (
+            status is not None and Status(status).value in TERMINAL_STATUSES
+        ):
+            self._write_through(task_id, workflow_id, fields)
+            return
+        with self._lock:
+            self._tasks.setdefault((task_id, workflow_id), {}).update(fields)
+            self._workflows.add(workflow_id)
+            full = len(self._tasks) >= self.batch_size
+        self._ensure_flusher()
+        if full:
+            self.flush()
+
+    def refresh_workflow(self, workflow_id: str) -> None:
+        """Recompute the status of a workflow from the statuses of its tasks."""
+        if not self.flush_interval:
+            self._refresh_workflows({workflow_id})
+            return
+        with self._lock:
+            self._workflows.add(workflow_id)
+        self._ensure_flusher()
+
+    def flush(self) -> None:
+        """Write the pending updates. Failed batches are kept for the next flush."""
+        with self._flush_lock:
+            with self._lock:
+                tasks, self._tasks = self._tasks, {}
+                workflows, self._workflows = self._workflows, set()
+            if not tasks and not workflows:
+                return
+            try:
+                if tasks:
+                    TaskManager(self.db).bulk_update(tasks)
+                if workflows:
+                    self._refresh_workflows(workflows)
+            except Exception:
+                with self._lock:
+                    for key, fields in tasks.items():
+                        self._tasks[key] = {**fields, **self._tasks.get(key, {})}
+                    self._workflows |= workflows
+                raise
+            log.debug(
+                "Status writes flushed", tasks=len(tasks), workflows=len(workflows)
+            )
+
+    def _write_through(self, task_id: str, workflow_id: str, fields: dict) -> None:
+        # Under the flush lock, so that no earlier batch lands after this write.
+        with self._flush_lock:
+            with self._lock:
+                pending = self._tasks.pop((task_id, workflow_id), {})
+            try:
+                TaskManager(self.db).create_or_update_from_id(
+                    task_id, workflow_id, **{**pending, **fields}
+                )
+            except Exception:
+                with self._lock:
+                    self._tasks[(task_id, workflow_id)] = {
+                        **pending,
+                        **self._tasks.get((task_id, workflow_id), {}),
+                    }
+                raise
+            self._refresh_workflows({workflow_id})
+
+    def _refresh_workflows(self, workflow_ids: set[str]) -> None:
+        flags = WorkflowManager(self.db).find_revocation_flags(workflow_ids)
+        for workflow_id in workflow_ids - flags.keys():
+            log.error("Workflow not found, status not updated", workflow_id=workflow_id)
+        task_manager = TaskManager(self.db)
+        now = datetime.now(tz=settings.timezone)
+        WorkflowManager(self.db).bulk_update(
+            {
+                workflow_id: {
+                    "status": workflow_status(
+                        task_manager.find_statuses(workflow_id),
+                        is_revoked,
+                    ),
+                    "updated_at": now,
+                }
+                for workflow_id, is_revoked in flags.items()
+            },
+        )
+
+    def _ensure_flusher(self) -> None:
+        # Checked against the pid too, as threads do not survive a fork.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="dramax-status-writer",
+                daemon=True,
+            )
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:  # noqa: BLE001
+                log.warning("Failed to flush status writes", error=str(e))
+
+    def close(self) -> None:
+        """Flush what is left, e.g. when the process exits."""
+        try:
+            self.flush()
+        except Exception as e:
+            log.exception("Status writes lost on shutdown", error=str(e))
+            raise
+
+
+class FlushStatusWrites(dramatiq.Middleware):
+    """Flush buffered status writes once the worker threads of a process stop."""
+
+    def after_worker_shutdown(
+        self,
+        broker: dramatiq.Broker,
+        worker: dramatiq.Worker,
+    ) -> None:
+        StatusWriter.get_instance().close()
@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from dramax.api.app import app
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
+from dramax.models.dramatiq.task import Status
+from dramax.services.memory import InMemoryClient
+from dramax.services.mongo import MongoService
+from dramax.worker.scheduler import worker
+
+WORKFLOW = {
+    "id": "new",
+    "tasks": [
+        {"id": "a", "name": "a", "image": "busybox"},
+        {"id": "b", "name": "b", "image": "busybox"},
+    ],
+}
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    monkeypatch.setattr(MongoService, "_client", InMemoryClient())
+    monkeypatch.setattr(settings, "workflow_admission_max_tasks", 3)
+    messages = []
+    monkeypatch.setattr(worker.broker, "enqueue", messages.append)
+    now = datetime.now(tz=settings.timezone)
+    for i in range(9):
+        status = Status.STATUS_PENDING if i < 3 else Status.STATUS_DONE
+        TaskManager().create(f"t{i}", parent="busy", status=status, updated_at=now)
+    return messages
+
+
+def test_reject_with_retry_after(sent, monkeypatch):
+    monkeypatch.setattr(settings, "workflow_admission_policy", "reject")
+
+    response = TestClient(app).post("/api/v2/workflow/run", json=WORKFLOW)
+
+    assert response.status_code == 429
+    # 2 tasks over the limit, at 6 completions in the last 300 seconds.
+    assert response.headers["Retry-After"] == "100"
+    assert WorkflowManager().find_one(id="new") is None
+
+
+def test_park_until_dispatched(sent, monkeypatch):
+    monkeypatch.setattr(settings, "workflow_admission_policy", "park")
+
+    response = TestClient(app).post("/api/v2/workflow/run", json=WORKFLOW)
+
+    assert response.status_code == 202
+    assert WorkflowManager().find_one(id="new").status == "parked"
+    assert [t.parked for t in TaskManager().find(parent="new")] == [True, True]
+    assert sent == []
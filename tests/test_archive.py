@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from dramax.api.app import app
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
+from dramax.services.memory import InMemoryClient
+from dramax.services.mongo import MongoService
+from dramax.services.storage import FilesystemStore, set_storage
+from dramax.worker.archive import Archiver
+
+
+@pytest.fixture(autouse=True)
+def storage(monkeypatch, tmp_path):
+    monkeypatch.setattr(MongoService, "_client", InMemoryClient())
+    set_storage(FilesystemStore(str(tmp_path / "store")))
+    yield
+    set_storage(None)
+
+
+@pytest.mark.parametrize("backend", ["storage", "collection"])
+def test_archive_finished_workflows(backend):
+    now = datetime.now(tz=settings.timezone)
+    for workflow_id, status, age in [
+        ("old", "success", 40),
+        ("recent", "failure", 1),
+        ("running", "running", 40),
+        ("busy", "failure", 40),
+    ]:
+        updated_at = now - timedelta(days=age)
+        WorkflowManager().create_or_update_from_id(
+            workflow_id, status=status, created_at=updated_at, updated_at=updated_at
+        )
+        TaskManager().create(
+            "t", parent=workflow_id, name="t", status=status, updated_at=updated_at
+        )
+
+    # A failed branch, while another one still runs.
+    TaskManager().create("u", parent="busy", name="u", status="running")
+
+    assert Archiver(after_days=30, backend=backend).archive() == 1
+
+    assert WorkflowManager().find_one(id="old") is None
+    assert TaskManager().find(parent="old") == []
+    assert WorkflowManager().find_one(id="running") is not None
+    assert WorkflowManager().find_one(id="busy") is not None
+    assert not Archiver(backend=backend).archive_workflow("busy")
+
+    response = TestClient(app).get("/api/v2/workflow/status", params={"id": "old"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+    assert response.json()["archived_at"] is not None
+    assert [t["id"] for t in response.json()["tasks"]] == ["t"]
+    missing = TestClient(app).get("/api/v2/workflow/status", params={"id": "none"})
+    assert missing.status_code == 404
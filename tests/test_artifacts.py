@@ -0,0 +1,85 @@
+import tarfile
+
+import pytest
+
+from dramax.common.exceptions import UploadError
+from dramax.models.dramatiq.task import File, Task
+from dramax.services.artifacts import local_files, split_glob
+from dramax.services.storage import FilesystemStore, set_storage
+
+
+@pytest.fixture
+def workdirs(tmp_path):
+    set_storage(FilesystemStore(str(tmp_path / "store"), link_mode="copy"))
+    yield tmp_path / "author" / "wf" / "up", tmp_path / "author" / "wf" / "down"
+    set_storage(None)
+
+
+def test_split_glob():
+    assert split_glob("/out/") == ("/out", None)
+    assert split_glob("/out/**/*.csv") == ("/out", "**/*.csv")
+    assert split_glob("*.txt") == (".", "*.txt")
+
+
+@pytest.mark.parametrize("archive", [False, True])
+def test_directory_and_glob_round_trip(workdirs, archive):
+    up, down = workdirs
+    for name in ("a.csv", "b.txt", "nested/c.csv"):
+        (up / "results" / name).parent.mkdir(parents=True, exist_ok=True)
+        (up / "results" / name).write_text(name)
+
+    Task(
+        id="up",
+        name="up",
+        outputs=[File(path="/results/", archive=archive)],
+    ).upload_outputs(str(up))
+    Task(
+        id="down",
+        name="down",
+        inputs=[
+            File(
+                path="/in/",
+                source="up",
+                sourcePath="results/**/*.csv",
+                archive=archive,
+            )
+        ],
+    ).download_inputs(str(down))
+
+    received = sorted(
+        str(p.relative_to(down / "in")) for p in (down / "in").rglob("*") if p.is_file()
+    )
+    assert received == ["a.csv", "nested/c.csv"]
+    assert (down / "in" / "nested" / "c.csv").read_text() == "nested/c.csv"
+
+
+def test_glob_segments(tmp_path):
+    for name in ("a.csv", "b.txt", "x/c.csv", "x/y/d.csv", "x/e.txt"):
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text(name)
+
+    assert local_files(tmp_path, "*.csv") == ["a.csv"]
+    assert local_files(tmp_path, "**/*.csv") == ["a.csv", "x/c.csv", "x/y/d.csv"]
+    assert local_files(tmp_path, "x/*") == ["x/c.csv", "x/e.txt"]
+    assert local_files(tmp_path, "x/**") == ["x/c.csv", "x/e.txt", "x/y/d.csv"]
+    assert local_files(tmp_path, "?.[!c]*") == ["b.txt"]
+
+
+def test_failed_archive_is_not_stored(workdirs, monkeypatch, tmp_path):
+    up, _ = workdirs
+    for name in ("a.csv", "b.csv"):
+        (up / "results" / name).parent.mkdir(parents=True, exist_ok=True)
+        (up / "results" / name).write_bytes(b"x" * 100_000)
+    add = tarfile.TarFile.add
+
+    def failing_add(self, name, arcname=None, **kwargs):
+        if arcname == "b.csv":
+            raise OSError("Disk error")
+        return add(self, name, arcname=arcname, **kwargs)
+
+    monkeypatch.setattr(tarfile.TarFile, "add", failing_add)
+    task = Task(id="up", name="up", outputs=[File(path="/results/", archive=True)])
+
+    with pytest.raises(UploadError, match="Disk error"):
+        task.upload_outputs(str(up))
+    assert not [p for p in (tmp_path / "store").rglob("*") if p.is_file()]
@@ -0,0 +1,34 @@
+import pytest
+
+from dramax.common.cancellation import CancellationToken
+from dramax.common.exceptions import TaskRevokedError
+
+
+def test_cancel_runs_callbacks_once_and_raises():
+    token = CancellationToken("t1", "workflow-1")
+    calls = []
+    token.on_cancel(lambda: calls.append("stop"))
+    token.raise_if_cancelled()
+
+    token.cancel()
+    token.cancel()
+
+    assert calls == ["stop"]
+    with pytest.raises(TaskRevokedError):
+        token.raise_if_cancelled()
+
+
+def test_removed_callback_is_not_called():
+    token = CancellationToken()
+    calls = []
+
+    def callback():
+        calls.append("stop")
+
+    token.on_cancel(callback)
+    token.remove_callback(callback)
+    token.cancel()
+
+    assert calls == []
+    token.on_cancel(callback)
+    assert calls == ["stop"]
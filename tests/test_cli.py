@@ -0,0 +1,68 @@
+import sys
+
+import pytest
+
+from dramax.__main__ import cli
+from dramax.common.settings import settings
+
+
+@pytest.fixture
+def started(monkeypatch):
+    """Arguments dramatiq is started with, and whether gevent patched the process."""
+    calls = {"patched": False}
+    monkeypatch.setattr("dramatiq.cli.main", lambda ns: calls.update(ns=ns))
+    monkeypatch.setattr("gevent.monkey.patch_all", lambda: calls.update(patched=True))
+    monkeypatch.setattr(
+        "dramax.worker.pools.run_pools", lambda pools: calls.update(pools=pools)
+    )
+    monkeypatch.setattr(settings, "worker_pools", [])
+    monkeypatch.setenv("WORKER_PROCESSES", "")
+    monkeypatch.delenv("WORKER_PROCESSES")
+    return calls
+
+
+def run(monkeypatch, *args: str) -> None:
+    monkeypatch.setattr(sys, "argv", ["dramax", "worker", *args])
+    cli()
+
+
+def test_threads_mode(monkeypatch, started):
+    run(monkeypatch, "--processes", "2", "--threads", "4")
+
+    assert not started["patched"]
+    assert (started["ns"].threads, started["ns"].processes) == (4, 2)
+    assert started["ns"].broker == "dramax.worker.scheduler"
+
+
+@pytest.mark.parametrize(
+    ("args", "threads"),
+    [
+        ((), 1000),
+        (("-t", "50"), 50),
+        (("--threads=50",), 50),
+    ],
+)
+def test_gevent_mode(monkeypatch, started, args, threads):
+    monkeypatch.setattr(settings, "gevent_worker_threads", 1000)
+
+    run(monkeypatch, "--io-mode", "gevent", *args)
+
+    assert started["patched"]
+    assert started["ns"].threads == threads
+
+
+def test_unknown_mode_is_rejected(monkeypatch, started):
+    with pytest.raises(SystemExit):
+        run(monkeypatch, "--io-mode", "asyncio")
+    assert "ns" not in started
+
+
+def test_queues_override_default_pools(monkeypatch, started):
+    monkeypatch.setattr(settings, "worker_pools", ["docker:2:1"])
+
+    with pytest.raises(SystemExit):
+        run(monkeypatch)
+    assert [pool.queues for pool in started["pools"]] == [["docker"]]
+
+    run(monkeypatch, "--queues", "api")
+    assert "ns" in started
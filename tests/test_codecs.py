@@ -0,0 +1,30 @@
+import io
+
+import pytest
+
+from dramax.services.codecs import get_codec
+
+
+@pytest.mark.parametrize("name", ["gzip", "zstd"])
+def test_codec_round_trip(tmp_path, name):
+    if name == "zstd":
+        pytest.importorskip("zstandard")
+    codec = get_codec(name, level=1)
+    data = b"".join(b"%d,feature-%d\n" % (i, i % 13) for i in range(50_000))
+    source = tmp_path / "data.csv"
+    source.write_bytes(data)
+
+    codec.compress_file(str(source), str(tmp_path / "data.z"))
+    codec.decompress_file(str(tmp_path / "data.z"), str(tmp_path / "data.out"))
+    assert (tmp_path / "data.out").read_bytes() == data
+    assert (tmp_path / "data.z").stat().st_size < len(data) // 2
+
+    compressed = codec.compressing_reader(io.BytesIO(data))
+    reader = codec.decompressing_reader(io.BytesIO(compressed.read()))
+    assert b"".join(iter(lambda: reader.read(1000), b"")) == data
+
+
+def test_unknown_codec():
+    assert get_codec(None) is None
+    with pytest.raises(ValueError, match="Unknown codec"):
+        get_codec("lz4")
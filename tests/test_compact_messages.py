@@ -0,0 +1,44 @@
+import pytest
+
+from dramax.models.dramatiq.manager import TaskManager
+from dramax.models.dramatiq.task import Task
+from dramax.services.memory import InMemoryClient
+from dramax.services.mongo import MongoService
+from dramax.worker.scheduler import Scheduler, worker
+from dramax.worker.utils import load_task
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    monkeypatch.setattr(MongoService, "_client", InMemoryClient())
+    monkeypatch.setattr("dramax.common.settings.settings.compact_messages", True)
+    messages = []
+    monkeypatch.setattr(worker.broker, "enqueue", messages.append)
+    return messages
+
+
+def make_task(**fields) -> Task:
+    return Task(id="t1", name="t1", image="busybox", **fields)
+
+
+def test_compact_message_loads_stored_spec(sent):
+    task = make_task(environment={"KEY": "value"})
+    Scheduler().enqueue(task, "w-compact")
+
+    payload, workflow_id = sent[0].args
+    assert payload == {"id": "t1", "spec_version": 1}
+    assert load_task(payload, workflow_id) == task
+
+
+def test_resubmitted_task_is_not_served_from_cache(sent):
+    Scheduler().enqueue(make_task(environment={"KEY": "old"}), "w-compact")
+    load_task(*sent[0].args)  # Cached by this worker process.
+
+    task = make_task(environment={"KEY": "new"})
+    Scheduler().enqueue(task, "w-compact")
+
+    payload, workflow_id = sent[1].args
+    assert payload == {"id": "t1", "spec_version": 2}
+    assert load_task(payload, workflow_id) == task
+    # Replaced in place, not stored twice.
+    assert len(TaskManager().find(id="t1", parent="w-compact")) == 1
@@ -0,0 +1,111 @@
+import threading
+import time
+
+from dramax.models.executor.pool import ContainerPool
+
+
+class FakeContainer:
+    short_id = "fake"
+
+    def __init__(self) -> None:
+        self.status = "running"
+        self.removed = False
+        self.commands = []
+
+    def reload(self) -> None:
+        pass
+
+    def kill(self) -> None:
+        self.status = "exited"
+
+    def remove(self, **_) -> None:
+        self.removed = True
+
+    def exec_run(self, cmd, **_):
+        self.commands.append(cmd)
+        return 0, b"done"
+
+
+class FakeImage:
+    attrs = {"Config": {"Entrypoint": ["tool"]}}
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.started = []
+        self.images = self
+        self.containers = self
+
+    def login(self, **_) -> None:
+        pass
+
+    def pull(self, _):
+        return FakeImage()
+
+    def run(self, **kwargs):
+        container = FakeContainer()
+        container.volumes = kwargs["volumes"]
+        self.started.append(container)
+        return container
+
+
+def test_pool_reuses_idle_container(tmp_path, monkeypatch):
+    monkeypatch.setattr("dramax.common.settings.settings.data_dir", str(tmp_path))
+    client = FakeClient()
+    pool = ContainerPool(client=client, max_size=2)
+
+    for workdir in ("alice/wf/t1", "alice/wf/t2", "bob/wf/t1"):
+        exit_code, output = pool.execute("busybox", ["--flag"], str(tmp_path / workdir))
+        assert (exit_code, output) == (0, "done")
+
+    # Containers are only shared by the tasks of an author, whose directory they mount.
+    alice, bob = client.started
+    assert list(alice.volumes) == [str(tmp_path / "alice")]
+    assert list(bob.volumes) == [str(tmp_path / "bob")]
+    script = alice.commands[-2][-1]
+    assert "/mnt/.dramax/wf/t2/mnt/inputs" in script
+    assert script.endswith("exec tool --flag")
+
+
+def test_pool_replaces_unhealthy_and_evicts_idle_containers():
+    client = FakeClient()
+    pool = ContainerPool(client=client, max_size=1, idle_timeout=60)
+
+    pooled = pool.acquire("busybox")
+    pooled.container.status = "exited"
+    pool.release(pooled)
+    replacement = pool.acquire("busybox")
+    assert replacement is not pooled
+    assert pooled.container.removed
+
+    replacement.last_used -= 120
+    pool.release(replacement)
+    replacement.last_used -= 120
+    pool.evict_idle()
+    assert replacement.container.removed
+
+
+def test_pool_blocks_at_max_size():
+    pool = ContainerPool(client=FakeClient(), max_size=1)
+    first = pool.acquire("busybox")
+    acquired = []
+
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire("busybox")))
+    waiter.start()
+    waiter.join(timeout=0.2)
+    assert not acquired
+
+    pool.release(first)
+    waiter.join(timeout=1)
+    assert acquired == [first]
+
+
+def test_idle_containers_are_evicted_without_new_tasks():
+    pool = ContainerPool(client=FakeClient(), max_size=1, idle_timeout=0.05)
+    pooled = pool.acquire("busybox")
+    pool.release(pooled)
+
+    deadline = time.monotonic() + 2
+    while not pooled.container.removed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pooled.container.removed
@@ -0,0 +1,97 @@
+import pytest
+
+from dramax.models.dramatiq.manager import TaskManager
+from dramax.models.dramatiq.task import Status
+from dramax.models.dramatiq.workflow import Workflow
+from dramax.services.memory import InMemoryClient
+from dramax.services.mongo import MongoService
+from dramax.worker.dispatcher import Dispatcher
+from dramax.worker.scheduler import Scheduler, worker
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    monkeypatch.setattr(MongoService, "_client", InMemoryClient())
+    monkeypatch.setattr("dramax.common.settings.settings.fair_share", True)
+    messages = []
+    monkeypatch.setattr(worker.broker, "enqueue", messages.append)
+    return messages
+
+
+def submit(workflow_id: str, author: str, count: int, **fields) -> None:
+    tasks = [
+        {"id": f"{workflow_id}-{i}", "name": "t", "image": "busybox"}
+        for i in range(count)
+    ]
+    workflow = Workflow(id=workflow_id, tasks=tasks, metadata={"author": author})
+    Scheduler().run(workflow.copy(update=fields))
+
+
+def released(sent: list) -> list[str]:
+    return [message.args[0]["id"] for message in sent]
+
+
+def finish(task_ids: list[str]) -> None:
+    for task_id in task_ids:
+        workflow_id = task_id.rsplit("-", 1)[0]
+        TaskManager().create_or_update_from_id(
+            task_id, workflow_id, status=Status.STATUS_DONE
+        )
+
+
+def test_authors_share_slots_by_weight(sent):
+    submit("batch", "batch", 20)
+    submit("alice", "alice", 3)
+    submit("bob", "bob", 3)
+    assert sent == []
+
+    dispatcher = Dispatcher(max_in_flight=6, weights={"alice": 2})
+    assert dispatcher.dispatch() == 6
+    # Two rounds: alice releases two tasks per round, batch and bob one each.
+    assert sorted(released(sent)) == [
+        "alice-0",
+        "alice-1",
+        "alice-2",
+        "batch-0",
+        "batch-1",
+        "bob-0",
+    ]
+    assert dispatcher.dispatch() == 0  # Every slot is taken.
+
+    finish(released(sent))
+    sent.clear()
+    assert dispatcher.dispatch() == 6
+    assert sorted(released(sent)) == [
+        "batch-2",
+        "batch-3",
+        "batch-4",
+        "batch-5",
+        "bob-1",
+        "bob-2",
+    ]
+
+
+def test_max_parallelism_and_upstream_tasks(sent):
+    workflow = Workflow(
+        id="wf",
+        max_parallelism=2,
+        tasks=[
+            {"id": "wf-a", "name": "a", "image": "busybox"},
+            {"id": "wf-b", "name": "b", "image": "busybox"},
+            {"id": "wf-c", "name": "c", "image": "busybox"},
+            {"id": "wf-d", "name": "d", "image": "busybox", "depends_on": ["wf-a"]},
+        ],
+    )
+    Scheduler().run(workflow)
+    parked = TaskManager().find_parked()
+    assert [t.id for t in parked] == ["wf-a", "wf-b", "wf-c", "wf-d"]
+    assert "image" not in parked[0].dict()  # Specs are loaded on release only.
+    dispatcher = Dispatcher(max_in_flight=10)
+
+    assert dispatcher.dispatch() == 2
+    assert released(sent) == ["wf-a", "wf-b"]
+    finish(["wf-a"])
+    assert dispatcher.dispatch() == 1
+    finish(["wf-b", "wf-c"])
+    assert dispatcher.dispatch() == 1
+    assert released(sent) == ["wf-a", "wf-b", "wf-c", "wf-d"]
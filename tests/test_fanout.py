@@ -0,0 +1,167 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager
+from dramax.models.dramatiq.task import File, Status, Task
+from dramax.services.memory import InMemoryClient
+from dramax.services.mongo import MongoService
+from dramax.services.storage import FilesystemStore, get_storage, set_storage
+from dramax.worker.fanout import expand_fan_in, shard_finished, start_fan_out
+from dramax.worker.reaper import Reaper
+from dramax.worker.scheduler import Scheduler, worker
+from dramax.worker.writes import StatusWriter
+
+
+@pytest.fixture
+def sent(monkeypatch, tmp_path):
+    monkeypatch.setattr(MongoService, "_client", InMemoryClient())
+    monkeypatch.setattr(StatusWriter, "_instance", StatusWriter(flush_interval=0))
+    monkeypatch.setattr("dramax.common.settings.settings.data_dir", str(tmp_path))
+    set_storage(FilesystemStore(str(tmp_path / "store")))
+    messages = []
+    monkeypatch.setattr(worker.broker, "enqueue", messages.append)
+    yield messages
+    set_storage(None)
+
+
+def test_fan_out_by_lines_with_concurrency_cap(sent, tmp_path):
+    task = Task(
+        id="map",
+        name="map",
+        image="busybox",
+        inputs=[File(name="rows", path="/rows.txt")],
+        fan_out={
+            "input": "rows",
+            "split_by": "lines",
+            "shard_size": 2,
+            "max_concurrency": 2,
+        },
+        metadata={"author": "someone"},
+    )
+    workdir = str(tmp_path / "someone" / "wf" / "map")
+    rows = tmp_path / "rows.txt"
+    rows.write_text("1\n2\n3\n4\n5\n")
+    get_storage().upload_object(str(rows), task.inputs[0].get_object_name(workdir))
+    TaskManager().create("map", parent="wf", **task.dict(exclude={"id"}))
+
+    assert start_fan_out(task, "wf", workdir) == 3
+    assert [m.args[0]["id"] for m in sent] == ["map-shard-00000", "map-shard-00001"]
+
+    shard = Task(**sent[-1].args[0])
+    shard_workdir = str(tmp_path / "someone" / "wf" / shard.id)
+    shard.download_inputs(shard_workdir)
+    assert Path(shard_workdir, "rows.txt").read_text() == "3\n4\n"
+
+    assert not shard_finished(shard, "wf")
+    assert len(sent) == 3  # The last shard takes the freed slot.
+    # A redelivered shard is counted once, and frees no other slot.
+    assert not shard_finished(shard, "wf")
+    assert len(sent) == 3
+    first, last = (Task(**m.args[0]) for m in (sent[0], sent[2]))
+    assert not shard_finished(first, "wf")
+    assert not shard_finished(first, "wf")
+    assert shard_finished(last, "wf")
+    assert not shard_finished(last, "wf")  # Completes the fan-out only once.
+
+    reduce = Task(
+        id="reduce",
+        name="reduce",
+        image="busybox",
+        inputs=[File(path="/parts", source="map", sourcePath="out.csv")],
+    )
+    paths = [(f.path, f.source) for f in expand_fan_in(reduce, "wf").inputs]
+    assert paths == [
+        ("/parts/00000/out.csv", "map-shard-00000"),
+        ("/parts/00001/out.csv", "map-shard-00001"),
+        ("/parts/00002/out.csv", "map-shard-00002"),
+    ]
+
+
+def test_fan_out_validation():
+    with pytest.raises(ValueError, match="not an input"):
+        Task(id="t", name="t", fan_out={"input": "missing", "shards": 2})
+    with pytest.raises(ValueError, match="exactly one"):
+        Task(
+            id="t",
+            name="t",
+            inputs=[File(name="in", path="/in")],
+            fan_out={"input": "in", "shards": 2, "shard_size": 10},
+        )
+
+
+def test_reaper_spares_fan_out_with_running_shards(sent, tmp_path):
+    task = Task(
+        id="map",
+        name="map",
+        image="busybox",
+        inputs=[File(name="rows", path="/rows.txt")],
+        fan_out={"input": "rows", "split_by": "lines", "shard_size": 1},
+        metadata={"author": "someone"},
+    )
+    workdir = str(tmp_path / "someone" / "wf" / "map")
+    rows = tmp_path / "rows.txt"
+    rows.write_text("1\n2\n")
+    get_storage().upload_object(str(rows), task.inputs[0].get_object_name(workdir))
+    manager = TaskManager()
+    long_ago = datetime.now(tz=settings.timezone) - timedelta(hours=1)
+    manager.create(
+        "map", parent="wf", status=Status.STATUS_RUNNING, **task.dict(exclude={"id"})
+    )
+    start_fan_out(task, "wf", workdir)
+    for task_id in ("map", "map-shard-00000", "map-shard-00001"):
+        manager.create_or_update_from_id(
+            task_id, "wf", status=Status.STATUS_RUNNING, updated_at=long_ago
+        )
+    now = datetime.now(tz=settings.timezone)
+    manager.create_or_update_from_id("map-shard-00000", "wf", heartbeat_at=now)
+
+    reaper = Reaper(timeout=60, policy="fail")
+    assert reaper.reap() == 1  # Only the shard that stopped sending heartbeats.
+    assert (
+        manager.find_one(id="map-shard-00001", parent="wf").status
+        == Status.STATUS_FAILED
+    )
+    assert (
+        manager.find_one(id="map-shard-00000", parent="wf").status
+        == Status.STATUS_RUNNING
+    )
+    # The fan-out task is failed along with its shard, not for its own heartbeat.
+    parent = manager.find_one(id="map", parent="wf")
+    assert parent.status == Status.STATUS_FAILED
+    assert parent.result.message == "Shard map-shard-00001 failed"
+
+
+def test_resubmitted_fan_out_is_split_again(sent, tmp_path):
+    task = Task(
+        id="map",
+        name="map",
+        image="busybox",
+        inputs=[File(name="rows", path="/rows.txt")],
+        fan_out={"input": "rows", "split_by": "lines", "shard_size": 1},
+        metadata={"author": "someone"},
+    )
+    workdir = str(tmp_path / "someone" / "wf" / "map")
+    rows = tmp_path / "rows.txt"
+    rows.write_text("1\n2\n")
+    get_storage().upload_object(str(rows), task.inputs[0].get_object_name(workdir))
+    Scheduler().enqueue(task, "wf")
+    assert start_fan_out(task, "wf", workdir) == 2
+    shard = Task(**sent[-1].args[0])
+    TaskManager().create_or_update_from_id("map", "wf", worker_id="w", requeues=1)
+    shard_finished(shard, "wf")
+
+    rows.write_text("1\n2\n3\n")
+    get_storage().upload_object(str(rows), task.inputs[0].get_object_name(workdir))
+    Scheduler().enqueue(task, "wf")
+    stored = TaskManager().find_one(id="map", parent="wf")
+    assert (stored.shards, stored.done_shards, stored.worker_id, stored.requeues) == (
+        None,
+        [],
+        None,
+        0,
+    )
+    assert TaskManager().find(parent="wf") == [stored]  # Old shards are deleted.
+    assert start_fan_out(task, "wf", workdir) == 3
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from dramax.api.app import app
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
+from dramax.services.memory import InMemoryClient
+from dramax.services.mongo import MongoService
+from dramax.worker.archive import Archiver
+
+
+@pytest.fixture(autouse=True)
+def client(monkeypatch):
+    monkeypatch.setattr(MongoService, "_client", InMemoryClient())
+    now = datetime.now(tz=settings.timezone)
+    for i in range(5):
+        workflow_id = f"wf-{i}"
+        WorkflowManager().create_or_update_from_id(
+            workflow_id,
+            metadata={"author": "alice" if i % 2 else "bob"},
+            status="success" if i < 3 else "running",
+            created_at=now - timedelta(hours=5 - i),
+            updated_at=now,
+        )
+        for task_id, status in [
+            ("a", "success"),
+            ("b", "success" if i < 3 else "running"),
+        ]:
+            TaskManager().create(
+                task_id, parent=workflow_id, name=task_id, status=status
+            )
+    with TestClient(app) as client:
+        yield client
+
+
+def test_list_pages_newest_first(client):
+    ids, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/v2/workflow/list", params=params).json()
+        ids += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == ["wf-4", "wf-3", "wf-2", "wf-1", "wf-0"]
+
+    page = client.get(
+        "/api/v2/workflow/list", params={"author": "bob", "status": "success"}
+    ).json()
+    assert [item["id"] for item in page["items"]] == ["wf-2", "wf-0"]
+    assert page["items"][0]["tasks"] == {"success": 2}
+
+    invalid = client.get("/api/v2/workflow/list", params={"cursor": "nope"})
+    assert invalid.status_code == 400
+
+
+def test_bulk_status_resolves_archived_and_missing(client):
+    Archiver(after_days=0, backend="collection").archive_workflow("wf-0")
+
+    response = client.post(
+        "/api/v2/workflow/status/bulk", json={"ids": ["wf-3", "wf-0", "none"]}
+    )
+
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert [item["id"] for item in items] == ["wf-3", "wf-0"]
+    assert items[0]["tasks"] == {"success": 1, "running": 1}
+    assert items[0]["status"] == "running"
+    assert items[1]["archived_at"] is not None
+    assert response.json()["missing"] == ["none"]
@@ -0,0 +1,29 @@
+from dramax.api.loadtest import LoadTest, percentile
+from dramax.common.settings import settings
+from dramax.services.mongo import MongoService
+from dramax.worker.scheduler import worker
+
+
+def test_percentile():
+    latencies = [float(i) for i in range(1, 101)]
+    assert percentile(latencies, 50) == 50
+    assert percentile(latencies, 99) == 99
+    assert percentile(latencies, 100) == 100
+    assert percentile([], 50) == 0
+
+
+def test_loadtest_reports_each_endpoint(monkeypatch):
+    monkeypatch.setattr(MongoService, "_client", None)
+    monkeypatch.setattr(settings, "broker_backend", settings.broker_backend)
+    # The broker may have been created before the test switched to the stub one.
+    monkeypatch.setattr(worker.broker, "enqueue", lambda message, **kw: message)
+
+    report = LoadTest(
+        run_rate=20, status_rate=40, duration=0.5, concurrency=4, seed_workflows=2
+    ).run()
+
+    assert [e.endpoint for e in report.endpoints] == ["run", "status"]
+    run, status = report.endpoints
+    assert (run.requests, status.requests) == (10, 20)
+    assert run.errors == status.errors == 0
+    assert 0 < status.p50 <= status.p99 <= status.max
@@ -0,0 +1,70 @@
+import pytest
+
+from dramax.models.dramatiq.workflow import Workflow
+from dramax.services import local
+from dramax.services.local import LocalRunner
+from dramax.services.mongo import MongoService
+from dramax.services.storage import FilesystemStore, get_storage, set_storage
+
+
+def make_workflow() -> Workflow:
+    return Workflow(
+        id="workflow-local",
+        tasks=[
+            {"id": "t1", "name": "first", "image": "busybox"},
+            {"id": "t2", "name": "second", "image": "busybox", "depends_on": ["t1"]},
+            {"id": "t3", "name": "third", "image": "busybox", "depends_on": ["t2"]},
+        ],
+    )
+
+
+def test_local_runner_respects_dependencies(monkeypatch, tmp_path):
+    executed = []
+    monkeypatch.setattr(
+        local, "execute_task", lambda task, _: executed.append(task.id) or "ok"
+    )
+
+    report = LocalRunner(make_workflow(), storage_dir=str(tmp_path)).run()
+
+    assert executed == ["t1", "t2", "t3"]
+    assert report.status == "success"
+    assert [task.status for task in report.tasks] == ["success"] * 3
+
+
+def test_local_runner_restores_the_services(monkeypatch, tmp_path):
+    monkeypatch.setattr(local, "execute_task", lambda task, _: "ok")
+    client, store = object(), FilesystemStore(str(tmp_path / "store"))
+    monkeypatch.setattr(MongoService, "_client", client)
+    set_storage(store)
+
+    try:
+        LocalRunner(make_workflow(), storage_dir=str(tmp_path)).run()
+        assert (MongoService._client, get_storage()) == (client, store)
+    finally:
+        set_storage(None)
+
+
+def test_local_runner_skips_downstream_of_failed_task(monkeypatch, tmp_path):
+    def execute(task, _):
+        if task.id == "t2":
+            raise RuntimeError("boom")
+        return "ok"
+
+    monkeypatch.setattr(local, "execute_task", execute)
+
+    report = LocalRunner(make_workflow(), storage_dir=str(tmp_path)).run()
+
+    statuses = {task.id: task.status for task in report.tasks}
+    assert report.status == "failure"
+    assert statuses == {"t1": "success", "t2": "failure", "t3": "failure"}
+
+
+def test_local_runner_rejects_unknown_dependencies(tmp_path):
+    workflow = Workflow(
+        tasks=[
+            {"id": "t1", "name": "first", "image": "busybox", "depends_on": ["nope"]}
+        ]
+    )
+
+    with pytest.raises(ValueError):
+        LocalRunner(workflow, storage_dir=str(tmp_path)).run()
@@ -0,0 +1,87 @@
+import io
+import json
+import logging
+import os
+import time
+
+import pytest
+import structlog
+
+from dramax.common.configure_logger import Lazy, configure_logger
+from dramax.common.settings import settings
+
+
+@pytest.fixture
+def output(monkeypatch):
+    monkeypatch.setattr(settings, "log_format", "json")
+    stream = io.StringIO()
+
+    def lines():
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield stream, lines
+    monkeypatch.undo()
+    configure_logger(force=True)
+
+
+def test_json_events_and_lazy_values(output):
+    stream, lines = output
+    configure_logger(force=True, stream=stream)
+    calls = []
+
+    def expensive():
+        calls.append(1)
+        return {"image": "alpine"}
+
+    log = structlog.get_logger("dramax.worker")
+    log.debug("Task spec", task=Lazy(expensive))
+    log.info("Running task", task_id="a", task=Lazy(expensive))
+
+    (event,) = lines()
+    assert event["event"] == "Running task"
+    assert event["level"] == "info"
+    assert event["logger"] == "dramax.worker"
+    assert event["task"] == {"image": "alpine"}
+    assert len(calls) == 1
+
+
+def test_levels_and_sampling_per_logger(output, monkeypatch):
+    stream, lines = output
+    monkeypatch.setattr(settings, "log_levels", {"dramax.minio": "DEBUG"})
+    monkeypatch.setattr(settings, "log_sampling", {"dramax.scheduler": 0})
+    configure_logger(force=True, stream=stream)
+
+    structlog.get_logger("dramax.minio").debug("Uploading")
+    structlog.get_logger("dramax.worker").debug("Task spec")
+    scheduler = structlog.get_logger("dramax.scheduler")
+    scheduler.info("Task dispatched")
+    scheduler.warning("Workflow stuck")
+
+    assert [e["event"] for e in lines()] == ["Uploading", "Workflow stuck"]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Needs os.fork")
+def test_async_output_of_forked_processes(output, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "log_async", True)
+    path = tmp_path / "log.jsonl"
+    with path.open("w", buffering=1) as stream:
+        configure_logger(force=True, stream=stream)
+        log = structlog.get_logger("dramax.worker")
+        # The thread writing the output starts in the parent, as in `dramax worker`.
+        log.info("From parent")
+        deadline = time.monotonic() + 5
+        while "From parent" not in path.read_text() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                log.info("From child")
+                logging.shutdown()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        configure_logger(force=True)
+
+    events = [json.loads(line)["event"] for line in path.read_text().splitlines()]
+    assert events == ["From parent", "From child"]
@@ -0,0 +1,144 @@
+import hashlib
+
+import pytest
+import urllib3
+
+from dramax.common.cancellation import CancellationToken
+from dramax.common.exceptions import TaskRevokedError
+from dramax.services.codecs import CODEC_METADATA, GzipCodec
+from dramax.services.minio import MinioService, s3_etag
+
+MiB = 1024 * 1024
+
+
+class FakeStat:
+    def __init__(self, data: bytes, metadata: dict | None = None) -> None:
+        self.size = len(data)
+        self.etag = f'"{hashlib.md5(data).hexdigest()}"'  # noqa: S324
+        self.metadata = metadata or {}
+
+
+class FakeResponse:
+    def __init__(self, data: bytes, fail_after: int | None) -> None:
+        self.data = data
+        self.fail_after = fail_after
+
+    def stream(self, amt: int):
+        sent = 0
+        while sent < len(self.data):
+            if self.fail_after is not None and sent >= self.fail_after:
+                raise urllib3.exceptions.ProtocolError("connection reset")
+            chunk = self.data[sent : sent + min(amt, 10)]
+            sent += len(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        pass
+
+    def release_conn(self) -> None:
+        pass
+
+
+class FakeMinio:
+    def __init__(self, data: bytes, metadata: dict | None = None) -> None:
+        self.data = data
+        self.metadata = metadata
+        self.offsets = []
+
+    def stat_object(self, **_):
+        return FakeStat(self.data, self.metadata)
+
+    def get_object(self, offset=0, **_):
+        self.offsets.append(offset)
+        fail_after = 30 if len(self.offsets) == 1 else None
+        return FakeResponse(self.data[offset:], fail_after)
+
+
+class CancellingResponse(FakeResponse):
+    """Cancels `token` once some chunks have been written."""
+
+    def __init__(self, data: bytes, token: CancellationToken) -> None:
+        super().__init__(data, fail_after=None)
+        self.token = token
+        self.closed = False
+
+    def stream(self, amt: int):
+        for i, chunk in enumerate(super().stream(amt)):
+            if i == 3:
+                self.token.cancel()
+            yield chunk
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_s3_etag_single_and_multipart(tmp_path):
+    path = tmp_path / "data.bin"
+    data = bytes(range(256)) * (44 * 1024)  # 11 MiB
+    path.write_bytes(data)
+
+    assert s3_etag(str(path), part_size=20 * MiB) == hashlib.md5(data).hexdigest()  # noqa: S324
+    parts = [data[i : i + 5 * MiB] for i in range(0, len(data), 5 * MiB)]
+    combined = b"".join(hashlib.md5(p).digest() for p in parts)  # noqa: S324
+    assert s3_etag(str(path), part_size=5 * MiB) == (
+        f"{hashlib.md5(combined).hexdigest()}-3"  # noqa: S324
+    )
+
+
+def test_download_resumes_after_connection_error(tmp_path):
+    service = MinioService()
+    service._bucket_ready = True
+    service.client = FakeMinio(b"0123456789" * 10)
+
+    target = tmp_path / "out" / "file.txt"
+    service.get_object(str(target), "wf/task/file.txt")
+
+    assert target.read_bytes() == b"0123456789" * 10
+    assert service.client.offsets == [0, 30]
+    assert not list(target.parent.glob("*.part.minio"))
+
+
+def test_download_is_cancelled_midway(tmp_path):
+    token = CancellationToken("task", "wf")
+    service = MinioService()
+    service._bucket_ready = True
+    service.client = FakeMinio(b"0123456789" * 10)
+    response = CancellingResponse(service.client.data, token)
+    service.client.get_object = lambda **_: response
+
+    target = tmp_path / "out" / "file.txt"
+    with pytest.raises(TaskRevokedError):
+        service.get_object(str(target), "wf/task/file.txt", token)
+
+    assert response.closed
+    assert list(target.parent.iterdir()) == []  # Partial data is discarded.
+
+
+def test_download_empty_object(tmp_path):
+    service = MinioService()
+    service._bucket_ready = True
+    service.client = FakeMinio(b"")
+
+    target = tmp_path / "out" / "empty.txt"
+    service.get_object(str(target), "wf/task/empty.txt")
+
+    assert target.read_bytes() == b""
+    assert service.client.offsets == []
+    assert [p.name for p in target.parent.iterdir()] == ["empty.txt"]
+
+
+def test_download_decompresses_by_object_metadata(tmp_path):
+    data = b"id,value\n" + b"".join(b"%d,%d\n" % (i, i % 7) for i in range(1000))
+    source, compressed = tmp_path / "data.csv", tmp_path / "data.csv.gz"
+    source.write_bytes(data)
+    GzipCodec().compress_file(str(source), str(compressed))
+
+    service = MinioService()
+    service._bucket_ready = True
+    service.client = FakeMinio(compressed.read_bytes(), {CODEC_METADATA: "gzip"})
+
+    target = tmp_path / "out" / "data.csv"
+    service.get_object(str(target), "wf/task/data.csv")
+
+    assert target.read_bytes() == data
+    assert [p.name for p in target.parent.iterdir()] == ["data.csv"]
@@ -0,0 +1,65 @@
+import pstats
+from types import SimpleNamespace
+
+import dramatiq
+import pytest
+from fastapi.testclient import TestClient
+
+from dramax.api.app import app
+from dramax.common import profiling
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
+from dramax.services.memory import InMemoryClient
+from dramax.services.mongo import MongoService
+from dramax.services.storage import FilesystemStore, set_storage
+from dramax.worker.profiling import ProfileTasks
+from dramax.worker.writes import StatusWriter
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(MongoService, "_client", InMemoryClient())
+    monkeypatch.setattr(StatusWriter, "_instance", StatusWriter(flush_interval=0))
+    store = FilesystemStore(str(tmp_path / "store"))
+    set_storage(store)
+    yield store
+    set_storage(None)
+
+
+def test_task_profile_is_stored_with_summary(store, tmp_path):
+    task = {
+        "id": "t",
+        "name": "t",
+        "url": "http://localhost",
+        "options": {"profile": True},
+        "metadata": {"author": "alice"},
+    }
+    WorkflowManager().create_or_update_from_id("wf", status="pending")
+    TaskManager().create("t", parent="wf", **task)
+    message = dramatiq.Message(
+        queue_name="api", actor_name="worker", args=(task, "wf"), kwargs={}, options={}
+    )
+    middleware = ProfileTasks()
+    middleware.before_worker_boot(None, SimpleNamespace(worker_threads=4))
+
+    middleware.before_process_message(None, message)
+    with profiling.stage("run"):
+        sum(i * i for i in range(10000))
+    middleware.after_process_message(None, message, result=None)
+
+    summary = TaskManager().find_one(id="t", parent="wf").profile
+    assert summary.stages["run"] > 0
+    assert summary.top
+    assert summary.object_name.endswith("-profile.prof")
+    assert summary.threads == 4
+    path = tmp_path / "profile.prof"
+    store.get_object(object_name=summary.object_name, file_path=str(path))
+    assert pstats.Stats(str(path)).total_calls > 0
+
+
+def test_api_requests_are_profiled(store, monkeypatch):
+    monkeypatch.setattr(settings, "profile_api_requests", True)
+
+    assert TestClient(app).get("/healthz").status_code == 200
+
+    assert len(store.list_objects("profiles/api/")) == 1
@@ -0,0 +1,31 @@
+from dramatiq.rate_limits.backends import StubBackend
+
+from dramax.common.settings import RateLimit
+from dramax.models.dramatiq.task import Task
+from dramax.worker.ratelimits import RateLimits
+
+
+def make_task(task_id: str, url: str, labels: list[str] = ()) -> Task:
+    return Task(id=task_id, name=task_id, url=url, options={"labels": list(labels)})
+
+
+def test_in_flight_and_window_limits_per_host_and_label():
+    limits = RateLimits(
+        StubBackend(),
+        {
+            "api.example.org": RateLimit(max_in_flight=2),
+            "label:geocoder": RateLimit(requests=3, window=60),
+        },
+    )
+    first = limits.acquire(make_task("a", "https://api.example.org/a"))
+    second = limits.acquire(make_task("b", "https://api.example.org:8443/b"))
+    assert first is not None
+    assert second is not None
+    assert limits.acquire(make_task("c", "https://api.example.org/c")) is None
+    assert limits.acquire(make_task("d", "https://other.org/d")) is not None
+
+    first.close()
+    assert limits.acquire(make_task("c", "https://api.example.org/c")) is not None
+
+    geocoding = [make_task(f"g{i}", "https://geo.org", ["geocoder"]) for i in range(4)]
+    assert [limits.acquire(t) is not None for t in geocoding] == [True] * 3 + [False]
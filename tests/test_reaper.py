@@ -0,0 +1,148 @@
+import time
+from datetime import datetime, timedelta
+
+import dramatiq
+import pytest
+from dramatiq.middleware import CurrentMessage
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
+from dramax.models.dramatiq.task import Status
+from dramax.services.memory import InMemoryClient, InMemoryCollection
+from dramax.services.mongo import MongoService
+from dramax.worker import worker as worker_module
+from dramax.worker.heartbeat import WORKER_ID, Heartbeat
+from dramax.worker.reaper import Reaper
+from dramax.worker.scheduler import worker
+from dramax.worker.writes import StatusWriter
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    monkeypatch.setattr(MongoService, "_client", InMemoryClient())
+    monkeypatch.setattr(StatusWriter, "_instance", StatusWriter(flush_interval=0))
+    WorkflowManager().create_or_update_from_id("wf", status=Status.STATUS_RUNNING)
+    messages = []
+    monkeypatch.setattr(worker.broker, "enqueue", messages.append)
+    return messages
+
+
+def running(task_id: str, age: float, beat: bool = True, **fields) -> None:
+    """A running task last updated, and heartbeating if `beat`, `age` seconds ago."""
+    now = datetime.now(tz=settings.timezone)
+    fields["heartbeat_at"] = now - timedelta(seconds=age) if beat else None
+    TaskManager().create(
+        task_id,
+        parent="wf",
+        name=task_id,
+        image="busybox",
+        status=Status.STATUS_RUNNING,
+        updated_at=now - timedelta(seconds=age),
+        **fields,
+    )
+
+
+def get(task_id: str):
+    return TaskManager().find_one(id=task_id, parent="wf")
+
+
+def test_heartbeat_is_written_while_running(sent):
+    running("t", 0, beat=False)
+    with Heartbeat("t", "wf", interval=0.01):
+        first = get("t").heartbeat_at
+        time.sleep(0.05)
+        assert get("t").heartbeat_at > first
+    assert get("t").worker_id == WORKER_ID
+
+    time.sleep(0.02)  # A beat may still be landing as the thread is joined.
+    last = get("t").heartbeat_at
+    time.sleep(0.03)
+    assert get("t").heartbeat_at == last  # Stopped with the task.
+
+
+def test_reaper_fails_expired_tasks(sent):
+    running("expired", 600)
+    running("alive", 1)
+    running("never-beat", 600, beat=False)
+    TaskManager().create(
+        "waiting", parent="wf", name="waiting", status=Status.STATUS_PENDING
+    )
+
+    assert Reaper(timeout=60, policy="fail").reap() == 2
+    assert get("expired").status == Status.STATUS_FAILED
+    assert "stopped sending heartbeats" in get("expired").result.message
+    assert get("never-beat").status == Status.STATUS_FAILED
+    assert get("alive").status == Status.STATUS_RUNNING
+    assert get("waiting").status == Status.STATUS_PENDING
+    assert WorkflowManager().find_one(id="wf").status == Status.STATUS_FAILED
+
+
+def test_reaper_requeues_without_dispatching_twice(sent):
+    running("expired", 600)
+    running("exhausted", 600, requeues=2)
+
+    assert Reaper(timeout=60, policy="requeue", max_requeues=2).reap() == 2
+    # The broker redelivers the message of the dead worker, so nothing is sent.
+    assert sent == []
+    assert (get("expired").status, get("expired").requeues) == (
+        Status.STATUS_PENDING,
+        1,
+    )
+    assert get("exhausted").status == Status.STATUS_FAILED
+
+
+def deliver(task_id: str) -> None:
+    """Run the actor on a message for `task_id`, as a redelivery would."""
+    payload = {"id": task_id, "spec_version": 0}
+    message = dramatiq.Message(
+        queue_name="docker",
+        actor_name="worker",
+        args=(payload, "wf"),
+        kwargs={},
+        options={},
+    )
+    CurrentMessage._MESSAGE.set(message)
+    worker(payload, "wf")
+
+
+def test_redelivered_messages_of_finished_tasks_are_dropped(sent, monkeypatch):
+    running("expired", 600, metadata={"author": "alice"})
+    running("exhausted", 0, requeues=3, metadata={"author": "alice"})
+    assert Reaper(timeout=60, policy="fail").reap() == 1
+
+    def execute_task(*args, **kwargs):
+        raise AssertionError("finished tasks must not run again")
+
+    monkeypatch.setattr(worker_module, "execute_task", execute_task)
+    monkeypatch.setattr(settings, "reaper_max_requeues", 2)
+    deliver("expired")
+    deliver("exhausted")
+
+    assert get("expired").status == Status.STATUS_FAILED
+    assert get("exhausted").status == Status.STATUS_RUNNING
+
+
+def test_update_if_unchanged_skips_tasks_that_beat_meanwhile(sent):
+    running("t", 600)
+    task = get("t")
+    TaskManager().create_or_update_from_id(
+        "t", "wf", heartbeat_at=datetime.now(tz=settings.timezone)
+    )
+
+    assert not TaskManager().update_if_unchanged(task, status=Status.STATUS_FAILED)
+    assert get("t").status == Status.STATUS_RUNNING
+    assert TaskManager().update_if_unchanged(get("t"), status=Status.STATUS_FAILED)
+
+
+def test_memory_or_and_null_matching():
+    collection = InMemoryCollection("task")
+    for document in ({"id": "a", "x": 1}, {"id": "b", "x": None}, {"id": "c"}):
+        collection.insert_one(document)
+
+    def ids(query: dict) -> list[str]:
+        return sorted(d["id"] for d in collection.find(query))
+
+    assert ids({"x": None}) == ["b", "c"]
+    assert ids({"x": {"$exists": False}}) == ["c"]
+    assert ids({"$or": [{"x": 1}, {"x": {"$exists": False}}]}) == ["a", "c"]
+    assert ids({"$or": [{"x": {"$lt": 5}}, {"id": "b"}]}) == ["a", "b"]
@@ -0,0 +1,80 @@
+import dramatiq
+
+from dramax.common.settings import settings
+from dramax.models.dramatiq.task import Options
+from dramax.worker.resources import ResourceBudget
+from dramax.worker.utils import defer_message
+
+GB = 1024**3
+
+
+def test_budget_admits_tasks_that_fit():
+    budget = ResourceBudget(cpus=4, memory=8 * GB)
+    task = Options(cpus=2, memory="3g")
+
+    assert budget.try_acquire(task)
+    assert budget.try_acquire(task)
+    assert not budget.try_acquire(task)  # 6g of 8g are used.
+    assert (budget.used_cpus, budget.used_memory, budget.running) == (4, 6 * GB, 2)
+    assert budget.try_acquire(Options())  # No requirements declared.
+
+    budget.release(task)
+    assert budget.try_acquire(task)
+    budget.release(task)
+    budget.release(task)
+    budget.release(Options())
+    assert (budget.used_cpus, budget.used_memory, budget.running) == (0, 0, 0)
+
+
+def test_oversized_task_runs_alone():
+    budget = ResourceBudget(cpus=4, memory=8 * GB)
+    small, oversized = Options(cpus=1), Options(cpus=16)
+
+    assert budget.try_acquire(small)
+    assert not budget.try_acquire(oversized)
+    budget.release(small)
+    assert budget.try_acquire(oversized)  # Nothing else holds resources.
+    assert not budget.try_acquire(small)
+    budget.release(oversized)
+    assert budget.try_acquire(small)
+
+
+def test_default_budget_is_a_share_of_the_host(monkeypatch):
+    monkeypatch.setattr(ResourceBudget, "_instance", None)
+    monkeypatch.setattr(settings, "worker_processes", 4)
+    monkeypatch.setattr("os.cpu_count", lambda: 16)
+    monkeypatch.setattr("dramax.worker.resources.host_memory", lambda: 64 * GB)
+
+    budget = ResourceBudget.get_instance()
+
+    assert (budget.cpus, budget.memory) == (4, 16 * GB)
+    monkeypatch.setattr(ResourceBudget, "_instance", None)
+    monkeypatch.setattr(settings, "worker_memory", "20g")
+    assert ResourceBudget.get_instance().memory == 20 * GB
+
+
+class Broker:
+    def __init__(self) -> None:
+        self.sent = []
+
+    def enqueue(self, message: dramatiq.Message, delay: int) -> None:
+        self.sent.append((message, delay))
+
+
+def test_deferral_backoff_grows_up_to_the_maximum(monkeypatch):
+    monkeypatch.setattr(settings, "admission_backoff", 1000)
+    monkeypatch.setattr(settings, "admission_max_backoff", 5000)
+    monkeypatch.setattr("random.uniform", lambda low, high: high)
+    broker = Broker()
+    message = dramatiq.Message(
+        queue_name="docker", actor_name="worker", args=(), kwargs={}, options={}
+    )
+
+    delays = []
+    for _ in range(5):
+        delays.append(defer_message(message, broker, reason="budget"))
+        message = broker.sent[-1][0]
+
+    assert delays == [1000, 2000, 4000, 5000, 5000]
+    assert [delay for _, delay in broker.sent] == delays
+    assert message.options["deferrals"] == 5
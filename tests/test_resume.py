@@ -0,0 +1,91 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from dramax.api.app import app
+from dramax.common.exceptions import WorkflowNotResumableError
+from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
+from dramax.models.dramatiq.task import File, Status, Task
+from dramax.services.memory import InMemoryClient
+from dramax.services.mongo import MongoService
+from dramax.worker.scheduler import Scheduler, worker
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    monkeypatch.setattr(MongoService, "_client", InMemoryClient())
+    messages = []
+    monkeypatch.setattr(worker.broker, "enqueue", messages.append)
+    return messages
+
+
+def store(task_id: str, status: Status, depends_on: list[str] = (), **fields) -> None:
+    task = Task(
+        id=task_id,
+        name=task_id,
+        image="busybox",
+        inputs=[File(path="/in", source=d, sourcePath="/out") for d in depends_on],
+        depends_on=list(depends_on),
+        **fields,
+    )
+    TaskManager().create(
+        task_id, parent="wf", status=status, **task.dict(exclude={"id"})
+    )
+
+
+def test_resume_reruns_failed_tasks_and_descendants(sent):
+    WorkflowManager().create_or_update_from_id("wf", status="failure")
+    store("extract", Status.STATUS_DONE)
+    store("clean", Status.STATUS_FAILED, ["extract"])
+    store("report", Status.STATUS_FAILED, ["clean", "extract"])
+    store("stats", Status.STATUS_DONE, ["extract"])
+    store("clean-shard-00000", Status.STATUS_FAILED, metadata={"shard_of": "clean"})
+
+    assert Scheduler().resume("wf") == ["clean", "report"]
+
+    assert [m.args[0]["id"] for m in sent] == ["clean", "report"]
+    statuses = {t.id: t.status for t in TaskManager().find(parent="wf")}
+    assert statuses == {
+        "extract": "success",
+        "clean": "pending",
+        "report": "pending",
+        "stats": "success",
+    }
+    workflow = WorkflowManager().find_one(id="wf")
+    assert (workflow.status, workflow.resumes) == ("pending", 1)
+
+
+def test_resume_refuses_running_or_successful_workflows(sent):
+    WorkflowManager().create_or_update_from_id("wf", status="running")
+    store("extract", Status.STATUS_DONE)
+    store("clean", Status.STATUS_RUNNING, ["extract"])
+    with pytest.raises(WorkflowNotResumableError, match="still running"):
+        Scheduler().resume("wf")
+
+    TaskManager().create_or_update_from_id("clean", "wf", status=Status.STATUS_DONE)
+    with pytest.raises(WorkflowNotResumableError, match="no task failed"):
+        Scheduler().resume("wf")
+    assert sent == []
+
+
+def test_workflow_is_resumed_once(sent, monkeypatch):
+    WorkflowManager().create_or_update_from_id("wf", status="failure")
+    store("extract", Status.STATUS_DONE)
+    store("clean", Status.STATUS_FAILED, ["extract"])
+    # Another resume of the same workflow gets in just before the request claims it.
+    claim_resume, resumed = WorkflowManager.claim_resume, []
+
+    def racing_claim_resume(self, workflow_id, **fields):
+        if not resumed:
+            resumed.append(None)
+            resumed.append(Scheduler().resume(workflow_id))
+        return claim_resume(self, workflow_id, **fields)
+
+    monkeypatch.setattr(WorkflowManager, "claim_resume", racing_claim_resume)
+
+    response = TestClient(app).post("/api/v2/workflow/resume", params={"id": "wf"})
+
+    assert response.status_code == 409
+    assert "being resumed already" in response.json()["detail"]
+    assert resumed[-1] == ["clean"]
+    assert [m.args[0]["id"] for m in sent] == ["clean"]
+    assert WorkflowManager().find_one(id="wf").resumes == 1
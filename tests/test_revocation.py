@@ -0,0 +1,122 @@
+import time
+from datetime import datetime, timedelta
+
+import dramatiq
+import pytest
+from dramatiq.middleware import CurrentMessage
+from fastapi.testclient import TestClient
+
+from dramax.api.app import app
+from dramax.common.settings import settings
+from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
+from dramax.models.dramatiq.task import Status
+from dramax.services.memory import InMemoryClient
+from dramax.services.mongo import MongoService
+from dramax.worker import worker as worker_module
+from dramax.worker.revocation import RevocationCache, RevocationWatcher
+from dramax.worker.scheduler import worker
+from dramax.worker.writes import StatusWriter
+
+
+@pytest.fixture(autouse=True)
+def db(monkeypatch):
+    monkeypatch.setattr(MongoService, "_client", InMemoryClient())
+    monkeypatch.setattr(StatusWriter, "_instance", StatusWriter(flush_interval=0))
+    WorkflowManager().create_or_update_from_id("wf", status="running")
+    WorkflowManager().create_or_update_from_id("other", status="running")
+    for task_id, status in [
+        ("a", Status.STATUS_DONE),
+        ("b", Status.STATUS_RUNNING),
+        ("c", Status.STATUS_PENDING),
+    ]:
+        TaskManager().create(task_id, parent="wf", name=task_id, status=status)
+
+
+def revoke(workflow_id: str, age: float = 0) -> None:
+    revoked_at = datetime.now(tz=settings.timezone) - timedelta(seconds=age)
+    WorkflowManager().create_or_update_from_id(
+        workflow_id, is_revoked=True, revoked_at=revoked_at
+    )
+
+
+def wait_for(condition, timeout: float = 1) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_cache_ignores_revocations_older_than_the_window(monkeypatch):
+    monkeypatch.setattr(settings, "revocation_window", 3600)
+    revoke("wf")
+    revoke("other", age=7200)
+
+    assert RevocationCache(refresh_interval=0).revoked() == {"wf"}
+
+
+def test_cache_refreshes_after_its_interval():
+    cache = RevocationCache(refresh_interval=0.05)
+    assert not cache.is_revoked("wf")
+
+    revoke("wf")
+    assert not cache.is_revoked("wf")  # Not refreshed yet.
+    time.sleep(0.06)
+    assert cache.is_revoked("wf")
+
+
+def test_watcher_cancels_tasks_of_revoked_workflows():
+    watcher = RevocationWatcher(RevocationCache(refresh_interval=0.01))
+    with watcher.track("b", "wf") as token, watcher.track("x", "other") as other:
+        assert not token.cancelled
+        revoke("wf")
+        assert wait_for(lambda: token.cancelled)
+        assert not other.cancelled
+
+
+def test_revoke_pending_leaves_started_tasks():
+    TaskManager().revoke_pending("wf")
+
+    statuses = {t.id: t.status for t in TaskManager().find(parent="wf")}
+    assert statuses == {"a": "success", "b": "running", "c": "revoked"}
+
+
+def test_revoke_route():
+    client = TestClient(app)
+
+    response = client.post("/api/v2/workflow/revoke", params={"id": "wf"})
+
+    assert response.status_code == 200
+    assert (response.json()["status"], response.json()["is_revoked"]) == (
+        "revoked",
+        True,
+    )
+    assert TaskManager().find_one(id="c", parent="wf").status == "revoked"
+    assert client.post("/api/v2/workflow/revoke", params={"id": "x"}).status_code == 404
+
+
+def test_worker_drops_messages_of_revoked_workflows(monkeypatch):
+    monkeypatch.setattr(
+        RevocationCache, "_instance", RevocationCache(refresh_interval=0)
+    )
+
+    def execute_task(*args, **kwargs):
+        raise AssertionError("revoked tasks must not run")
+
+    monkeypatch.setattr(worker_module, "execute_task", execute_task)
+    revoke("wf")
+    payload = {"id": "c", "name": "c", "image": "busybox", "metadata": {}}
+    CurrentMessage._MESSAGE.set(
+        dramatiq.Message(
+            queue_name="docker",
+            actor_name="worker",
+            args=(payload, "wf"),
+            kwargs={},
+            options={},
+        )
+    )
+
+    worker(payload, "wf")
+
+    assert TaskManager().find_one(id="c", parent="wf").status == "revoked"
@@ -0,0 +1,49 @@
+import pytest
+
+from dramax.models.dramatiq.task import Task
+from dramax.worker.pools import WorkerPool
+from dramax.worker.routing import route
+
+
+def make_task(**fields) -> Task:
+    return Task(id="t1", name="t1", **fields)
+
+
+def test_route_by_queue_name_label_and_executor(monkeypatch):
+    monkeypatch.setattr("dramax.common.settings.settings.label_queues", {"gpu": "gpu"})
+
+    assert route(make_task(image="busybox")) == "docker"
+    assert route(make_task(url="http://example.org")) == "api"
+    assert route(make_task()) == "default"
+    assert route(make_task(image="busybox", options={"labels": ["gpu"]})) == "gpu"
+    assert route(make_task(url="http://x", options={"labels": ["other"]})) == "api"
+    assert (
+        route(
+            make_task(image="busybox", options={"queue_name": "x", "labels": ["gpu"]})
+        )
+        == "x"
+    )
+
+
+def test_dispatch_enqueues_on_routed_queue(monkeypatch):
+    from dramax.services.memory import InMemoryDatabase
+    from dramax.worker.scheduler import Scheduler, worker
+
+    sent = []
+    monkeypatch.setattr(worker.broker, "enqueue", sent.append)
+
+    Scheduler(InMemoryDatabase()).dispatch(make_task(url="http://x"), "w1")
+
+    assert [message.queue_name for message in sent] == ["api"]
+    assert sent[0].options["options"]["task_id"] == "t1"
+
+
+def test_worker_pool_spec():
+    pool = WorkerPool.parse("api,default:2:200:gevent")
+    assert (pool.queues, pool.processes, pool.threads) == (["api", "default"], 2, 200)
+    assert pool.command()[-5:] == ["--threads", "200", "--queues", "api", "default"]
+    assert WorkerPool.parse("docker:1:1").io_mode == "threads"
+
+    for spec in ("docker:1", ":1:1", "docker:1:1:asyncio"):
+        with pytest.raises(ValueError):
+            WorkerPool.parse(spec)
@@ -0,0 +1,70 @@
+import errno
+import os
+
+import pytest
+
+from dramax.services.storage import FilesystemStore, unshare_files
+
+
+@pytest.fixture
+def output(tmp_path):
+    path = tmp_path / "work" / "out.csv"
+    path.parent.mkdir()
+    path.write_text("a,b\n")
+    return path
+
+
+def test_hardlink_store_shares_read_only_inode(tmp_path, output):
+    store = FilesystemStore(str(tmp_path / "store"), link_mode="hardlink")
+    store.upload_object(str(output), "/wf/task/out.csv")
+    store.get_object(str(tmp_path / "next" / "in.csv"), "wf/task/out.csv")
+
+    stored = tmp_path / "store" / "wf" / "task" / "out.csv"
+    materialised = tmp_path / "next" / "in.csv"
+    assert stored.stat().st_ino == output.stat().st_ino == materialised.stat().st_ino
+    assert not stored.stat().st_mode & 0o222
+    assert store.list_objects("wf/") == ["wf/task/out.csv"]
+
+
+def test_hardlink_falling_back_to_copy_keeps_the_source_writable(
+    tmp_path, output, monkeypatch
+):
+    def cross_device(*_):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", cross_device)
+    store = FilesystemStore(str(tmp_path / "store"), link_mode="hardlink")
+    store.upload_object(str(output), "wf/task/out.csv")
+
+    assert output.stat().st_mode & 0o200
+    assert (tmp_path / "store" / "wf" / "task" / "out.csv").read_text() == "a,b\n"
+    assert [p.name for p in output.parent.iterdir()] == ["out.csv"]
+
+
+def test_unshare_files_copies_hard_links_only(tmp_path, output):
+    store = FilesystemStore(str(tmp_path / "store"), link_mode="hardlink")
+    store.upload_object(str(output), "wf/task/out.csv")
+    inputs = tmp_path / "inputs"
+    store.get_object(str(inputs / "linked.csv"), "wf/task/out.csv")
+    (inputs / "own.csv").write_text("x\n")
+
+    assert unshare_files(inputs) == 1
+    linked = inputs / "linked.csv"
+    assert linked.stat().st_ino != output.stat().st_ino
+    assert linked.read_text() == "a,b\n"
+    linked.write_text("changed\n")  # Private and writable.
+    assert output.read_text() == "a,b\n"
+    assert unshare_files(inputs) == 0
+
+
+def test_copy_store_and_missing_objects(tmp_path, output):
+    store = FilesystemStore(str(tmp_path / "store"), link_mode="copy")
+    store.upload_object(str(output), "wf/task/out.csv")
+    output.write_text("changed\n")
+
+    store.get_object(str(tmp_path / "in.csv"), "wf/task/out.csv")
+    assert (tmp_path / "in.csv").read_text() == "a,b\n"
+    with pytest.raises(FileNotFoundError):
+        store.get_object(str(tmp_path / "x"), "wf/task/missing.csv")
+    with pytest.raises(ValueError):
+        FilesystemStore(str(tmp_path), link_mode="symlink")
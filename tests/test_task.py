@@ -31,3 +31,13 @@ def test_task_inputs_with_slash():
         )
     except ValidationError:
         pytest.fail("ValidationError was not expected")
+
+
+def test_task_memory_option_is_parsed_to_bytes():
+    task = Task(id="test", name="test", image="busybox", options={"memory": "512m"})
+    assert task.options.memory == 512 * 1024**2
+
+
+def test_task_invalid_memory_option():
+    with pytest.raises(ValidationError):
+        Task(id="test", name="test", image="busybox", options={"memory": "lots"})
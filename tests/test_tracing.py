@@ -0,0 +1,73 @@
+import dramatiq
+import pytest
+from fastapi.testclient import TestClient
+
+from dramax.api.app import app
+from dramax.common.tracing import (
+    InMemoryExporter,
+    Tracer,
+    extract,
+    inject,
+    traced,
+)
+from dramax.worker.tracing import TraceMessages
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+TRACEPARENT = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = InMemoryExporter()
+    monkeypatch.setattr(Tracer, "_instance", Tracer(exporter))
+    return exporter
+
+
+def test_traceparent_round_trip():
+    context = extract(TRACEPARENT)
+    assert context.trace_id == TRACE_ID
+    assert context.sampled
+    assert context.traceparent == TRACEPARENT
+    assert extract("00-nope-01") is None
+    assert inject() is None
+
+
+def test_api_request_continues_incoming_trace(exporter):
+    response = TestClient(app).get("/healthz", headers={"traceparent": TRACEPARENT})
+
+    assert response.status_code == 200
+    (span,) = exporter.spans(TRACE_ID)
+    assert span["name"] == "GET /healthz"
+    assert span["parent_id"] == "00f067aa0ba902b7"
+    assert span["attributes"]["http.status_code"] == 200
+
+
+def test_message_carries_trace_to_worker(exporter):
+    middleware = TraceMessages()
+    message = dramatiq.Message(
+        queue_name="api",
+        actor_name="worker",
+        args=(),
+        kwargs={},
+        options={"options": {"task_id": "t", "workflow_id": "wf"}},
+    )
+
+    with Tracer.get_instance().span("scheduler.dispatch") as dispatch:
+        middleware.before_enqueue(None, message, 0)
+    middleware.before_process_message(None, message)
+
+    @traced("docker.run", image="task.image")
+    def run(task):
+        return task
+
+    run(type("Task", (), {"image": "alpine"}))
+    middleware.after_process_message(None, message, exception=ValueError("boom"))
+
+    spans = {span["name"]: span for span in exporter.spans()}
+    consumer = spans["worker process"]
+    assert consumer["trace_id"] == dispatch.context.trace_id
+    assert consumer["parent_id"] == dispatch.context.span_id
+    assert consumer["status"] == "error"
+    assert consumer["attributes"]["task_id"] == "t"
+    assert spans["docker.run"]["parent_id"] == consumer["span_id"]
+    assert spans["docker.run"]["attributes"] == {"image": "alpine"}
@@ -0,0 +1,58 @@
+from dramax.models.dramatiq.manager import TaskManager, WorkflowManager
+from dramax.services.memory import InMemoryDatabase
+from dramax.worker.writes import StatusWriter
+
+
+def make_db(monkeypatch, batches):
+    db = InMemoryDatabase()
+    WorkflowManager(db).create_or_update_from_id("wf", status="pending")
+    for task_id in ("a", "b", "c"):
+        TaskManager(db).create(task_id, parent="wf", name=task_id, status="pending")
+    bulk_write = db.task.bulk_write
+    monkeypatch.setattr(
+        db.task,
+        "bulk_write",
+        lambda requests, **kw: batches.append(len(requests)) or bulk_write(requests),
+    )
+    return db
+
+
+def test_status_writes_are_coalesced_in_batches(monkeypatch):
+    batches = []
+    db = make_db(monkeypatch, batches)
+    writer = StatusWriter(db, batch_size=3, flush_interval=3600)
+
+    for task_id in ("a", "b"):
+        writer.update_task(task_id, "wf", status="running")
+        writer.update_task(task_id, "wf", worker_id=f"worker-{task_id}")
+    assert {t.status for t in TaskManager(db).find(parent="wf")} == {"pending"}
+
+    writer.update_task("c", "wf", status="running")  # Third task: batch is full.
+    assert batches == [3]
+    tasks = {t.id: (t.status, t.worker_id) for t in TaskManager(db).find(parent="wf")}
+    assert tasks == {
+        "a": ("running", "worker-a"),
+        "b": ("running", "worker-b"),
+        "c": ("running", None),
+    }
+    assert WorkflowManager(db).find_one(id="wf").status == "running"
+
+
+def test_terminal_status_writes_are_not_buffered(monkeypatch):
+    batches = []
+    db = make_db(monkeypatch, batches)
+    writer = StatusWriter(db, batch_size=10, flush_interval=3600)
+
+    writer.update_task("a", "wf", status="running", worker_id="worker-a")
+    writer.update_task("a", "wf", status="success", result={"log": "a"})
+
+    # Written at once, with the pending update of the task, before any batch.
+    task = TaskManager(db).find_one(id="a", parent="wf")
+    assert (task.status, task.worker_id, task.result.log) == (
+        "success",
+        "worker-a",
+        "a",
+    )
+    assert batches == []
+    writer.close()
+    assert batches == []